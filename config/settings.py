@@ -46,12 +46,14 @@ INSTALLED_APPS = [
     'rest_framework',
     'rest_framework_simplejwt',
     'drf_spectacular',
-    'storages',
+    'core',
     'users',
     'images',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.RequestInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -149,6 +151,10 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
 
 # JWT Configuration
@@ -166,6 +172,74 @@ SIMPLE_JWT = {
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Object key layout for new uploads: 'user' (images/{user_id}/...) or
+# 'hashed' (images/{hash}/{user_id}/...). Existing objects are moved
+# with `python manage.py migrate_image_keys`.
+IMAGE_KEY_STRATEGY = os.getenv('IMAGE_KEY_STRATEGY', 'user')
+IMAGE_KEY_HASH_PREFIX_LENGTH = 4
+
+# Strip metadata from and losslessly optimize JPEG/PNG originals on upload.
+# IMAGE_KEEP_METADATA lists EXIF tag names to keep; 'icc_profile' keeps
+# the colour profile. Existing originals: `python manage.py optimize_images`.
+IMAGE_OPTIMIZE_ORIGINALS = os.getenv('IMAGE_OPTIMIZE_ORIGINALS', 'False') == 'True'
+IMAGE_KEEP_METADATA = [
+    name.strip()
+    for name in os.getenv(
+        'IMAGE_KEEP_METADATA', 'icc_profile,Copyright,Artist'
+    ).split(',')
+    if name.strip()
+]
+# Larger images are stored as uploaded, bounding memory per optimization.
+IMAGE_OPTIMIZE_MAX_PIXELS = 50_000_000
+IMAGE_OPTIMIZE_CONCURRENCY = int(os.getenv('IMAGE_OPTIMIZE_CONCURRENCY', '2'))
+
+# Per-user upload quotas (unset means unlimited)
+IMAGE_QUOTA_MAX_COUNT = (
+    int(os.getenv('IMAGE_QUOTA_MAX_COUNT'))
+    if os.getenv('IMAGE_QUOTA_MAX_COUNT') else None
+)
+IMAGE_QUOTA_MAX_BYTES = (
+    int(os.getenv('IMAGE_QUOTA_MAX_BYTES'))
+    if os.getenv('IMAGE_QUOTA_MAX_BYTES') else None
+)
+
+# A running account purge that has recorded no progress for this many
+# seconds is taken over by the next `purge_accounts` run; keep it well
+# above the time one chunk takes
+ACCOUNT_PURGE_STALE_SECONDS = int(
+    os.getenv('ACCOUNT_PURGE_STALE_SECONDS', '900')
+)
+
+# Bounding box for the thumbnail rendition stored alongside each upload
+IMAGE_THUMBNAIL_SIZE = (200, 200)
+
+# Above this many rows the admin changelist shows PostgreSQL's estimated
+# row count instead of running an exact COUNT(*) over the images table
+IMAGE_ADMIN_ESTIMATED_COUNT_THRESHOLD = int(
+    os.getenv('IMAGE_ADMIN_ESTIMATED_COUNT_THRESHOLD', '100000')
+)
+
+# Rows fetched per round trip by the server-side cursor of exports
+IMAGE_EXPORT_CHUNK_SIZE = 2000
+
+# Most recent hashed images grouped by one whole-library duplicates
+# request; grouping time grows with the library size
+IMAGE_DUPLICATE_GROUPS_MAX_IMAGES = int(
+    os.getenv('IMAGE_DUPLICATE_GROUPS_MAX_IMAGES', '20000')
+)
+
+# Days deletion tombstones are kept for incremental exports; exports with
+# an older `since` are answered with a full export instead. Older
+# tombstones are removed by `prune_tombstones`.
+IMAGE_TOMBSTONE_RETENTION_DAYS = int(
+    os.getenv('IMAGE_TOMBSTONE_RETENTION_DAYS', '30')
+)
+
+# ZIP downloads: images per archive, and objects read ahead of the one
+# being streamed (each up to the 10MB upload limit)
+IMAGE_ARCHIVE_MAX_IMAGES = 10000
+IMAGE_ARCHIVE_PREFETCH = int(os.getenv('IMAGE_ARCHIVE_PREFETCH', '4'))
+
 # AWS S3 Configuration
 USE_S3 = os.getenv('USE_S3', 'False') == 'True'
 
@@ -189,11 +263,67 @@ if USE_S3:
     AWS_S3_FILE_OVERWRITE = False
     AWS_QUERYSTRING_AUTH = False
 
-    # Use S3 for media files
-    DEFAULT_FILE_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
+    # Use S3 for media files. boto3 is only imported when USE_S3 is set,
+    # on the first storage access.
+    INSTALLED_APPS.append('storages')
     MEDIA_URL = f'https://{AWS_S3_CUSTOM_DOMAIN}/media/'
 
 
+# Request instrumentation (Server-Timing headers, timing log lines and
+# slow-request profiles). Disabled by default; no overhead when off.
+INSTRUMENTATION_ENABLED = os.getenv('INSTRUMENTATION_ENABLED', 'False') == 'True'
+INSTRUMENTATION_SAMPLE_RATE = float(os.getenv('INSTRUMENTATION_SAMPLE_RATE', '1.0'))
+INSTRUMENTATION_SERVER_TIMING = os.getenv('INSTRUMENTATION_SERVER_TIMING', 'True') == 'True'
+INSTRUMENTATION_SLOW_REQUEST_MS = (
+    float(os.getenv('INSTRUMENTATION_SLOW_REQUEST_MS'))
+    if os.getenv('INSTRUMENTATION_SLOW_REQUEST_MS') else None
+)
+INSTRUMENTATION_PROFILER = 'core.instrumentation.CProfileProfiler'
+INSTRUMENTATION_PROFILE_DIR = os.getenv(
+    'INSTRUMENTATION_PROFILE_DIR', str(BASE_DIR / 'profiles')
+)
+
+# Prometheus metrics at /metrics. Under gunicorn also set
+# PROMETHEUS_MULTIPROC_DIR to aggregate across worker processes.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'False') == 'True'
+METRICS_AUTH_TOKEN = os.getenv('METRICS_AUTH_TOKEN', '')
+
+if USE_S3:
+    DEFAULT_STORAGE_BACKEND = 'storages.backends.s3.S3Storage'
+    if INSTRUMENTATION_ENABLED or METRICS_ENABLED:
+        DEFAULT_STORAGE_BACKEND = 'core.s3.InstrumentedS3Storage'
+else:
+    DEFAULT_STORAGE_BACKEND = 'django.core.files.storage.FileSystemStorage'
+    if INSTRUMENTATION_ENABLED or METRICS_ENABLED:
+        DEFAULT_STORAGE_BACKEND = 'core.storage.InstrumentedFileSystemStorage'
+
+STORAGES = {
+    'default': {
+        'BACKEND': DEFAULT_STORAGE_BACKEND,
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'core.instrumentation': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+
 # DRF Spectacular (Swagger/OpenAPI) Configuration
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Django S3 Image Upload API',
@@ -209,4 +339,15 @@ SPECTACULAR_SETTINGS = {
     },
     'SECURITY': [{'bearerAuth': []}],
     'AUTHENTICATION_WHITELIST': [],
-}
\ No newline at end of file
+}
+
+# Route /api/schema/, /api/docs/ and /api/redoc/
+API_DOCS_ENABLED = os.getenv('API_DOCS_ENABLED', 'True') == 'True'
+
+# How /api/schema/ is served:
+#   dynamic - introspect views on every request (drf-spectacular default)
+#   lazy    - generate once per process and serve from memory
+#   file    - serve the schema committed at OPENAPI_SCHEMA_FILE
+OPENAPI_SCHEMA_MODE = os.getenv('OPENAPI_SCHEMA_MODE', 'dynamic')
+OPENAPI_SCHEMA_FILE = BASE_DIR / 'openapi-schema.yaml'
+OPENAPI_SCHEMA_MAX_AGE = int(os.getenv('OPENAPI_SCHEMA_MAX_AGE', '86400'))
\ No newline at end of file
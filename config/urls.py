@@ -18,22 +18,33 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
-from drf_spectacular.views import (
-    SpectacularAPIView,
-    SpectacularSwaggerView,
-    SpectacularRedocView
-)
+from core.utils import lazy_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/auth/', include('users.urls')),
     path('api/images/', include('images.urls')),
-    # Swagger/OpenAPI documentation
-    path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
-    path('api/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
-    path('api/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
 ]
 
+# Prometheus metrics
+if settings.METRICS_ENABLED:
+    urlpatterns += [
+        path('metrics', lazy_view('core.views.MetricsView'), name='metrics'),
+    ]
+
+# Swagger/OpenAPI documentation (imported on first request, not at boot)
+if settings.API_DOCS_ENABLED:
+    if settings.OPENAPI_SCHEMA_MODE == 'dynamic':
+        schema_view = lazy_view('drf_spectacular.views.SpectacularAPIView')
+    else:
+        schema_view = lazy_view('core.views.CachedSchemaView')
+
+    urlpatterns += [
+        path('api/schema/', schema_view, name='schema'),
+        path('api/docs/', lazy_view('drf_spectacular.views.SpectacularSwaggerView', url_name='schema'), name='swagger-ui'),
+        path('api/redoc/', lazy_view('drf_spectacular.views.SpectacularRedocView', url_name='schema'), name='redoc'),
+    ]
+
 # Serve media files in development
 if settings.DEBUG and not settings.USE_S3:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,378 @@
+"""
+Reproducible performance benchmarks for the image API.
+
+Scenarios are driven in-process through DRF's APIClient with real JWT
+authentication, so the numbers cover routing, auth, SQL, storage and
+serialization but not network or WSGI server overhead. See the
+`benchmark` management command for the command-line entry point.
+"""
+import json
+import math
+import random
+import statistics
+import time
+from collections import Counter
+from io import BytesIO
+from django.contrib.auth import get_user_model
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage, storages
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from storages.backends.s3 import S3Storage
+from images.models import Image
+
+User = get_user_model()
+
+SCENARIOS = ('upload', 'list', 'list_msgpack', 'detail', 'delete')
+
+# (width, height, format) of the generated originals; a mix of phone,
+# screenshot and web-sized images.
+IMAGE_PROFILES = (
+    (4032, 3024, 'JPEG'),
+    (1920, 1080, 'JPEG'),
+    (1280, 720, 'PNG'),
+    (1080, 1080, 'WEBP'),
+    (640, 480, 'JPEG'),
+    (320, 240, 'PNG'),
+)
+
+# A regression is flagged when a latency metric grows by more than the
+# tolerance, or when queries per request grow at all.
+LATENCY_METRICS = ('p50_ms', 'p95_ms')
+EXACT_METRICS = ('queries_per_request',)
+
+# Queries and storage bytes of the request being measured.
+COUNTERS = Counter()
+
+
+class CountingStorageMixin:
+    """
+    Count bytes written to and read from a storage backend.
+    """
+
+    def _save(self, name, content):
+        COUNTERS['storage_bytes_written'] += content.size
+        return super()._save(name, content)
+
+    def _open(self, name, mode='rb'):
+        return CountingFile(super()._open(name, mode))
+
+
+class CountingFile(File):
+    def __init__(self, file):
+        super().__init__(file, name=file.name)
+
+    def read(self, *args, **kwargs):
+        data = self.file.read(*args, **kwargs)
+        COUNTERS['storage_bytes_read'] += len(data)
+        return data
+
+
+class CountingFileSystemStorage(CountingStorageMixin, FileSystemStorage):
+    pass
+
+
+class CountingS3Storage(CountingStorageMixin, S3Storage):
+    pass
+
+
+def storage_settings(backend, location=None, s3_endpoint=None,
+                     s3_bucket='benchmark'):
+    """
+    Build a STORAGES setting for the local or S3-compatible backend.
+    """
+    if backend == 'local':
+        default = {
+            'BACKEND': 'core.benchmark.CountingFileSystemStorage',
+            'OPTIONS': {'location': location},
+        }
+    else:
+        default = {
+            'BACKEND': 'core.benchmark.CountingS3Storage',
+            'OPTIONS': {
+                'bucket_name': s3_bucket,
+                'endpoint_url': s3_endpoint,
+                'addressing_style': 'path',
+                'querystring_auth': False,
+                'file_overwrite': False,
+                'custom_domain': None,
+            },
+        }
+    return {
+        'default': default,
+        'staticfiles': {
+            'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+        },
+    }
+
+
+def generate_image(width, height, fmt, seed):
+    """
+    Generate a photo-like image: noise over gradients compresses roughly
+    like a real photograph, unlike a flat colour.
+    """
+    from PIL import Image as PILImage
+
+    rng = random.Random(seed)
+    size = (width, height)
+    image = PILImage.merge('RGB', (
+        PILImage.effect_noise(size, rng.randint(20, 60)),
+        PILImage.linear_gradient('L').resize(size),
+        PILImage.radial_gradient('L').resize(size),
+    ))
+    buffer = BytesIO()
+    options = {'quality': 85} if fmt in ('JPEG', 'WEBP') else {}
+    image.save(buffer, format=fmt, **options)
+    return buffer.getvalue()
+
+
+def generate_image_pool(seed=0):
+    """
+    Return a list of (filename, content, content_type) upload fixtures.
+    """
+    extensions = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+    return [
+        (
+            f'bench_{width}x{height}.{extensions[fmt]}',
+            generate_image(width, height, fmt, seed + index),
+            f'image/{fmt.lower()}',
+        )
+        for index, (width, height, fmt) in enumerate(IMAGE_PROFILES)
+    ]
+
+
+def upload_file(pool, index):
+    name, content, content_type = pool[index % len(pool)]
+    return SimpleUploadedFile(name, content, content_type=content_type)
+
+
+def seed_user(image_count, pool, batch_size=5000):
+    """
+    Create a user owning `image_count` images.
+
+    One real object per pool entry is stored; the remaining rows reuse
+    those keys through bulk_create, so large libraries can be seeded
+    without writing every object.
+    """
+    user = User.objects.create_user(
+        email=f'bench-{image_count}-{time.time_ns()}@example.com',
+        username=f'bench-{image_count}-{time.time_ns()}',
+        password='BenchmarkPassword123'
+    )
+    templates = [
+        Image.objects.create(
+            user=user,
+            image=upload_file(pool, index),
+            title=f'Seed {index}'
+        )
+        for index in range(min(image_count, len(pool)))
+    ]
+    remaining = image_count - len(templates)
+    for start in range(0, remaining, batch_size):
+        batch = []
+        for offset in range(start, min(start + batch_size, remaining)):
+            template = templates[offset % len(templates)]
+            batch.append(Image(
+                user=user,
+                image=template.image.name,
+                thumbnail=template.thumbnail.name,
+                title=f'Image {offset}',
+                description='Seeded for benchmarking',
+                content_type=template.content_type,
+                size=template.size,
+                width=template.width,
+                height=template.height,
+            ))
+        Image.objects.bulk_create(batch)
+    return user
+
+
+def measure(request, iterations):
+    """
+    Run `request(i)` and collect per-request latency, queries and bytes.
+    """
+    latencies = []
+    response_bytes = 0
+    COUNTERS.clear()
+
+    def count_query(execute, sql, params, many, context):
+        COUNTERS['queries'] += 1
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    with connection.execute_wrapper(count_query):
+        for i in range(iterations):
+            begin = time.perf_counter()
+            response = request(i)
+            latencies.append((time.perf_counter() - begin) * 1000)
+            assert response.status_code < 400, response.status_code
+            response_bytes += len(response.content)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'iterations': iterations,
+        'mean_ms': statistics.fmean(latencies),
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'max_ms': latencies[-1],
+        'throughput_rps': iterations / elapsed,
+        'queries_per_request': COUNTERS['queries'] / iterations,
+        'response_bytes_per_request': response_bytes / iterations,
+        'storage_bytes_read_per_request':
+            COUNTERS['storage_bytes_read'] / iterations,
+        'storage_bytes_written_per_request':
+            COUNTERS['storage_bytes_written'] / iterations,
+    }
+
+
+def percentile(sorted_values, pct):
+    index = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def run_scenarios(user, pool, iterations, list_iterations):
+    """
+    Benchmark every scenario against one seeded user.
+    """
+    client = APIClient()
+    token = RefreshToken.for_user(user).access_token
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    detail_ids = list(
+        Image.objects.filter(user=user).values_list('id', flat=True)[:iterations]
+    )
+    # Warm up URL resolution, serializer caches and the DB connection.
+    client.get(f'/api/images/{detail_ids[0]}/')
+
+    uploaded = []
+
+    def upload(i):
+        response = client.post(
+            '/api/images/upload/',
+            {'image': upload_file(pool, i), 'title': f'Upload {i}'},
+            format='multipart'
+        )
+        uploaded.append(response.data['id'])
+        return response
+
+    results = {
+        'upload': measure(upload, iterations),
+        'list': measure(
+            lambda i: client.get('/api/images/'), list_iterations
+        ),
+        'list_msgpack': measure(
+            lambda i: client.get(
+                '/api/images/', HTTP_ACCEPT='application/msgpack'
+            ),
+            list_iterations
+        ),
+        'detail': measure(
+            lambda i: client.get(
+                f'/api/images/{detail_ids[i % len(detail_ids)]}/'
+            ),
+            iterations
+        ),
+        # Delete the images created by the upload scenario so the seeded
+        # library keeps its size.
+        'delete': measure(
+            lambda i: client.delete(f'/api/images/{uploaded[i]}/delete/'),
+            iterations
+        ),
+    }
+    # The list scenarios return the whole library (plus the uploads made
+    # above), so their cost is also reported per row.
+    rows = Image.objects.filter(user=user).count() + len(uploaded)
+    for scenario in ('list', 'list_msgpack'):
+        results[scenario]['us_per_row'] = (
+            results[scenario]['mean_ms'] * 1000 / rows
+        )
+    return results
+
+
+def run_benchmarks(storages, sizes, iterations=20, list_iterations=None,
+                   seed=0):
+    """
+    Run all scenarios for each storage configuration and library size.
+
+    `storages` maps a label to a STORAGES setting (see storage_settings).
+    Returns a JSON-serializable results document.
+    """
+    pool = generate_image_pool(seed)
+    results = {}
+    for label, storages_setting in storages.items():
+        with override_settings(STORAGES=storages_setting):
+            prepare_storage()
+            for size in sizes:
+                user = seed_user(size, pool)
+                results[f'{label}/{size}'] = run_scenarios(
+                    user, pool, iterations,
+                    list_iterations or default_list_iterations(size, iterations)
+                )
+    return {
+        'meta': {
+            'database': connection.vendor,
+            'iterations': iterations,
+            'seed': seed,
+        },
+        'results': results,
+    }
+
+
+def default_list_iterations(size, iterations):
+    # The list endpoint returns the whole library, so large libraries get
+    # fewer repetitions to keep the run time bounded.
+    return max(3, min(iterations, 100_000 // max(size, 1)))
+
+
+def prepare_storage():
+    """Create the benchmark bucket on an S3-compatible stand-in."""
+    storage = storages['default']
+    if isinstance(storage, S3Storage):
+        client = storage.connection.meta.client
+        buckets = {
+            bucket['Name'] for bucket in client.list_buckets()['Buckets']
+        }
+        if storage.bucket_name not in buckets:
+            client.create_bucket(Bucket=storage.bucket_name)
+
+
+def compare_results(current, baseline, tolerance):
+    """
+    Compare a results document against a baseline.
+
+    Returns a list of human-readable regression descriptions.
+    """
+    regressions = []
+    for case, scenarios in baseline['results'].items():
+        for scenario, metrics in scenarios.items():
+            measured = current['results'].get(case, {}).get(scenario)
+            if measured is None:
+                continue
+            for metric in LATENCY_METRICS:
+                if measured[metric] > metrics[metric] * (1 + tolerance):
+                    regressions.append(
+                        f"{case} {scenario} {metric}: "
+                        f"{metrics[metric]:.2f} -> {measured[metric]:.2f}"
+                    )
+            for metric in EXACT_METRICS:
+                if measured[metric] > metrics[metric]:
+                    regressions.append(
+                        f"{case} {scenario} {metric}: "
+                        f"{metrics[metric]:g} -> {measured[metric]:g}"
+                    )
+    return regressions
+
+
+def load_results(path):
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def write_results(results, path):
+    with open(path, 'w') as handle:
+        json.dump(results, handle, indent=2, sort_keys=True)
+        handle.write('\n')
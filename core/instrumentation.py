@@ -0,0 +1,116 @@
+"""
+Per-request timing of SQL, storage, Pillow, serialization and rendering.
+
+RequestInstrumentationMiddleware activates a RequestMetrics for sampled
+requests; code paths report into it with `timed(category)`. When no
+request is being instrumented `timed` is a no-op.
+"""
+import contextvars
+import cProfile
+import os
+import time
+from contextlib import contextmanager
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """
+    Call counts and exclusive durations per category for one request.
+
+    Time spent in a nested category (e.g. SQL run while serializing) is
+    attributed to the inner category only, so categories add up to at
+    most the total request time.
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.durations = {}
+        self._nested = []
+
+    def add(self, category, seconds):
+        self.counts[category] = self.counts.get(category, 0) + 1
+        self.durations[category] = self.durations.get(category, 0.0) + seconds
+
+    def as_dict(self):
+        return {
+            category: {
+                'count': self.counts[category],
+                'ms': round(self.durations[category] * 1000, 3),
+            }
+            for category in self.counts
+        }
+
+
+def activate():
+    """Start collecting metrics for the current request."""
+    metrics = RequestMetrics()
+    return metrics, _current.set(metrics)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+def current_metrics():
+    return _current.get()
+
+
+@contextmanager
+def timed(category):
+    """
+    Attribute the time spent in the block to `category`.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+
+    metrics._nested.append(0.0)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        nested = metrics._nested.pop()
+        if metrics._nested:
+            metrics._nested[-1] += elapsed
+        metrics.add(category, elapsed - nested)
+
+
+def sql_execute_wrapper(execute, sql, params, many, context):
+    """Database execute wrapper recording each query under `sql`."""
+    with timed('sql'):
+        return execute(sql, params, many, context)
+
+
+class CProfileProfiler:
+    """
+    Default slow-request profiler: a cProfile run dumped as a .prof file.
+
+    Profilers are configured with INSTRUMENTATION_PROFILER and must
+    provide start(), stop() and dump(path).
+    """
+    extension = 'prof'
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def dump(self, path):
+        self.profile.dump_stats(path)
+
+
+def profile_path(directory, request, extension):
+    """Build a unique dump file name for a slow request."""
+    slug = request.path.strip('/').replace('/', '_') or 'root'
+    return os.path.join(
+        directory,
+        f'{time.strftime("%Y%m%dT%H%M%S")}-{request.method}-{slug}-'
+        f'{os.getpid()}-{time.perf_counter_ns()}.{extension}'
+    )
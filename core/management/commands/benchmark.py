@@ -0,0 +1,136 @@
+import tempfile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from core.benchmark import (
+    SCENARIOS,
+    compare_results,
+    load_results,
+    run_benchmarks,
+    storage_settings,
+    write_results,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark upload, list, detail and delete against seeded image "
+        "libraries, in a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='10,10000,100000',
+            help='Comma-separated library sizes to seed (default: 10,10000,100000)'
+        )
+        parser.add_argument(
+            '--storage',
+            action='append',
+            choices=['local', 's3'],
+            help='Storage backend(s) to benchmark (default: local)'
+        )
+        parser.add_argument(
+            '--s3-endpoint',
+            default='http://localhost:9000',
+            help='Endpoint of the S3-compatible stand-in, e.g. MinIO'
+        )
+        parser.add_argument(
+            '--s3-bucket',
+            default='benchmark',
+            help='Bucket on the stand-in; created if missing'
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=20,
+            help='Requests per scenario (default: 20)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Seed for the generated image set (default: 0)'
+        )
+        parser.add_argument(
+            '--output',
+            default='benchmark-results.json',
+            help='Where to write the results (default: benchmark-results.json)'
+        )
+        parser.add_argument(
+            '--baseline',
+            default=None,
+            help='Baseline results file to compare against'
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.2,
+            help='Allowed latency growth over the baseline (default: 0.2)'
+        )
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        backends = options['storage'] or ['local']
+
+        with tempfile.TemporaryDirectory() as media_root:
+            storages = {
+                backend: storage_settings(
+                    backend,
+                    location=media_root,
+                    s3_endpoint=options['s3_endpoint'],
+                    s3_bucket=options['s3_bucket']
+                )
+                for backend in backends
+            }
+            setup_test_environment()
+            old_name = connection.creation.create_test_db(verbosity=0)
+            try:
+                results = run_benchmarks(
+                    storages, sizes,
+                    iterations=options['iterations'],
+                    seed=options['seed']
+                )
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+
+        write_results(results, options['output'])
+        self.write_table(results)
+        self.stdout.write(f"Results written to {options['output']}.")
+
+        if options['baseline']:
+            regressions = compare_results(
+                results, load_results(options['baseline']),
+                options['tolerance']
+            )
+            if regressions:
+                raise CommandError(
+                    "Performance regressions against the baseline:\n  "
+                    + "\n  ".join(regressions)
+                )
+            self.stdout.write(self.style.SUCCESS(
+                "No regressions against the baseline."
+            ))
+
+    def write_table(self, results):
+        # Name columns are as wide as their longest value, so rows stay
+        # aligned whatever the cases and scenarios are called.
+        case_width = max(map(len, ['case', *results['results']]))
+        scenario_width = max(map(len, ['scenario', *SCENARIOS]))
+        self.stdout.write(
+            f"{'case':<{case_width}} {'scenario':<{scenario_width}} "
+            f"{'p50 ms':>9} {'p95 ms':>9} {'req/s':>9} {'queries':>8} "
+            f"{'written B':>11} {'response B':>11}"
+        )
+        for case, scenarios in results['results'].items():
+            for scenario in SCENARIOS:
+                metrics = scenarios[scenario]
+                self.stdout.write(
+                    f"{case:<{case_width}} {scenario:<{scenario_width}} "
+                    f"{metrics['p50_ms']:9.2f} "
+                    f"{metrics['p95_ms']:9.2f} {metrics['throughput_rps']:9.1f} "
+                    f"{metrics['queries_per_request']:8.1f} "
+                    f"{metrics['storage_bytes_written_per_request']:11.0f} "
+                    f"{metrics['response_bytes_per_request']:11.0f}"
+                )
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core.schema import generate_schema, render_schema_yaml
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the OpenAPI schema to OPENAPI_SCHEMA_FILE, or with --check "
+        "fail if the committed schema is out of date."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Exit with an error if the committed schema is stale'
+        )
+        parser.add_argument(
+            '--file',
+            default=None,
+            help='Schema file path (default: OPENAPI_SCHEMA_FILE)'
+        )
+
+    def handle(self, *args, check, file, **options):
+        path = settings.OPENAPI_SCHEMA_FILE if file is None else file
+        content = render_schema_yaml(generate_schema())
+
+        if check:
+            try:
+                with open(path, 'rb') as committed:
+                    current = committed.read() == content
+            except FileNotFoundError:
+                current = False
+            if not current:
+                raise CommandError(
+                    f"{path} is out of date. Run "
+                    f"'python manage.py build_openapi_schema' and commit it."
+                )
+            self.stdout.write(self.style.SUCCESS(f"{path} is up to date."))
+            return
+
+        with open(path, 'wb') as output:
+            output.write(content)
+        self.stdout.write(self.style.SUCCESS(f"Wrote schema to {path}."))
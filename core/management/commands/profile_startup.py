@@ -0,0 +1,137 @@
+import json
+import subprocess
+import sys
+from collections import defaultdict
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Modules that should stay out of worker boot unless their feature is used.
+HEAVY_MODULES = (
+    'boto3',
+    'botocore',
+    'storages.backends.s3',
+    'PIL.Image',
+    'drf_spectacular.views',
+    'drf_spectacular.generators',
+)
+
+# Runs in a fresh interpreter so nothing is already imported: builds the
+# WSGI application like a worker does, then serves one request.
+BOOT_SCRIPT = '''
+import json, sys, time
+from wsgiref.util import setup_testing_defaults
+
+start = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+booted = time.perf_counter()
+
+environ = {'PATH_INFO': sys.argv[1]}
+setup_testing_defaults(environ)
+statuses = []
+response = application(environ, lambda status, headers, *args: statuses.append(status))
+b''.join(response)
+getattr(response, 'close', lambda: None)()
+served = time.perf_counter()
+
+print(json.dumps({
+    'status': statuses[0],
+    'boot_ms': (booted - start) * 1000,
+    'first_request_ms': (served - booted) * 1000,
+    'heavy_modules': [name for name in json.loads(sys.argv[2]) if name in sys.modules],
+}))
+'''
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure cold-start cost in a fresh interpreter: import time per "
+        "package and time until the first request is served."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default='/api/images/',
+            help='Path of the first request (default: /api/images/)'
+        )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=15,
+            help='Number of packages to list in the breakdown (default: 15)'
+        )
+        parser.add_argument(
+            '--budget-ms',
+            type=float,
+            default=None,
+            help='Fail if time to first response exceeds this many ms'
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            dest='as_json',
+            help='Print the report as JSON'
+        )
+
+    def handle(self, *args, path, top, budget_ms, as_json, **options):
+        report = self.profile(path)
+        report['imports_ms'] = dict(list(report['imports_ms'].items())[:top])
+
+        if as_json:
+            self.stdout.write(json.dumps(report))
+        else:
+            self.write_report(report, path)
+
+        if budget_ms is not None and report['total_ms'] > budget_ms:
+            raise CommandError(
+                f"Time to first response {report['total_ms']:.1f} ms exceeds "
+                f"the {budget_ms:.0f} ms budget."
+            )
+
+    def profile(self, path):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', BOOT_SCRIPT,
+             path, json.dumps(HEAVY_MODULES)],
+            capture_output=True,
+            text=True,
+            cwd=settings.BASE_DIR
+        )
+        if result.returncode:
+            raise CommandError(f"Startup profiling failed:\n{result.stderr}")
+
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+        report['total_ms'] = report['boot_ms'] + report['first_request_ms']
+        report['imports_ms'] = self.import_breakdown(result.stderr)
+        return report
+
+    @staticmethod
+    def import_breakdown(importtime_output):
+        """
+        Sum `-X importtime` self times per top-level package, in ms.
+        """
+        totals = defaultdict(int)
+        for line in importtime_output.splitlines():
+            if not line.startswith('import time:'):
+                continue
+            self_us, _, name = line[len('import time:'):].split('|')
+            if not self_us.strip().isdigit():
+                continue  # column header
+            totals[name.strip().split('.')[0]] += int(self_us)
+        return {
+            package: micros / 1000
+            for package, micros in sorted(
+                totals.items(), key=lambda item: item[1], reverse=True
+            )
+        }
+
+    def write_report(self, report, path):
+        self.stdout.write(f"First request: GET {path} -> {report['status']}")
+        self.stdout.write(f"  Boot (settings, apps, WSGI): {report['boot_ms']:8.1f} ms")
+        self.stdout.write(f"  First request:               {report['first_request_ms']:8.1f} ms")
+        self.stdout.write(f"  Time to first response:      {report['total_ms']:8.1f} ms")
+        self.stdout.write("Import time by top-level package (self time):")
+        for package, millis in report['imports_ms'].items():
+            self.stdout.write(f"  {package:<28} {millis:8.1f} ms")
+        heavy = ', '.join(report['heavy_modules']) or 'none'
+        self.stdout.write(f"Heavy modules loaded: {heavy}")
@@ -0,0 +1,157 @@
+"""
+Prometheus metrics for request latency, uploads, storage and the database.
+
+Every recording function is a no-op unless METRICS_ENABLED is set, and
+prometheus_client is only imported once metrics are enabled. Under
+gunicorn, set PROMETHEUS_MULTIPROC_DIR so each worker writes its values
+to memory-mapped files that the /metrics view aggregates.
+"""
+import os
+import threading
+from django.conf import settings
+from django.db import connections
+
+# URL names exported as the `view` label; everything else is `other`, so
+# label cardinality stays bounded.
+INSTRUMENTED_VIEWS = frozenset({
+    'image-upload',
+    'image-list',
+    'image-detail',
+    'image-delete',
+    'image-duplicates',
+    'image-duplicate-groups',
+    'image-export',
+    'image-archive',
+    'login',
+    'signup',
+})
+
+_lock = threading.Lock()
+_metrics = None
+
+
+class Metrics:
+    """
+    The process's metric objects.
+    """
+
+    def __init__(self):
+        from prometheus_client import Counter, Gauge, Histogram
+
+        self.request_duration = Histogram(
+            'http_request_duration_seconds',
+            'Request latency by view.',
+            ['view', 'method'],
+            buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30),
+        )
+        self.upload_bytes = Histogram(
+            'image_upload_bytes',
+            'Size of successfully uploaded image files.',
+            buckets=(
+                16 * 1024, 64 * 1024, 256 * 1024, 512 * 1024,
+                1024 ** 2, 2 * 1024 ** 2, 5 * 1024 ** 2, 10 * 1024 ** 2,
+            ),
+        )
+        self.storage_duration = Histogram(
+            'storage_operation_duration_seconds',
+            'Storage backend call latency by operation.',
+            ['operation'],
+            buckets=(.0005, .001, .005, .01, .025, .05, .1, .25, .5, 1, 5),
+        )
+        self.storage_errors = Counter(
+            'storage_operation_errors_total',
+            'Storage backend calls that raised, by operation.',
+            ['operation'],
+        )
+        self.db_connections_open = Gauge(
+            'db_connections_open',
+            'Open database connections, summed over live worker processes.',
+            ['alias'],
+            multiprocess_mode='livesum',
+        )
+        self.db_queries = Counter(
+            'db_queries_total',
+            'Database queries executed.',
+            ['alias'],
+        )
+
+
+def get_metrics():
+    """
+    Return the process-wide Metrics, or None when metrics are disabled.
+    """
+    global _metrics
+    if not settings.METRICS_ENABLED:
+        return None
+    if _metrics is None:
+        with _lock:
+            if _metrics is None:
+                _metrics = Metrics()
+    return _metrics
+
+
+def observe_request(url_name, method, seconds):
+    metrics = get_metrics()
+    if metrics is not None:
+        view = url_name if url_name in INSTRUMENTED_VIEWS else 'other'
+        metrics.request_duration.labels(view, method).observe(seconds)
+
+
+def observe_upload(size):
+    metrics = get_metrics()
+    if metrics is not None and size is not None:
+        metrics.upload_bytes.observe(size)
+
+
+def observe_storage(operation, seconds, failed=False):
+    metrics = get_metrics()
+    if metrics is not None:
+        metrics.storage_duration.labels(operation).observe(seconds)
+        if failed:
+            metrics.storage_errors.labels(operation).inc()
+
+
+def count_queries(alias):
+    """
+    Return a database execute wrapper counting queries on `alias`.
+    """
+    counter = get_metrics().db_queries.labels(alias)
+
+    def execute_wrapper(execute, sql, params, many, context):
+        counter.inc()
+        return execute(sql, params, many, context)
+
+    return execute_wrapper
+
+
+def update_db_connections():
+    """
+    Publish whether this process holds an open connection per alias.
+    """
+    metrics = get_metrics()
+    if metrics is not None:
+        for connection in connections.all(initialized_only=True):
+            metrics.db_connections_open.labels(connection.alias).set(
+                0 if connection.connection is None else 1
+            )
+
+
+def render_latest():
+    """
+    Return (body, content type) for a scrape of all worker processes.
+    """
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST,
+        REGISTRY,
+        CollectorRegistry,
+        generate_latest,
+    )
+
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
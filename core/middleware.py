@@ -0,0 +1,124 @@
+import json
+import logging
+import os
+import random
+import time
+from contextlib import ExitStack
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.module_loading import import_string
+from . import instrumentation, metrics
+
+logger = logging.getLogger('core.instrumentation')
+
+
+class RequestInstrumentationMiddleware:
+    """
+    Record per-request SQL, storage, Pillow, serialization and render
+    timings and expose them as Server-Timing headers and log lines.
+
+    Removed from the middleware chain entirely unless
+    INSTRUMENTATION_ENABLED is set. Requests are sampled with
+    INSTRUMENTATION_SAMPLE_RATE; sampled requests slower than
+    INSTRUMENTATION_SLOW_REQUEST_MS have a profile dumped to
+    INSTRUMENTATION_PROFILE_DIR.
+    """
+
+    def __init__(self, get_response):
+        if not settings.INSTRUMENTATION_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = settings.INSTRUMENTATION_SAMPLE_RATE
+        self.slow_request_ms = settings.INSTRUMENTATION_SLOW_REQUEST_MS
+        self.profiler_class = import_string(settings.INSTRUMENTATION_PROFILER)
+
+    def __call__(self, request):
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        profiler = None
+        if self.slow_request_ms is not None:
+            profiler = self.profiler_class()
+
+        metrics, token = instrumentation.activate()
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(
+                        instrumentation.sql_execute_wrapper
+                    ))
+                if profiler is not None:
+                    profiler.start()
+                    stack.callback(profiler.stop)
+                response = self.get_response(request)
+        finally:
+            instrumentation.deactivate(token)
+        total_ms = (time.perf_counter() - start) * 1000
+
+        if settings.INSTRUMENTATION_SERVER_TIMING:
+            response['Server-Timing'] = self.server_timing(metrics, total_ms)
+
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total_ms, 3),
+            'timings': metrics.as_dict(),
+        }
+        if profiler is not None and total_ms >= self.slow_request_ms:
+            record['profile'] = self.dump_profile(profiler, request)
+        logger.info(json.dumps(record))
+        return response
+
+    @staticmethod
+    def server_timing(metrics, total_ms):
+        entries = [
+            f'{category};dur={duration * 1000:.3f};'
+            f'desc="{metrics.counts[category]} calls"'
+            for category, duration in metrics.durations.items()
+        ]
+        entries.append(f'total;dur={total_ms:.3f}')
+        return ', '.join(entries)
+
+    @staticmethod
+    def dump_profile(profiler, request):
+        directory = settings.INSTRUMENTATION_PROFILE_DIR
+        os.makedirs(directory, exist_ok=True)
+        path = instrumentation.profile_path(
+            directory, request, profiler.extension
+        )
+        profiler.dump(path)
+        return str(path)
+
+
+class MetricsMiddleware:
+    """
+    Record request latency per view and database usage for /metrics.
+
+    Removed from the middleware chain unless METRICS_ENABLED is set.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(
+                    metrics.count_queries(connection.alias)
+                ))
+            response = self.get_response(request)
+
+        match = request.resolver_match
+        metrics.observe_request(
+            match.url_name if match else None,
+            request.method,
+            time.perf_counter() - start
+        )
+        metrics.update_db_connections()
+        return response
@@ -0,0 +1,83 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+from .instrumentation import timed
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that records rendering under `render`.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timed('render'):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class FastJSONRenderer(TimedJSONRenderer):
+    """
+    JSON renderer using orjson, producing the same bytes as JSONRenderer.
+
+    Values orjson would format differently (datetimes, Decimals, lazy
+    strings, ...) go through DRF's encoder. Indented output, as used by
+    the browsable API, and non-default JSON settings fall back to
+    JSONRenderer, as does a missing orjson.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        try:
+            import orjson
+        except ImportError:
+            orjson = None
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if (orjson is None or data is None or indent is not None
+                or self.ensure_ascii or not self.compact):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        with timed('render'):
+            ret = orjson.dumps(
+                data,
+                default=JSONEncoder().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+            )
+            # Match JSONRenderer's escaping of U+2028/U+2029.
+            return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+                b'\xe2\x80\xa9', b'\\u2029'
+            )
+
+
+class NDJSONRenderer(FastJSONRenderer):
+    """
+    Render data as a single line of newline-delimited JSON.
+
+    Streaming views write their own lines; this renders their errors,
+    and lets clients send `Accept: application/x-ndjson`.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return super().render(data, None, renderer_context) + b'\n'
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Render responses as MessagePack for clients that send
+    `Accept: application/msgpack`. Values are the ones JSON would carry,
+    so datetimes are ISO 8601 strings.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        import msgpack
+
+        if data is None:
+            return b''
+        with timed('render'):
+            return msgpack.packb(
+                data, default=JSONEncoder().default
+            )
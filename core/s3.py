@@ -0,0 +1,7 @@
+from storages.backends.s3 import S3Storage
+from .storage import InstrumentedStorageMixin
+
+
+# Kept apart from core.storage so boto3 is only imported when S3 is used.
+class InstrumentedS3Storage(InstrumentedStorageMixin, S3Storage):
+    pass
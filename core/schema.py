@@ -0,0 +1,89 @@
+import gzip
+import hashlib
+import threading
+import yaml
+from django.conf import settings
+from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+from drf_spectacular.settings import spectacular_settings
+
+
+def generate_schema():
+    """
+    Generate the OpenAPI schema for the project's URLconf.
+
+    Mirrors drf-spectacular's `spectacular` management command, so the
+    result is independent of the incoming request.
+    """
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS()
+    return generator.get_schema(request=None, public=True)
+
+
+def render_schema_yaml(schema):
+    return OpenApiYamlRenderer().render(schema, renderer_context={})
+
+
+class RenderedSchema:
+    """
+    A serialized schema with its ETag and pre-compressed variants.
+    """
+
+    def __init__(self, yaml_content, json_content):
+        # format -> content coding -> (body, strong ETag)
+        self.variants = {
+            'yaml': self.build_variant(yaml_content),
+            'json': self.build_variant(json_content),
+        }
+
+    @staticmethod
+    def build_variant(content):
+        digest = hashlib.sha256(content).hexdigest()
+        return {
+            'identity': (content, f'"{digest}"'),
+            'gzip': (gzip.compress(content, mtime=0), f'"{digest}-gzip"'),
+        }
+
+    @classmethod
+    def from_schema(cls, schema):
+        return cls(
+            render_schema_yaml(schema),
+            OpenApiJsonRenderer().render(schema, renderer_context={})
+        )
+
+    @classmethod
+    def from_file(cls, path):
+        yaml_content = path.read_bytes()
+        schema = yaml.safe_load(yaml_content)
+        return cls(
+            yaml_content,
+            OpenApiJsonRenderer().render(schema, renderer_context={})
+        )
+
+
+_lock = threading.Lock()
+_cached = None
+
+
+def get_rendered_schema():
+    """
+    Return the process-wide rendered schema, building it on first use.
+
+    In `file` mode the schema committed at OPENAPI_SCHEMA_FILE is loaded;
+    in `lazy` mode it is generated once per process. Either way the cache
+    lives until the process restarts, i.e. until the next deploy.
+    """
+    global _cached
+    if _cached is None:
+        with _lock:
+            if _cached is None:
+                if settings.OPENAPI_SCHEMA_MODE == 'file':
+                    _cached = RenderedSchema.from_file(
+                        settings.OPENAPI_SCHEMA_FILE
+                    )
+                else:
+                    _cached = RenderedSchema.from_schema(generate_schema())
+    return _cached
+
+
+def clear_schema_cache():
+    global _cached
+    _cached = None
@@ -0,0 +1,17 @@
+from rest_framework import serializers
+from .instrumentation import timed
+
+
+class TimedDataMixin:
+    """
+    Record building a serializer's `.data` under `serialize`.
+    """
+
+    @property
+    def data(self):
+        with timed('serialize'):
+            return super().data
+
+
+class TimedListSerializer(TimedDataMixin, serializers.ListSerializer):
+    pass
@@ -0,0 +1,59 @@
+import time
+from contextlib import contextmanager
+from django.core.files.storage import FileSystemStorage
+from .instrumentation import timed
+from .metrics import observe_storage
+
+
+@contextmanager
+def observe(operation):
+    """
+    Report a storage call to request instrumentation and metrics.
+    """
+    start = time.perf_counter()
+    failed = False
+    try:
+        with timed('storage'):
+            yield
+    except Exception:
+        failed = True
+        raise
+    finally:
+        observe_storage(operation, time.perf_counter() - start, failed)
+
+
+class InstrumentedStorageMixin:
+    """
+    Time storage backend calls and count failures per operation.
+
+    Only installed (see STORAGES in settings) when instrumentation or
+    metrics are enabled, so the default backends carry no overhead.
+    """
+
+    def _save(self, name, content):
+        with observe('save'):
+            return super()._save(name, content)
+
+    def _open(self, name, mode='rb'):
+        with observe('open'):
+            return super()._open(name, mode)
+
+    def delete(self, name):
+        with observe('delete'):
+            return super().delete(name)
+
+    def exists(self, name):
+        with observe('exists'):
+            return super().exists(name)
+
+    def url(self, name, *args, **kwargs):
+        with observe('url'):
+            return super().url(name, *args, **kwargs)
+
+    def size(self, name):
+        with observe('size'):
+            return super().size(name)
+
+
+class InstrumentedFileSystemStorage(InstrumentedStorageMixin, FileSystemStorage):
+    pass
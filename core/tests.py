@@ -0,0 +1,438 @@
+import gzip
+import json
+import os
+import pstats
+import subprocess
+import sys
+import time
+import pytest
+import yaml
+from io import BytesIO, StringIO
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from rest_framework.test import APIClient
+from core import instrumentation, middleware, schema
+from core.benchmark import (
+    SCENARIOS,
+    compare_results,
+    run_benchmarks,
+    storage_settings,
+)
+from core.views import CachedSchemaView, MetricsView
+
+
+class SchemaClient:
+    """Call CachedSchemaView directly, like a test client would."""
+
+    def __init__(self, rf):
+        self.rf = rf
+        self.view = CachedSchemaView.as_view()
+
+    def get(self, path, data=None, **headers):
+        return self.view(self.rf.get(path, data, **headers))
+
+
+@pytest.fixture
+def schema_client(rf, settings):
+    """Return a schema client and reset the process-wide schema cache."""
+    settings.OPENAPI_SCHEMA_MODE = 'lazy'
+    schema.clear_schema_cache()
+    yield SchemaClient(rf)
+    schema.clear_schema_cache()
+
+
+class TestCachedSchema:
+    """Tests for the cached OpenAPI schema view."""
+
+    def test_schema_generated_once(self, schema_client, monkeypatch):
+        """Test that the schema is introspected once per process."""
+        calls = []
+        generate = schema.generate_schema
+        monkeypatch.setattr(
+            schema, 'generate_schema',
+            lambda: calls.append(1) or generate()
+        )
+
+        first = schema_client.get('/api/schema/')
+        second = schema_client.get('/api/schema/')
+
+        assert first.status_code == second.status_code == 200
+        assert first.content == second.content
+        assert len(calls) == 1
+        assert 'paths' in yaml.safe_load(first.content)
+
+    def test_etag_and_caching_headers(self, schema_client):
+        """Test strong ETag revalidation and long-lived caching."""
+        response = schema_client.get('/api/schema/')
+        etag = response['ETag']
+
+        assert not etag.startswith('W/')
+        assert 'max-age=' in response['Cache-Control']
+
+        revalidated = schema_client.get(
+            '/api/schema/', HTTP_IF_NONE_MATCH=etag
+        )
+        assert revalidated.status_code == 304
+        assert revalidated['ETag'] == etag
+
+    def test_gzip_and_json_variants(self, schema_client):
+        """Test pre-compressed and JSON variants of the schema."""
+        plain = schema_client.get('/api/schema/', {'format': 'json'})
+        compressed = schema_client.get(
+            '/api/schema/', {'format': 'json'}, HTTP_ACCEPT_ENCODING='gzip'
+        )
+
+        assert plain['Content-Type'].startswith('application/vnd.oai.openapi+json')
+        assert compressed['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(compressed.content) == plain.content
+        assert compressed['ETag'] != plain['ETag']
+
+    @pytest.mark.parametrize('accept_encoding, coding', [
+        ('gzip', 'gzip'),
+        ('br, GZIP;q=0.5', 'gzip'),
+        ('*', 'gzip'),
+        ('identity;q=0, gzip;q=0.1', 'gzip'),
+        ('gzip;q=0', 'identity'),
+        ('gzip; q=0.0, *', 'identity'),
+        ('*;q=0', 'identity'),
+        ('gzip;q=0.5, identity', 'identity'),
+        ('gzips, br', 'identity'),
+        ('', 'identity'),
+    ])
+    def test_accept_encoding_q_values(self, schema_client, accept_encoding,
+                                      coding):
+        """Test that gzip is only served when weighted as acceptable."""
+        response = schema_client.get(
+            '/api/schema/', HTTP_ACCEPT_ENCODING=accept_encoding
+        )
+
+        assert response.get('Content-Encoding', 'identity') == coding
+        assert 'Accept-Encoding' in response['Vary']
+
+    def test_file_mode_serves_committed_schema(self, schema_client, settings,
+                                               tmp_path):
+        """Test that file mode serves the schema file as-is."""
+        schema_file = tmp_path / 'schema.yaml'
+        schema_file.write_bytes(b'openapi: 3.0.3\npaths: {}\n')
+        settings.OPENAPI_SCHEMA_MODE = 'file'
+        settings.OPENAPI_SCHEMA_FILE = schema_file
+
+        response = schema_client.get('/api/schema/')
+
+        assert response.content == schema_file.read_bytes()
+
+
+class TestBuildSchemaCommand:
+    """Tests for the build_openapi_schema management command."""
+
+    def test_committed_schema_is_current(self):
+        """Fail if openapi-schema.yaml was not regenerated after API changes."""
+        call_command('build_openapi_schema', check=True, stdout=StringIO())
+
+    def test_check_detects_stale_schema(self, tmp_path):
+        """Test that --check fails for an outdated schema file."""
+        stale = tmp_path / 'schema.yaml'
+        stale.write_text('openapi: 3.0.3\n')
+
+        with pytest.raises(CommandError, match='out of date'):
+            call_command(
+                'build_openapi_schema', check=True, file=str(stale),
+                stdout=StringIO()
+            )
+
+
+class TestStartupProfile:
+    """Startup regression tests for worker cold starts."""
+
+    # Generous enough for slow CI machines; a regression that pulls the
+    # S3 or docs stack back into boot is caught by the module check.
+    STARTUP_BUDGET_MS = 3000
+
+    def test_startup_within_budget(self):
+        """Test boot time and that heavy modules load lazily."""
+        out = StringIO()
+        call_command(
+            'profile_startup', as_json=True,
+            budget_ms=self.STARTUP_BUDGET_MS, stdout=out
+        )
+        report = json.loads(out.getvalue())
+
+        assert report['status'].startswith('401')
+        assert report['heavy_modules'] == []
+        assert 'django' in report['imports_ms']
+
+
+@pytest.mark.django_db
+class TestBenchmark:
+    """Tests for the benchmark harness."""
+
+    def test_run_benchmarks_local(self, tmp_path):
+        """Test a small run against local storage."""
+        results = run_benchmarks(
+            {'local': storage_settings('local', location=str(tmp_path))},
+            sizes=[8],
+            iterations=2
+        )
+        scenarios = results['results']['local/8']
+
+        assert set(scenarios) == set(SCENARIOS)
+        assert scenarios['upload']['storage_bytes_written_per_request'] > 0
+        assert scenarios['list']['response_bytes_per_request'] > 0
+        assert scenarios['list_msgpack']['us_per_row'] > 0
+        for metrics in scenarios.values():
+            assert metrics['iterations'] >= 2
+            assert metrics['p95_ms'] >= metrics['p50_ms'] > 0
+            assert metrics['queries_per_request'] > 0
+
+    def test_table_columns_aligned(self):
+        """Test that long case and scenario names keep columns aligned."""
+        from core.management.commands.benchmark import Command
+        metrics = {
+            'p50_ms': 1.0, 'p95_ms': 2.0, 'throughput_rps': 100.0,
+            'queries_per_request': 3.0,
+            'storage_bytes_written_per_request': 0.0,
+            'response_bytes_per_request': 512.0,
+        }
+        results = {'results': {
+            'minio-bucket/100000': {name: metrics for name in SCENARIOS},
+        }}
+        out = StringIO()
+
+        Command(stdout=out).write_table(results)
+
+        lines = out.getvalue().splitlines()
+        assert len({len(line) for line in lines}) == 1
+        assert len({line.index(' 1.00') for line in lines[1:]}) == 1
+        assert 'list_msgpack ' in out.getvalue()
+
+    def test_compare_results_flags_regressions(self):
+        """Test latency tolerance and exact query-count comparison."""
+        def document(p95_ms, queries):
+            metrics = {'p50_ms': 1.0, 'p95_ms': p95_ms,
+                       'queries_per_request': queries}
+            return {'results': {'local/10': {'list': metrics}}}
+
+        baseline = document(10.0, 3)
+
+        assert compare_results(document(11.0, 3), baseline, 0.2) == []
+        assert len(compare_results(document(13.0, 3), baseline, 0.2)) == 1
+        assert len(compare_results(document(10.0, 4), baseline, 0.2)) == 1
+
+
+@pytest.mark.django_db
+class TestRequestInstrumentation:
+    """Tests for Server-Timing instrumentation."""
+
+    @pytest.fixture
+    def instrumented(self, settings, tmp_path):
+        settings.INSTRUMENTATION_ENABLED = True
+        settings.INSTRUMENTATION_SAMPLE_RATE = 1.0
+        settings.INSTRUMENTATION_PROFILE_DIR = str(tmp_path / 'profiles')
+        settings.STORAGES = {
+            **settings.STORAGES,
+            'default': {
+                'BACKEND': 'core.storage.InstrumentedFileSystemStorage',
+            },
+        }
+        return settings
+
+    @pytest.fixture
+    def client_for(self, create_user):
+        def build():
+            client = APIClient()
+            client.force_authenticate(user=create_user)
+            return client
+        return build
+
+    def test_server_timing_categories(self, instrumented, client_for,
+                                      create_image, caplog, monkeypatch):
+        """Test that SQL, storage, serialization and render are reported."""
+        monkeypatch.setattr(middleware.logger, 'propagate', True)
+        with caplog.at_level('INFO', logger='core.instrumentation'):
+            response = client_for().get('/api/images/')
+
+        timing = response['Server-Timing']
+        for category in ('sql', 'storage', 'serialize', 'render', 'total'):
+            assert f'{category};dur=' in timing
+        record = json.loads(caplog.records[-1].getMessage())
+        assert record['path'] == '/api/images/'
+        assert record['timings']['storage']['count'] >= 1
+
+    def test_upload_reports_pillow(self, instrumented, client_for,
+                                   sample_image):
+        """Test that Pillow work on the upload path is attributed."""
+        response = client_for().post(
+            '/api/images/upload/', {'image': sample_image}, format='multipart'
+        )
+
+        assert response.status_code == 201
+        assert 'pillow;dur=' in response['Server-Timing']
+
+    def test_disabled_adds_nothing(self, settings, client_for):
+        """Test that the middleware is removed when disabled."""
+        settings.INSTRUMENTATION_ENABLED = False
+
+        response = client_for().get('/api/images/')
+
+        assert not response.has_header('Server-Timing')
+
+    def test_unsampled_request_not_instrumented(self, instrumented,
+                                                client_for):
+        """Test that requests outside the sample are passed through."""
+        instrumented.INSTRUMENTATION_SAMPLE_RATE = 0.0
+
+        response = client_for().get('/api/images/')
+
+        assert not response.has_header('Server-Timing')
+
+    def test_slow_request_profile_dumped(self, instrumented, client_for,
+                                         tmp_path):
+        """Test that a profile is written above the slow threshold."""
+        instrumented.INSTRUMENTATION_SLOW_REQUEST_MS = 0
+
+        client_for().get('/api/images/')
+
+        dumps = list((tmp_path / 'profiles').glob('*.prof'))
+        assert len(dumps) == 1
+        assert pstats.Stats(str(dumps[0])).total_calls > 0
+
+    def test_nested_timings_are_exclusive(self):
+        """Test that nested categories are not double counted."""
+        metrics, token = instrumentation.activate()
+        try:
+            with instrumentation.timed('serialize'):
+                with instrumentation.timed('sql'):
+                    time.sleep(0.02)
+        finally:
+            instrumentation.deactivate(token)
+
+        assert metrics.durations['sql'] >= 0.02
+        assert metrics.durations['serialize'] < 0.02
+        assert metrics.counts == {'serialize': 1, 'sql': 1}
+
+
+@pytest.mark.django_db
+class TestMetrics:
+    """Tests for the Prometheus metrics endpoint."""
+
+    @pytest.fixture
+    def metrics_enabled(self, settings):
+        settings.METRICS_ENABLED = True
+        settings.METRICS_AUTH_TOKEN = ''
+        settings.STORAGES = {
+            **settings.STORAGES,
+            'default': {
+                'BACKEND': 'core.storage.InstrumentedFileSystemStorage',
+            },
+        }
+        return settings
+
+    @staticmethod
+    def sample(name, labels=None):
+        from prometheus_client import REGISTRY
+        return REGISTRY.get_sample_value(name, labels or {}) or 0
+
+    def test_request_upload_and_storage_metrics(self, metrics_enabled, rf,
+                                                create_user, sample_image):
+        """Test that views, uploads, storage and queries are recorded."""
+        client = APIClient()
+        client.force_authenticate(user=create_user)
+        uploads = self.sample('image_upload_bytes_count')
+        saves = self.sample(
+            'storage_operation_duration_seconds_count', {'operation': 'save'}
+        )
+
+        client.post(
+            '/api/images/upload/', {'image': sample_image}, format='multipart'
+        )
+        client.get('/api/images/')
+
+        assert self.sample('image_upload_bytes_count') == uploads + 1
+        assert self.sample(
+            'storage_operation_duration_seconds_count', {'operation': 'save'}
+        ) > saves
+        body = MetricsView.as_view()(rf.get('/metrics')).content.decode()
+        assert 'http_request_duration_seconds_bucket{' in body
+        assert 'view="image-upload"' in body
+        assert 'view="image-list"' in body
+        assert 'db_queries_total{alias="default"}' in body
+        assert 'db_connections_open{alias="default"}' in body
+
+    def test_upload_observes_incoming_size(self, metrics_enabled,
+                                           create_user):
+        """Test that optimized uploads record the size that was sent."""
+        from PIL import Image as PILImage
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from images.models import Image
+        metrics_enabled.IMAGE_OPTIMIZE_ORIGINALS = True
+        buffer = BytesIO()
+        PILImage.new('RGB', (64, 64), 'red').save(
+            buffer, format='JPEG', comment=b'x' * 4096
+        )
+        upload = SimpleUploadedFile('photo.jpg', buffer.getvalue())
+        client = APIClient()
+        client.force_authenticate(user=create_user)
+        uploaded = self.sample('image_upload_bytes_sum')
+
+        response = client.post(
+            '/api/images/upload/', {'image': upload}, format='multipart'
+        )
+
+        image = Image.objects.get(pk=response.data['id'])
+        assert image.size < upload.size
+        assert self.sample('image_upload_bytes_sum') == uploaded + upload.size
+
+    def test_storage_errors_counted(self, metrics_enabled):
+        """Test that failing storage calls increment the error counter."""
+        from core.storage import InstrumentedFileSystemStorage
+        before = self.sample(
+            'storage_operation_errors_total', {'operation': 'open'}
+        )
+
+        with pytest.raises(FileNotFoundError):
+            InstrumentedFileSystemStorage().open('missing.jpg')
+
+        assert self.sample(
+            'storage_operation_errors_total', {'operation': 'open'}
+        ) == before + 1
+
+    def test_auth_token_required(self, metrics_enabled, rf):
+        """Test that a configured token protects the endpoint."""
+        metrics_enabled.METRICS_AUTH_TOKEN = 'secret'
+        view = MetricsView.as_view()
+
+        assert view(rf.get('/metrics')).status_code == 401
+        authorized = view(
+            rf.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        )
+        assert authorized.status_code == 200
+
+    def test_multiprocess_aggregation(self, metrics_enabled, rf, tmp_path,
+                                      monkeypatch):
+        """Test that a scrape sums the values written by every worker."""
+        script = (
+            'import django; django.setup()\n'
+            'from core import metrics\n'
+            'metrics.observe_upload(1000)\n'
+            'metrics.observe_request("image-list", "GET", 0.01)\n'
+        )
+        env = {
+            **os.environ,
+            'METRICS_ENABLED': 'True',
+            'PROMETHEUS_MULTIPROC_DIR': str(tmp_path),
+        }
+        for _ in range(2):
+            subprocess.run(
+                [sys.executable, '-c', script], env=env, check=True,
+                cwd=metrics_enabled.BASE_DIR
+            )
+        monkeypatch.setenv('PROMETHEUS_MULTIPROC_DIR', str(tmp_path))
+
+        body = MetricsView.as_view()(rf.get('/metrics')).content.decode()
+
+        assert 'image_upload_bytes_count 2.0' in body
+        assert 'image_upload_bytes_sum 2000.0' in body
+        assert (
+            'http_request_duration_seconds_count'
+            '{method="GET",view="image-list"} 2.0'
+        ) in body
@@ -0,0 +1,21 @@
+from django.utils.module_loading import import_string
+from django.views.decorators.csrf import csrf_exempt
+
+
+def lazy_view(view_path, **initkwargs):
+    """
+    Route to a class-based view that is imported on its first request.
+
+    Keeps heavy, rarely used view modules (e.g. drf-spectacular's
+    generators) out of worker boot.
+    """
+    view = None
+
+    @csrf_exempt
+    def dispatch(request, *args, **kwargs):
+        nonlocal view
+        if view is None:
+            view = import_string(view_path).as_view(**initkwargs)
+        return view(request, *args, **kwargs)
+
+    return dispatch
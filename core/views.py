@@ -0,0 +1,100 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.crypto import constant_time_compare
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from django.views import View
+from .metrics import render_latest
+from .schema import get_rendered_schema
+
+
+class CachedSchemaView(View):
+    """
+    Serve the OpenAPI schema from a process-wide cache.
+
+    A drop-in replacement for SpectacularAPIView that never introspects
+    views per request. Responses carry a strong ETag, are served gzipped
+    when the client accepts it and may be cached for
+    OPENAPI_SCHEMA_MAX_AGE seconds.
+    """
+    content_types = {
+        'yaml': 'application/vnd.oai.openapi; charset=utf-8',
+        'json': 'application/vnd.oai.openapi+json; charset=utf-8',
+    }
+
+    def get(self, request, *args, **kwargs):
+        variant = self.get_variant(request)
+        coding = self.get_coding(request)
+        body, etag = get_rendered_schema().variants[variant][coding]
+
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(
+                body, content_type=self.content_types[variant]
+            )
+            if coding == 'gzip':
+                response['Content-Encoding'] = 'gzip'
+
+        response['ETag'] = etag
+        response['Cache-Control'] = (
+            f'public, max-age={settings.OPENAPI_SCHEMA_MAX_AGE}'
+        )
+        patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+        return response
+
+    def get_coding(self, request):
+        """
+        Return 'gzip' or 'identity' for the request's Accept-Encoding.
+
+        Codings are weighed by their q-values; q=0 means "not acceptable".
+        An unlisted identity is acceptable but preferred least, and when
+        neither coding is acceptable the schema is sent uncompressed.
+        """
+        weights = {}
+        for item in request.headers.get('Accept-Encoding', '').split(','):
+            coding, *params = (part.strip() for part in item.split(';'))
+            if not coding:
+                continue
+            weight = 1.0
+            for param in params:
+                name, _, value = param.partition('=')
+                if name.strip().lower() == 'q':
+                    try:
+                        weight = float(value)
+                    except ValueError:
+                        weight = 0.0
+            weights[coding.lower()] = weight
+
+        gzip = weights.get('gzip', weights.get('x-gzip', weights.get('*', 0.0)))
+        if gzip > 0 and gzip >= weights.get('identity', 0.0):
+            return 'gzip'
+        return 'identity'
+
+    def get_variant(self, request):
+        requested = request.GET.get('format')
+        if requested in self.content_types:
+            return requested
+        if 'json' in request.headers.get('Accept', ''):
+            return 'json'
+        return 'yaml'
+
+
+class MetricsView(View):
+    """
+    Prometheus text exposition of all worker processes' metrics.
+
+    Requires `Authorization: Bearer <METRICS_AUTH_TOKEN>` when a token is
+    configured.
+    """
+
+    def get(self, request, *args, **kwargs):
+        token = settings.METRICS_AUTH_TOKEN
+        if token and not constant_time_compare(
+                request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponse(status=401)
+
+        body, content_type = render_latest()
+        response = HttpResponse(body, content_type=content_type)
+        response['Cache-Control'] = 'no-store'
+        return response
@@ -1,11 +1,121 @@
+from django import forms
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.utils import get_last_value_from_parameters
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+from django.utils.translation import gettext_lazy as _
 from .models import Image
 
 
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that avoids an exact COUNT(*) over large, unfiltered tables.
+
+    On PostgreSQL the planner's row estimate (pg_class.reltuples) is used
+    once it exceeds IMAGE_ADMIN_ESTIMATED_COUNT_THRESHOLD. Filtered
+    querysets and small tables are still counted exactly.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class '
+                    'WHERE oid = %s::regclass',
+                    [queryset.model._meta.db_table]
+                )
+                estimate = cursor.fetchone()[0]
+            if estimate > settings.IMAGE_ADMIN_ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+
+class UserAutocompleteFilter(admin.FieldListFilter):
+    """
+    Filter by user through the admin autocomplete endpoint.
+
+    Unlike the default related-field filter, this never loads the full
+    list of users into the sidebar.
+    """
+    template = 'admin/images/autocomplete_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.lookup_kwarg = f'{field_path}__{field.target_field.name}__exact'
+        self.lookup_val = get_last_value_from_parameters(
+            params, self.lookup_kwarg
+        )
+        super().__init__(field, request, params, model, model_admin, field_path)
+
+        widget = AutocompleteSelect(field, model_admin.admin_site)
+        widget.choices = forms.ModelChoiceField(
+            field.remote_field.model._default_manager.all()
+        ).choices
+        self.rendered_widget = widget.render(
+            self.lookup_kwarg,
+            self.lookup_val,
+            attrs={'id': f'id_filter_{self.lookup_kwarg}'}
+        )
+        self.hidden_params = [
+            (key, value)
+            for key, value in request.GET.items()
+            if key not in (self.lookup_kwarg, 'p')
+        ]
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+
+    def get_facet_counts(self, pk_attname, filtered_qs):
+        return {}
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.lookup_val is None,
+            'query_string': changelist.get_query_string(
+                remove=[self.lookup_kwarg]
+            ),
+            'display': _('All'),
+        }
+
+
 @admin.register(Image)
 class ImageAdmin(admin.ModelAdmin):
-    list_display = ('id', 'title', 'user', 'uploaded_at')
-    list_filter = ('uploaded_at', 'user')
+    list_display = ('id', 'thumbnail_preview', 'title', 'user', 'uploaded_at')
+    list_display_links = ('id', 'title')
+    list_filter = ('uploaded_at', ('user', UserAutocompleteFilter))
+    list_select_related = ('user',)
     search_fields = ('title', 'description', 'user__email')
-    readonly_fields = ('uploaded_at', 'updated_at')
+    readonly_fields = ('thumbnail_preview', 'content_type', 'size', 'width',
+                       'height', 'uploaded_at', 'updated_at')
+    autocomplete_fields = ('user',)
     ordering = ('-uploaded_at',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+
+    @property
+    def media(self):
+        user_field = Image._meta.get_field('user')
+        return (
+            super().media
+            + AutocompleteSelect(user_field, self.admin_site).media
+            + forms.Media(js=['images/admin/autocomplete_filter.js'])
+        )
+
+    @admin.display(description=_('Preview'))
+    def thumbnail_preview(self, obj):
+        # Only the stored rendition is ever referenced; the original is
+        # never fetched for a preview.
+        if not obj.thumbnail:
+            return '-'
+        return format_html(
+            '<img src="{}" alt="" loading="lazy" decoding="async" '
+            'style="max-width: 80px; max-height: 80px;">',
+            obj.thumbnail.url
+        )
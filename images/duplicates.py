@@ -0,0 +1,229 @@
+"""
+Near-duplicate search over perceptual hashes.
+
+Uses multi-index hashing: each 64-bit hash is split into four 16-bit
+bands (see `phash_fields`). Two hashes within Hamming distance d differ
+by at most d // 4 bits in at least one band, so every match is found
+among the images whose band equals a value within that radius of the
+query's band. Those candidates come from the per-user band indexes (or,
+for a whole library, from in-memory band buckets), and only they are
+compared bit by bit, instead of every pair of images.
+"""
+import functools
+from collections import defaultdict
+from itertools import combinations
+from django.db.models import Q
+from .models import (
+    PHASH_BAND_BITS,
+    PHASH_BAND_FIELDS,
+    PHASH_BANDS,
+    Image,
+    phash_fields,
+)
+
+MAX_DISTANCE = 10
+
+# Buckets holding more hashes than this are compared by traversal.
+LARGE_BUCKET = 16
+
+
+def unsigned(phash):
+    return phash & (1 << 64) - 1
+
+
+def distance(a, b):
+    return (unsigned(a) ^ unsigned(b)).bit_count()
+
+
+@functools.cache
+def band_masks(radius):
+    """
+    Return the XOR masks turning a band value into every value within
+    `radius` bits of it, including 0 for the value itself.
+    """
+    return tuple(
+        sum(1 << position for position in positions)
+        for bits in range(radius + 1)
+        for positions in combinations(range(PHASH_BAND_BITS), bits)
+    )
+
+
+def band_neighbours(value, radius):
+    """Return every band value within `radius` bits of `value`."""
+    return {value ^ mask for mask in band_masks(radius)}
+
+
+def candidates(image, max_distance):
+    """
+    Return the owner's other images sharing a band with `image` within
+    the radius for `max_distance`; a superset of its near-duplicates
+    served by the per-user band indexes.
+    """
+    radius = max_distance // PHASH_BANDS
+    bands = phash_fields(unsigned(image.phash))
+    query = Q()
+    for field in PHASH_BAND_FIELDS:
+        query |= Q(**{f'{field}__in': band_neighbours(bands[field], radius)})
+    # Unordered, so the planner ORs the band indexes instead of walking
+    # the user's images in Meta.ordering; callers sort by distance.
+    return Image.objects.filter(query, user_id=image.user_id).exclude(
+        pk=image.pk
+    ).order_by()
+
+
+def near_duplicates(image, max_distance):
+    """
+    Return (distance, image) pairs for the owner's other images within
+    `max_distance` of `image`, closest first.
+    """
+    if image.phash is None:
+        return []
+    matches = [
+        (distance(image.phash, candidate.phash), candidate)
+        for candidate in candidates(image, max_distance).select_related('user')
+    ]
+    return sorted(
+        (match for match in matches if match[0] <= max_distance),
+        key=lambda match: (match[0], -match[1].pk)
+    )
+
+
+def duplicate_groups(user, max_distance, limit=None):
+    """
+    Group a user's images whose hashes are within `max_distance` of each
+    other, directly or through a chain of matches.
+
+    Only the `limit` most recent hashed images are grouped, bounding the
+    time a request can take. Returns the lists of image ids, largest
+    groups first, with images without a match left out, and whether
+    older images were left out.
+    """
+    rows = (
+        Image.objects.filter(user=user, phash__isnull=False)
+        .order_by('-pk')
+        .values_list('pk', 'phash', *PHASH_BAND_FIELDS)
+    )
+    if limit is None:
+        return group_hashes(rows, max_distance), False
+    rows = list(rows[:limit + 1])
+    return group_hashes(rows[:limit], max_distance), len(rows) > limit
+
+
+def group_hashes(rows, max_distance):
+    """
+    Group `(pk, phash, *bands)` rows as described in duplicate_groups.
+
+    Distinct hashes are bucketed by each band's value. Within a band, a
+    bucket is compared with itself and with each bucket whose value is
+    reached by a mask of band_masks(radius), so every candidate pair is
+    visited once per band it shares. Images with equal hashes are grouped
+    without comparing them.
+    """
+    masks = band_masks(max_distance // PHASH_BANDS)
+    images = defaultdict(list)
+    bands = {}
+    buckets = [defaultdict(list) for _ in range(PHASH_BANDS)]
+    for pk, phash, *values in rows:
+        phash = unsigned(phash)
+        if phash not in images:
+            bands[phash] = values
+            for band, value in zip(buckets, values):
+                band[value].append(phash)
+        images[phash].append(pk)
+    parent = {phash: phash for phash in images}
+
+    def root(phash):
+        while parent[phash] != phash:
+            parent[phash] = parent[parent[phash]]
+            phash = parent[phash]
+        return phash
+
+    def join(matches):
+        for phash, other in matches:
+            parent[root(other)] = root(phash)
+
+    def traverse(index, band, large):
+        """
+        Join the matches of the hashes in the band's large buckets.
+
+        Groups are grown by a traversal: a hash is compared only with
+        the hashes of nearby buckets not reached yet, and the matches
+        leave their buckets. A dense cluster is thus taken in by its
+        first members instead of being compared pair by pair.
+        """
+        pending = {value: set(hashes) for value, hashes in band.items()}
+        sizes = {value: len(hashes) for value, hashes in band.items()}
+        near = {}
+        for start_value in large:
+            while start_value in pending:
+                queue = [pending[start_value].pop()]
+                if not pending[start_value]:
+                    del pending[start_value]
+                while queue:
+                    phash = queue.pop()
+                    value = bands[phash][index]
+                    if value not in near:
+                        near[value] = [
+                            value ^ mask for mask in masks
+                            if value ^ mask in band
+                        ]
+                    for other_value in near[value]:
+                        others = pending.get(other_value)
+                        if not others:
+                            continue
+                        found = [
+                            other for other in others
+                            if (phash ^ other).bit_count() <= max_distance
+                        ]
+                        if not found:
+                            continue
+                        others.difference_update(found)
+                        # Sets keep their table when emptied, and every
+                        # scan walks it; copy a bucket once it has halved.
+                        if not others:
+                            del pending[other_value]
+                        elif len(others) * 2 < sizes[other_value]:
+                            pending[other_value] = set(others)
+                            sizes[other_value] = len(others)
+                        join((phash, other) for other in found)
+                        queue += found
+
+    for index, band in enumerate(buckets):
+        large = [
+            value for value, hashes in band.items()
+            if len(hashes) > LARGE_BUCKET
+        ]
+        small = band
+        if large:
+            small = {
+                value: hashes for value, hashes in band.items()
+                if len(hashes) <= LARGE_BUCKET
+            }
+        # Small buckets, nearly all of them, are compared in generator
+        # expressions, which run without a function call per pair.
+        join(
+            (phash, other)
+            for hashes in small.values() if len(hashes) > 1
+            for position, phash in enumerate(hashes)
+            for other in hashes[position + 1:]
+            if (phash ^ other).bit_count() <= max_distance
+        )
+        for mask in masks[1:]:
+            join(
+                (phash, other)
+                for value, hashes in small.items()
+                if value ^ mask > value and value ^ mask in small
+                for phash in hashes
+                for other in small[value ^ mask]
+                if (phash ^ other).bit_count() <= max_distance
+            )
+        if large:
+            traverse(index, band, large)
+
+    groups = defaultdict(list)
+    for phash, pks in images.items():
+        groups[root(phash)].extend(pks)
+    return sorted(
+        (sorted(ids) for ids in groups.values() if len(ids) > 1),
+        key=lambda ids: (-len(ids), ids[0])
+    )
@@ -0,0 +1,300 @@
+"""
+Bulk import of existing image libraries.
+
+Files are read from a directory tree, a tar or zip archive, or a CSV
+manifest and pushed through three stages, each with its own concurrency:
+
+1. decode: a process pool validates each file, optimizes it when
+   IMAGE_OPTIMIZE_ORIGINALS is set, and renders its thumbnail;
+2. upload: a thread pool writes originals and thumbnails to storage;
+3. insert: rows are written with one bulk_create per batch, together
+   with the owner's usage counters.
+
+Decoding of the next batch overlaps with uploading the current one.
+Imported entries are appended to a checkpoint file after each insert, so
+an interrupted import can be rerun and skips what is already done. See
+the `import_images` management command.
+"""
+import csv
+import os
+import tarfile
+import time
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from users.models import UserUsage
+from .models import Image, optimize_options, phash_fields
+from .processing import (
+    MAX_IMAGE_BYTES, InvalidImage, sniff_image, thumbnail_name
+)
+
+# `key` identifies the entry in the checkpoint; exactly one of `path` and
+# `data` is set, except that `data` is not read for entries whose `size`
+# is over MAX_IMAGE_BYTES. `size` is None when it cannot be determined.
+Entry = namedtuple('Entry', 'key name path data size title description')
+
+
+class UnsupportedSource(ValueError):
+    pass
+
+
+def file_size(path):
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return None
+
+
+def iter_directory(root, skip):
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            path = os.path.join(directory, filename)
+            key = os.path.relpath(path, root)
+            if key not in skip:
+                yield Entry(
+                    key, filename, path, None, file_size(path), '', ''
+                )
+
+
+def iter_zip(path, skip):
+    with zipfile.ZipFile(path) as archive:
+        for member in archive.infolist():
+            if member.is_dir() or member.filename in skip:
+                continue
+            data = None
+            if member.file_size <= MAX_IMAGE_BYTES:
+                data = archive.read(member)
+            yield Entry(
+                member.filename, os.path.basename(member.filename), None,
+                data, member.file_size, '', ''
+            )
+
+
+def iter_tar(path, skip):
+    # Stream mode reads compressed archives front to back without seeking.
+    with tarfile.open(path, 'r|*') as archive:
+        for member in archive:
+            if not member.isfile() or member.name in skip:
+                continue
+            # Members left unread are skipped over by the stream.
+            data = None
+            if member.size <= MAX_IMAGE_BYTES:
+                data = archive.extractfile(member).read()
+            yield Entry(
+                member.name, os.path.basename(member.name), None,
+                data, member.size, '', ''
+            )
+
+
+def iter_manifest(path, skip):
+    """
+    Read a CSV manifest with a `path` column and optional `title` and
+    `description` columns. Relative paths are resolved against the
+    manifest's directory.
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, newline='') as handle:
+        for row in csv.DictReader(handle):
+            key = row['path']
+            if key in skip:
+                continue
+            path = os.path.join(base, key)
+            yield Entry(
+                key, os.path.basename(key), path, None, file_size(path),
+                row.get('title') or '', row.get('description') or ''
+            )
+
+
+def iter_source(source, skip=frozenset()):
+    """
+    Yield the entries of a directory, archive or manifest, leaving out
+    the keys in `skip`.
+    """
+    if os.path.isdir(source):
+        return iter_directory(source, skip)
+    if source.lower().endswith('.csv'):
+        return iter_manifest(source, skip)
+    if zipfile.is_zipfile(source):
+        return iter_zip(source, skip)
+    if tarfile.is_tarfile(source):
+        return iter_tar(source, skip)
+    raise UnsupportedSource(
+        f"{source} is not a directory, zip or tar archive, or .csv manifest"
+    )
+
+
+def decode(entry, thumbnail_size, optimize):
+    """Decode stage; runs in a worker process."""
+    data = entry.data
+    if data is None:
+        with open(entry.path, 'rb') as handle:
+            data = handle.read()
+    try:
+        return entry, sniff_image(
+            data, entry.name, thumbnail_size, optimize
+        ), None
+    except InvalidImage as exc:
+        return entry, None, str(exc)
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def read_checkpoint(path):
+    if path is None or not os.path.exists(path):
+        return set()
+    with open(path) as handle:
+        return {line.rstrip('\n') for line in handle if line.strip()}
+
+
+class BulkImporter:
+    """
+    Import entries for one user. `report(message)`, if given, receives
+    failures and a progress line after every batch.
+
+    Imports are an administrative operation and bypass the user's quotas;
+    the usage counters are still updated.
+    """
+
+    def __init__(self, user, decode_workers=None, upload_workers=16,
+                 batch_size=500, checkpoint=None, report=None):
+        self.user = user
+        self.decode_workers = decode_workers or os.cpu_count()
+        self.upload_workers = upload_workers
+        self.batch_size = batch_size
+        self.checkpoint = checkpoint
+        self.report = report or (lambda message: None)
+        self.imported = self.failed = 0
+
+    def run(self, source):
+        done = read_checkpoint(self.checkpoint)
+        skipped = len(done)
+        self.started = time.perf_counter()
+        thumbnail_size = settings.IMAGE_THUMBNAIL_SIZE
+        optimize = optimize_options()
+
+        with ProcessPoolExecutor(self.decode_workers) as decoders, \
+                ThreadPoolExecutor(self.upload_workers) as uploaders:
+            pending = None
+            entries = self.within_limit(iter_source(source, done))
+            for batch in batched(entries, self.batch_size):
+                decoding = [
+                    decoders.submit(decode, entry, thumbnail_size, optimize)
+                    for entry in batch
+                ]
+                if pending is not None:
+                    self.store(pending, uploaders)
+                pending = decoding
+            if pending is not None:
+                self.store(pending, uploaders)
+
+        return {
+            'imported': self.imported,
+            'failed': self.failed,
+            'skipped': skipped,
+        }
+
+    def within_limit(self, entries):
+        """
+        Report entries over the upload size limit without decoding them;
+        sniff_image checks the size again after reading.
+        """
+        for entry in entries:
+            if entry.size is not None and entry.size > MAX_IMAGE_BYTES:
+                self.fail(entry, "Image file too large.")
+            else:
+                yield entry
+
+    def store(self, decoding, uploaders):
+        decoded = []
+        for future in decoding:
+            entry, info, error = future.result()
+            if error:
+                self.fail(entry, error)
+            else:
+                decoded.append((entry, info))
+
+        uploads = [uploaders.submit(self.upload, *item) for item in decoded]
+        images, keys = [], []
+        for (entry, _), future in zip(decoded, uploads):
+            try:
+                images.append(future.result())
+            except Exception as exc:
+                self.fail(entry, f"Upload failed: {exc}")
+            else:
+                keys.append(entry.key)
+
+        if images:
+            try:
+                with transaction.atomic():
+                    Image.objects.bulk_create(images)
+                    # bulk_create sends no post_save, so usage is added here.
+                    UserUsage.objects.adjust(
+                        self.user.id, len(images),
+                        sum(image.size for image in images)
+                    )
+            except Exception:
+                # No row refers to the uploaded objects; remove them as
+                # Image.save does for a rejected upload.
+                list(uploaders.map(self.discard, images))
+                raise
+            self.record(keys)
+            self.imported += len(images)
+
+        elapsed = time.perf_counter() - self.started
+        self.report(
+            f"{self.imported} imported, {self.failed} failed "
+            f"({self.imported / elapsed:.1f} images/s)"
+        )
+
+    def upload(self, entry, info):
+        """Upload stage; runs in a worker thread."""
+        image = Image(
+            user=self.user,
+            title=entry.title[:255],
+            description=entry.description,
+            content_type=info['content_type'],
+            original_size=info['original_size'],
+            size=info['size'],
+            width=info['width'],
+            height=info['height'],
+            placeholder=info['placeholder'],
+            dominant_color=info['dominant_color'],
+            **phash_fields(info['phash']),
+        )
+        image.image.save(entry.name, ContentFile(info['data']), save=False)
+        image.thumbnail.save(
+            thumbnail_name(image.image.name),
+            ContentFile(info['thumbnail']),
+            save=False
+        )
+        return image
+
+    @staticmethod
+    def discard(image):
+        image.image.delete(save=False)
+        image.thumbnail.delete(save=False)
+
+    def fail(self, entry, error):
+        self.failed += 1
+        self.report(f"{entry.key}: {error}")
+
+    def record(self, keys):
+        if self.checkpoint is None:
+            return
+        with open(self.checkpoint, 'a') as handle:
+            handle.writelines(f'{key}\n' for key in keys)
+            handle.flush()
+            os.fsync(handle.fileno())
@@ -0,0 +1,72 @@
+"""
+Fast read path for image listings.
+
+ImageListView fetches plain tuples with `.values_list()`, joining the
+owner instead of loading it per row, and turns each tuple into the exact
+dict ImageSerializer would produce with a row function built once per
+request. Field binding and per-field `to_representation` dispatch are
+skipped; only datetimes and file URLs need converting. The tests compare
+the output with ImageSerializer's, so a field added to the serializer
+must be added here too.
+"""
+from rest_framework import serializers
+from core.instrumentation import timed
+from .models import Image
+
+COLUMNS = (
+    'id', 'image', 'title', 'description', 'content_type', 'size',
+    'original_size', 'width', 'height', 'placeholder', 'dominant_color',
+    'uploaded_at', 'updated_at',
+    'user__id', 'user__email', 'user__username', 'user__date_joined',
+)
+
+
+def compile_row(request):
+    """
+    Return a function mapping a COLUMNS tuple to the dict ImageSerializer
+    gives for the same image in this request.
+    """
+    # DRF's own field converts datetimes, so timezone handling and the
+    # ISO 8601 'Z' suffix match exactly.
+    format_datetime = serializers.DateTimeField().to_representation
+    url = Image._meta.get_field('image').storage.url
+    absolute_uri = request.build_absolute_uri if request else str
+
+    def row_to_dict(row):
+        (pk, name, title, description, content_type, size, original_size,
+         width, height, placeholder, dominant_color, uploaded_at,
+         updated_at, user_id, email, username, date_joined) = row
+        image_url = url(name) if name else None
+        return {
+            'id': pk,
+            'user': {
+                'id': user_id,
+                'email': email,
+                'username': username,
+                'date_joined': format_datetime(date_joined),
+            },
+            'image': absolute_uri(image_url) if image_url else None,
+            'image_url': image_url,
+            'title': title,
+            'description': description,
+            'content_type': content_type,
+            'size': size,
+            'original_size': original_size,
+            'width': width,
+            'height': height,
+            'placeholder': placeholder,
+            'dominant_color': dominant_color,
+            'uploaded_at': format_datetime(uploaded_at),
+            'updated_at': format_datetime(updated_at),
+        }
+
+    return row_to_dict
+
+
+def list_images(queryset, request):
+    """
+    Return the serialized list for a filtered, ordered Image queryset.
+    """
+    with timed('serialize'):
+        row_to_dict = compile_row(request)
+        return [row_to_dict(row) for row in queryset.values_list(*COLUMNS)]
@@ -0,0 +1,132 @@
+import mimetypes
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from images.models import Image
+from users.models import UserUsage
+
+FIELDS = ('size', 'content_type', 'width', 'height')
+
+MISSING = (
+    Q(size__isnull=True) | Q(content_type='')
+    | Q(width__isnull=True) | Q(height__isnull=True)
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Read size, content type and dimensions from storage for images "
+        "uploaded before they were recorded."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Images updated per transaction (default: 500)'
+        )
+        parser.add_argument(
+            '--io-workers',
+            type=int,
+            default=16,
+            help='Threads reading objects (default: 16)'
+        )
+
+    def handle(self, *args, batch_size, io_workers, **options):
+        self.storage = Image._meta.get_field('image').storage
+        updated = failed = 0
+        last_id = 0
+        # Only rows still missing metadata are selected, so an
+        # interrupted run resumes where it stopped.
+        with ThreadPoolExecutor(io_workers) as io:
+            while True:
+                images = list(
+                    Image.objects.filter(MISSING, pk__gt=last_id)
+                    .exclude(image='')
+                    .order_by('pk')
+                    .only('pk', 'image')[:batch_size]
+                )
+                if not images:
+                    break
+                last_id = images[-1].pk
+
+                metadata = {
+                    image.pk: info
+                    for image, info in zip(images, io.map(self.read, images))
+                    if info is not None
+                }
+                done = self.apply(metadata)
+                updated += done
+                failed += len(images) - done
+                self.stdout.write(
+                    f"Up to id {last_id}: {updated} updated, {failed} failed."
+                )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Backfilled metadata of {updated} images; {failed} failed."
+        ))
+
+    def read(self, image):
+        from PIL import Image as PILImage
+
+        name = image.image.name
+        try:
+            size = self.storage.size(name)
+            # Pillow only parses the header to find format and size.
+            with self.storage.open(name) as handle, \
+                    PILImage.open(handle) as pil_image:
+                content_type = PILImage.MIME.get(pil_image.format)
+                width, height = pil_image.size
+        except Exception as exc:
+            self.stderr.write(f"{name}: {exc}")
+            return None
+        return {
+            'name': name,
+            'size': size,
+            'content_type': (
+                content_type or mimetypes.guess_type(name)[0] or ''
+            ),
+            'width': width,
+            'height': height,
+        }
+
+    @staticmethod
+    def apply(metadata):
+        """
+        Fill the missing fields of a batch in one short transaction.
+
+        Rows are locked and re-read, so values recorded meanwhile are kept
+        and a row pointing at a different object is skipped. Only the
+        FIELDS present in an image's metadata are filled. Sizes that were
+        unknown are added to the owners' usage counters.
+        """
+        added_bytes = defaultdict(int)
+        done = []
+        now = timezone.now()
+        with transaction.atomic():
+            images = (
+                Image.objects.select_for_update()
+                .filter(pk__in=metadata)
+                .only('pk', 'user_id', 'image', *FIELDS)
+                .order_by('pk')
+            )
+            for image in images:
+                info = metadata[image.pk]
+                if image.image.name != info['name']:
+                    continue
+                if image.size is None and 'size' in info:
+                    added_bytes[image.user_id] += info['size']
+                for field in FIELDS:
+                    if field in info and getattr(image, field) in (None, ''):
+                        setattr(image, field, info[field])
+                image.updated_at = now
+                done.append(image)
+
+            Image.objects.bulk_update(done, [*FIELDS, 'updated_at'])
+            for user_id, size in added_bytes.items():
+                UserUsage.objects.adjust(user_id, 0, size, create=False)
+        return len(done)
@@ -0,0 +1,132 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+from images.models import PHASH_BAND_FIELDS, Image, phash_fields
+from images.processing import render_previews, thumbnail_name
+
+# bulk_update() skips auto_now, so updated_at is set explicitly for
+# incremental exports to pick the rows up.
+FIELDS = (
+    'thumbnail', 'placeholder', 'dominant_color', 'phash',
+    *PHASH_BAND_FIELDS, 'updated_at',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Store thumbnails and compute placeholders, dominant colours and "
+        "perceptual hashes for older images."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Images updated per bulk_update (default: 500)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Processes rendering previews (default: CPU count)'
+        )
+        parser.add_argument(
+            '--io-workers',
+            type=int,
+            default=16,
+            help='Threads downloading and uploading objects (default: 16)'
+        )
+
+    def handle(self, *args, batch_size, workers, io_workers, **options):
+        self.storage = Image._meta.get_field('image').storage
+        size = settings.IMAGE_THUMBNAIL_SIZE
+        updated = failed = 0
+        last_id = 0
+        with ProcessPoolExecutor(workers) as renderers, \
+                ThreadPoolExecutor(io_workers) as io:
+            while True:
+                images = list(
+                    Image.objects.filter(
+                        Q(thumbnail='') | Q(placeholder='')
+                        | Q(phash__isnull=True),
+                        pk__gt=last_id
+                    )
+                    .exclude(image='')
+                    .order_by('pk')
+                    .only('pk', 'user_id', 'image', 'thumbnail')[:batch_size]
+                )
+                if not images:
+                    break
+                last_id = images[-1].pk
+
+                contents = list(io.map(self.read, images))
+                futures = [
+                    renderers.submit(render_previews, BytesIO(data), size)
+                    if data is not None else None
+                    for data in contents
+                ]
+                rendered = []
+                for image, future in zip(images, futures):
+                    try:
+                        if future is None:
+                            continue
+                        previews = future.result()
+                    except Exception as exc:
+                        self.stderr.write(f"{image.image.name}: {exc}")
+                        continue
+                    rendered.append((image, previews))
+
+                # Missing thumbnails are uploaded before the rows point
+                # at them.
+                done = [
+                    image for image in io.map(self.apply, rendered)
+                    if image is not None
+                ]
+                Image.objects.bulk_update(done, FIELDS)
+                updated += len(done)
+                failed += len(images) - len(done)
+                self.stdout.write(
+                    f"Up to id {last_id}: {updated} updated, {failed} failed."
+                )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Backfilled {updated} images; {failed} failed."
+        ))
+
+    def apply(self, item):
+        """Set an image's previews, storing its thumbnail if it has none."""
+        image, previews = item
+        if not image.thumbnail:
+            try:
+                image.thumbnail.save(
+                    thumbnail_name(image.image.name),
+                    ContentFile(previews['thumbnail']),
+                    save=False
+                )
+            except Exception as exc:
+                self.stderr.write(f"{image.image.name}: {exc}")
+                return None
+        image.placeholder = previews['placeholder']
+        image.dominant_color = previews['dominant_color']
+        for field, value in phash_fields(previews['phash']).items():
+            setattr(image, field, value)
+        image.updated_at = timezone.now()
+        return image
+
+    def read(self, image):
+        # The stored thumbnail is a fraction of the original's size and
+        # gives the same previews and hash as uploads, which also derive
+        # them from the thumbnail rendition. Images without one are
+        # rendered from the original.
+        name = image.thumbnail.name or image.image.name
+        try:
+            with self.storage.open(name) as handle:
+                return handle.read()
+        except Exception as exc:
+            self.stderr.write(f"{name}: {exc}")
+            return None
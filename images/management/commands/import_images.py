@@ -0,0 +1,76 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from images.importer import BulkImporter, UnsupportedSource
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Import a directory tree, tar or zip archive, or CSV manifest of "
+        "images for one user. Imports bypass the user's quotas; their "
+        "usage counters are still updated."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'source',
+            help='Directory, .zip/.tar[.gz|.bz2|.xz] archive, or .csv '
+                 'manifest with path,title,description columns'
+        )
+        parser.add_argument(
+            '--user',
+            required=True,
+            help='Email or id of the user who will own the images'
+        )
+        parser.add_argument(
+            '--decode-workers',
+            type=int,
+            default=None,
+            help='Processes validating images and rendering thumbnails '
+                 '(default: CPU count)'
+        )
+        parser.add_argument(
+            '--upload-workers',
+            type=int,
+            default=16,
+            help='Threads uploading to storage (default: 16)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Rows inserted per bulk_create (default: 500)'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default=None,
+            help='File listing imported entries; rerunning with the same '
+                 'file resumes the import'
+        )
+
+    def handle(self, *args, source, user, decode_workers, upload_workers,
+               batch_size, checkpoint, **options):
+        lookup = {'pk': user} if user.isdigit() else {'email': user}
+        try:
+            owner = User.objects.get(**lookup)
+        except User.DoesNotExist:
+            raise CommandError(f"User {user} does not exist.")
+
+        importer = BulkImporter(
+            owner,
+            decode_workers=decode_workers,
+            upload_workers=upload_workers,
+            batch_size=batch_size,
+            checkpoint=checkpoint,
+            report=self.stdout.write,
+        )
+        try:
+            totals = importer.run(source)
+        except UnsupportedSource as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {totals['imported']} images, {totals['failed']} "
+            f"failed, {totals['skipped']} already imported."
+        ))
@@ -0,0 +1,168 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from images.models import Image, rekey
+from images.storage import copy_object
+
+FILE_FIELDS = ('image', 'thumbnail')
+
+
+class Command(BaseCommand):
+    help = (
+        "Move existing image objects to the IMAGE_KEY_STRATEGY key layout "
+        "with parallel server-side copies, without downtime."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Rows copied and swapped per batch (default: 500)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=16,
+            help='Parallel copy requests (default: 16)'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default='migrate_image_keys.checkpoint.json',
+            help='File recording progress, used to resume (default: '
+                 'migrate_image_keys.checkpoint.json)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Count the objects to move without copying anything'
+        )
+        parser.add_argument(
+            '--delete-old',
+            action='store_true',
+            help='Delete each old object once its row points at the new key'
+        )
+
+    def handle(self, *args, batch_size, workers, checkpoint, dry_run,
+               delete_old, **options):
+        if dry_run:
+            pending = sum(
+                len(self.plan_moves(rows))
+                for rows in self.batches(0, batch_size)
+            )
+            self.stdout.write(f"{pending} objects would be moved.")
+            return
+
+        state = self.load_checkpoint(checkpoint)
+        self.stdout.write(
+            f"Migrating to the '{settings.IMAGE_KEY_STRATEGY}' layout, "
+            f"resuming after id {state['last_id']}."
+        )
+
+        storage = Image._meta.get_field('image').storage
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for rows in self.batches(state['last_id'], batch_size):
+                moves = self.plan_moves(rows)
+                # Phase 1: copy. Rows still point at the old objects, which
+                # keep being served while the copies are made.
+                list(pool.map(
+                    lambda move: self.copy(storage, move), moves
+                ))
+                # Phase 2: swap. Each row is switched only if it was not
+                # changed since it was read.
+                swapped = self.swap(moves)
+                if delete_old:
+                    list(pool.map(
+                        storage.delete,
+                        [move['old'] for move in swapped]
+                    ))
+
+                state['last_id'] = rows[-1]['pk']
+                state['copied'] += len(moves)
+                state['swapped'] += len(swapped)
+                self.save_checkpoint(checkpoint, state)
+                self.stdout.write(
+                    f"Up to id {state['last_id']}: {state['copied']} copied, "
+                    f"{state['swapped']} swapped."
+                )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {state['copied']} objects copied, "
+            f"{state['swapped']} rows swapped."
+        ))
+
+    @staticmethod
+    def batches(last_id, batch_size):
+        while True:
+            rows = list(
+                Image.objects.filter(pk__gt=last_id)
+                .order_by('pk')
+                .values('pk', 'user_id', *FILE_FIELDS)[:batch_size]
+            )
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1]['pk']
+
+    @staticmethod
+    def plan_moves(rows):
+        moves = []
+        for row in rows:
+            for field in FILE_FIELDS:
+                old = row[field]
+                if not old:
+                    continue
+                new = rekey(old, row['user_id'])
+                if new != old:
+                    moves.append({
+                        'pk': row['pk'], 'field': field,
+                        'old': old, 'new': new,
+                    })
+        return moves
+
+    @staticmethod
+    def copy(storage, move):
+        # Copies are deterministic, so a resumed run skips finished ones.
+        # A partial copy or another object at the key differs in size and
+        # is replaced.
+        if storage.exists(move['new']):
+            if storage.size(move['new']) == storage.size(move['old']):
+                return
+            storage.delete(move['new'])
+        copy_object(storage, move['old'], move['new'])
+
+    @staticmethod
+    def swap(moves):
+        swapped = []
+        with transaction.atomic():
+            for move in moves:
+                updated = Image.objects.filter(
+                    pk=move['pk'], **{move['field']: move['old']}
+                ).update(
+                    **{move['field']: move['new']}, updated_at=timezone.now()
+                )
+                if updated:
+                    swapped.append(move)
+        return swapped
+
+    @staticmethod
+    def load_checkpoint(path):
+        state = {'last_id': 0, 'copied': 0, 'swapped': 0}
+        if os.path.exists(path):
+            with open(path) as handle:
+                saved = json.load(handle)
+            if saved.get('strategy') == settings.IMAGE_KEY_STRATEGY:
+                state.update(saved)
+        state['strategy'] = settings.IMAGE_KEY_STRATEGY
+        return state
+
+    @staticmethod
+    def save_checkpoint(path, state):
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w') as handle:
+            json.dump(state, handle)
+        os.replace(temporary, path)
@@ -0,0 +1,181 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from images.models import Image, optimize_options
+from images.processing import optimize_image
+from users.models import UserUsage
+
+
+class Command(BaseCommand):
+    help = (
+        "Strip metadata from and losslessly optimize stored originals that "
+        "have not been optimized yet."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Images processed per batch (default: 200)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Processes optimizing images (default: CPU count)'
+        )
+        parser.add_argument(
+            '--io-workers',
+            type=int,
+            default=16,
+            help='Threads downloading and uploading objects (default: 16)'
+        )
+        parser.add_argument(
+            '--delete-old',
+            action='store_true',
+            help=(
+                'Delete the previous objects once rows point at the new '
+                'ones. Clients may still hold their URLs, so by default '
+                'they are kept for a later cleanup.'
+            )
+        )
+
+    def handle(self, *args, batch_size, workers, io_workers, delete_old,
+               **options):
+        optimizing = optimize_options()
+        if optimizing is None:
+            raise CommandError("Set IMAGE_OPTIMIZE_ORIGINALS=True first.")
+
+        self.storage = Image._meta.get_field('image').storage
+        processed = replaced = saved = 0
+        with ProcessPoolExecutor(workers) as optimizers, \
+                ThreadPoolExecutor(io_workers) as io:
+            for images in self.batches(batch_size):
+                contents = list(io.map(self.read, images))
+                futures = [
+                    optimizers.submit(optimize_image, data, **optimizing)
+                    if data is not None else None
+                    for data in contents
+                ]
+                plans = []
+                for image, data, future in zip(images, contents, futures):
+                    # Unreadable or failed rows keep original_size NULL
+                    # and are retried by the next run.
+                    if future is None:
+                        continue
+                    try:
+                        optimized = future.result()
+                    except Exception as exc:
+                        self.stderr.write(f"{image.image.name}: {exc}")
+                        continue
+                    plans.append({
+                        'image': image,
+                        'original_size': len(data),
+                        'optimized': optimized,
+                    })
+
+                list(io.map(self.upload, plans))
+                swapped, orphans = self.swap(plans)
+                stale = [
+                    name for plan in swapped for name in plan['old_names']
+                ] if delete_old else []
+                list(io.map(self.storage.delete, orphans + stale))
+
+                processed += len(plans)
+                replaced += len(swapped)
+                saved += sum(
+                    plan['original_size'] - plan['updates']['size']
+                    for plan in swapped
+                )
+                self.stdout.write(
+                    f"Up to id {images[-1].pk}: {processed} processed, "
+                    f"{replaced} replaced, {saved} bytes saved."
+                )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Optimized {replaced} of {processed} images, saving "
+            f"{saved} bytes."
+        ))
+
+    @staticmethod
+    def batches(batch_size):
+        # Rows are marked as processed by setting original_size, so a
+        # rerun picks up where an interrupted one stopped.
+        last_id = 0
+        while True:
+            images = list(
+                Image.objects.filter(
+                    pk__gt=last_id, original_size__isnull=True
+                ).order_by('pk').only(
+                    'pk', 'user_id', 'image', 'thumbnail', 'size',
+                    'width', 'height'
+                )[:batch_size]
+            )
+            if not images:
+                return
+            yield images
+            last_id = images[-1].pk
+
+    def read(self, image):
+        try:
+            with self.storage.open(image.image.name) as handle:
+                return handle.read()
+        except Exception as exc:
+            self.stderr.write(f"{image.image.name}: {exc}")
+            return None
+
+    def upload(self, plan):
+        """
+        Store an optimized original under a new key. Its pixels and
+        orientation are unchanged, so the previews stay valid.
+        """
+        plan['updates'], plan['old_names'], plan['new_names'] = {}, [], []
+        if plan['optimized'] is None:
+            return
+        image = plan['image']
+        data, (width, height) = plan['optimized']
+
+        # Keys end in {uuid}_{filename}; upload_to adds a fresh uuid.
+        filename = image.image.name.rsplit('/', 1)[-1].split('_', 1)[-1]
+        field = Image._meta.get_field('image')
+        name = self.storage.save(
+            field.generate_filename(image, filename), ContentFile(data)
+        )
+        plan['new_names'].append(name)
+        plan['old_names'].append(image.image.name)
+        plan['updates'].update(
+            image=name, size=len(data), width=width, height=height
+        )
+
+    @staticmethod
+    def swap(plans):
+        """
+        Point rows at their optimized objects in one short transaction.
+
+        A row whose original changed since it was read is left alone and
+        the objects written for it are returned as orphans.
+        """
+        swapped, orphans = [], []
+        with transaction.atomic():
+            for plan in plans:
+                image = plan['image']
+                updated = Image.objects.filter(
+                    pk=image.pk, image=image.image.name
+                ).update(
+                    original_size=plan['original_size'],
+                    updated_at=timezone.now(),
+                    **plan['updates']
+                )
+                if not updated:
+                    orphans.extend(plan['new_names'])
+                elif plan['updates']:
+                    UserUsage.objects.adjust(
+                        image.user_id, 0,
+                        plan['updates']['size'] - (image.size or 0),
+                        create=False
+                    )
+                    swapped.append(plan)
+        return swapped, orphans
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from images.export import tombstone_horizon
+from images.models import ImageTombstone
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete deletion tombstones older than "
+        "IMAGE_TOMBSTONE_RETENTION_DAYS."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10000,
+            help='Tombstones deleted per statement (default: 10000)'
+        )
+
+    def handle(self, *args, batch_size, **options):
+        horizon = tombstone_horizon()
+        deleted = 0
+        while True:
+            # Tombstones are written in deleted_at order, so the expired
+            # ones sit at the start of the primary key index.
+            ids = list(
+                ImageTombstone.objects.filter(deleted_at__lt=horizon)
+                .order_by('pk')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            ImageTombstone.objects.filter(pk__in=ids).delete()
+            deleted += len(ids)
+            self.stdout.write(f"{deleted} tombstones deleted.")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {deleted} tombstones older than {horizon:%Y-%m-%d %H:%M}."
+        ))
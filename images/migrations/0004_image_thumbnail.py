@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-19 12:09
+
+import images.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0003_image_metadata_and_list_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='thumbnail',
+            field=models.ImageField(blank=True, editable=False, upload_to=images.models.thumbnail_upload_to),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['uploaded_at', 'id'], name='image_uploaded_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 12:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0004_image_thumbnail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='original_size',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-19 12:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0005_image_original_size'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='dominant_color',
+            field=models.CharField(blank=True, editable=False, max_length=7),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='placeholder',
+            field=models.TextField(blank=True, editable=False),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.8 on 2026-10-19 12:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0006_image_previews'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='phash',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='phash_band_0',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='phash_band_1',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='phash_band_2',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='phash_band_3',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['user', 'phash_band_0'], name='image_user_phash_band_0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['user', 'phash_band_1'], name='image_user_phash_band_1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['user', 'phash_band_2'], name='image_user_phash_band_2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['user', 'phash_band_3'], name='image_user_phash_band_3_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-19 12:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0007_image_phash'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['user', 'updated_at', 'id'], name='image_user_updated_idx'),
+        ),
+        migrations.AddField(
+            model_name='imagetombstone',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_tombstones', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='imagetombstone',
+            index=models.Index(fields=['user', 'deleted_at', 'id'], name='tombstone_user_deleted_idx'),
+        ),
+    ]
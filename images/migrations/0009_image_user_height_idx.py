@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-19 14:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0008_image_export'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['user', 'height'], name='image_user_height_idx'),
+        ),
+    ]
@@ -1,16 +1,115 @@
+import hashlib
+import logging
+import mimetypes
+import posixpath
+import threading
 import uuid
-from django.db import models
+from django.core.files.base import ContentFile
+from django.core.files.images import get_image_dimensions
+from django.db import models, transaction
 from django.conf import settings
+from core.instrumentation import timed
+from users.models import QuotaExceeded
+from .processing import optimize_image, render_previews, thumbnail_name
+
+logger = logging.getLogger(__name__)
+
+_optimize_lock = threading.Lock()
+_optimize_slots = None
+
+
+def object_key(root, user_id, filename):
+    """
+    Build the storage key for a file according to IMAGE_KEY_STRATEGY.
+
+    'user':   {root}/{user_id}/{filename}
+    'hashed': {root}/{hash}/{user_id}/{filename}, where {hash} is derived
+              from the (unique) filename, so keys spread evenly over
+              prefixes instead of concentrating a user's requests on one.
+
+    Per-user listing always goes through the database, never the key.
+    """
+    if settings.IMAGE_KEY_STRATEGY == 'hashed':
+        digest = hashlib.sha256(filename.encode()).hexdigest()
+        prefix = digest[:settings.IMAGE_KEY_HASH_PREFIX_LENGTH]
+        return f'{root}/{prefix}/{user_id}/{filename}'
+    return f'{root}/{user_id}/{filename}'
+
+
+def rekey(name, user_id):
+    """
+    Return the key an existing object should have under the current
+    strategy. Deterministic, so interrupted migrations can resume.
+    """
+    root = name.split('/', 1)[0]
+    return object_key(root, user_id, posixpath.basename(name))
+
+
+PHASH_BANDS = 4
+PHASH_BAND_BITS = 16
+PHASH_BAND_FIELDS = tuple(f'phash_band_{band}' for band in range(PHASH_BANDS))
+
+
+def phash_fields(value):
+    """
+    Return Image field values for an unsigned 64-bit perceptual hash.
+
+    The hash is stored as a signed bigint and split into 16-bit bands,
+    each indexed per user; see images/duplicates.py.
+    """
+    mask = (1 << PHASH_BAND_BITS) - 1
+    fields = {
+        field: value >> (band * PHASH_BAND_BITS) & mask
+        for band, field in enumerate(PHASH_BAND_FIELDS)
+    }
+    fields['phash'] = value - (1 << 64) if value >= 1 << 63 else value
+    return fields
+
+
+def optimize_options():
+    """
+    Return optimize_image keyword arguments, or None when
+    IMAGE_OPTIMIZE_ORIGINALS is off.
+    """
+    if not settings.IMAGE_OPTIMIZE_ORIGINALS:
+        return None
+    return {
+        'keep': tuple(settings.IMAGE_KEEP_METADATA),
+        'max_pixels': settings.IMAGE_OPTIMIZE_MAX_PIXELS,
+    }
+
+
+def optimize_slots():
+    """
+    Semaphore bounding concurrent optimizations in this process, so a
+    burst of uploads to a threaded worker cannot decode unbounded numbers
+    of images at once.
+    """
+    global _optimize_slots
+    if _optimize_slots is None:
+        with _optimize_lock:
+            if _optimize_slots is None:
+                _optimize_slots = threading.BoundedSemaphore(
+                    settings.IMAGE_OPTIMIZE_CONCURRENCY
+                )
+    return _optimize_slots
 
 
 def upload_to(instance, filename):
     """
     Generate unique filename for uploaded images.
-    Format: images/{user_id}/{uuid}_{original_filename}
+    Format: images/[{hash}/]{user_id}/{uuid}_{original_filename}
     """
-    ext = filename.split('.')[-1]
     filename = f"{uuid.uuid4()}_{filename}"
-    return f'images/{instance.user.id}/{filename}'
+    return object_key('images', instance.user_id, filename)
+
+
+def thumbnail_upload_to(instance, filename):
+    """
+    Generate the storage path for an image's thumbnail rendition.
+    Format: thumbnails/[{hash}/]{user_id}/{filename}
+    """
+    return object_key('thumbnails', instance.user_id, filename)
 
 
 class Image(models.Model):
@@ -23,17 +122,190 @@ class Image(models.Model):
         related_name='images'
     )
     image = models.ImageField(upload_to=upload_to)
+    thumbnail = models.ImageField(
+        upload_to=thumbnail_upload_to,
+        blank=True,
+        editable=False
+    )
+    # Data URI of a tiny WebP and a '#rrggbb' colour, so clients can paint
+    # a tile before fetching anything. Filled by `backfill_previews` for
+    # older rows.
+    placeholder = models.TextField(blank=True, editable=False)
+    dominant_color = models.CharField(max_length=7, blank=True, editable=False)
+    # 64-bit perceptual hash (signed) and its 16-bit bands for
+    # near-duplicate lookups.
+    phash = models.BigIntegerField(null=True, blank=True, editable=False)
+    phash_band_0 = models.PositiveIntegerField(null=True, editable=False)
+    phash_band_1 = models.PositiveIntegerField(null=True, editable=False)
+    phash_band_2 = models.PositiveIntegerField(null=True, editable=False)
+    phash_band_3 = models.PositiveIntegerField(null=True, editable=False)
     title = models.CharField(max_length=255, blank=True)
     description = models.TextField(blank=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    size = models.PositiveBigIntegerField(null=True, blank=True)
+    # Size as uploaded when the original was optimized; `size` is what is
+    # stored. Null for originals that have not been through optimization.
+    original_size = models.PositiveBigIntegerField(null=True, blank=True)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-uploaded_at']
+        # Every listing is scoped to one user, so each index leads with
+        # user_id and ends with id to keep the sort order stable.
+        indexes = [
+            # Unscoped admin changelist ordering.
+            models.Index(
+                fields=['uploaded_at', 'id'],
+                name='image_uploaded_idx',
+            ),
+            models.Index(
+                fields=['user', 'uploaded_at', 'id'],
+                name='image_user_uploaded_idx',
+            ),
+            models.Index(
+                fields=['user', 'content_type', 'uploaded_at'],
+                name='image_user_type_uploaded_idx',
+            ),
+            models.Index(
+                fields=['user', 'size', 'id'],
+                name='image_user_size_idx',
+            ),
+            models.Index(
+                fields=['user', 'width', 'height'],
+                name='image_user_dimensions_idx',
+            ),
+            # Height filters without a width bound cannot use the above.
+            models.Index(
+                fields=['user', 'height'],
+                name='image_user_height_idx',
+            ),
+            models.Index(
+                fields=['user', 'title', 'id'],
+                name='image_user_title_idx',
+            ),
+            # Incremental exports (`since`) scan by modification time.
+            models.Index(
+                fields=['user', 'updated_at', 'id'],
+                name='image_user_updated_idx',
+            ),
+            # Pattern opclass so `title__startswith` can use an index
+            # regardless of the database collation.
+            models.Index(
+                fields=['user', 'title'],
+                name='image_user_title_prefix_idx',
+                opclasses=['int8_ops', 'varchar_pattern_ops'],
+            ),
+            # Multi-index hashing: near-duplicate candidates share at
+            # least one (nearly) equal band.
+            *(
+                models.Index(
+                    fields=['user', field],
+                    name=f'image_user_{field}_idx',
+                )
+                for field in PHASH_BAND_FIELDS
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.email} - {self.title or 'Untitled'}"
 
+    def save(self, *args, **kwargs):
+        uploaded = self.image and not self.image._committed
+        if uploaded:
+            with timed('pillow'):
+                self.populate_file_metadata()
+                self.optimize_original()
+                self.create_previews()
+            # Upload before opening the transaction so storage latency
+            # never holds database locks.
+            self.image.save(self.image.name, self.image.file, save=False)
+        # The row and the owner's usage counters (see signals.py) are
+        # written together, so a quota rejection rolls back the insert.
+        try:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+        except QuotaExceeded:
+            if uploaded:
+                self.image.delete(save=False)
+                if self.thumbnail:
+                    self.thumbnail.delete(save=False)
+            raise
+
+    def populate_file_metadata(self):
+        """
+        Record size, content type and dimensions of a newly assigned file.
+
+        Uses the Pillow image already opened during form validation when
+        available, so the upload is not decoded a second time.
+        """
+        upload = self.image.file
+        self.size = self.image.size
+        self.content_type = (
+            getattr(upload, 'content_type', None)
+            or mimetypes.guess_type(self.image.name)[0]
+            or ''
+        )
+        pil_image = getattr(upload, 'image', None)
+        if pil_image is not None:
+            self.width, self.height = pil_image.size
+        else:
+            self.width, self.height = get_image_dimensions(upload)
+
+    def optimize_original(self):
+        """
+        Replace a newly assigned file with its optimized version when
+        IMAGE_OPTIMIZE_ORIGINALS is set.
+        """
+        options = optimize_options()
+        if options is None:
+            return
+
+        upload = self.image.file
+        upload.seek(0)
+        try:
+            with optimize_slots():
+                optimized = optimize_image(upload.read(), **options)
+        except Exception:
+            # The upload already passed validation; store it as is.
+            logger.warning(
+                "Could not optimize %s", self.image.name, exc_info=True
+            )
+            return
+        finally:
+            upload.seek(0)
+        self.original_size = self.size
+        if optimized is None:
+            return
+
+        data, (self.width, self.height) = optimized
+        self.image = ContentFile(data, name=self.image.name)
+        self.size = len(data)
+
+    def create_previews(self):
+        """
+        Store a small JPEG rendition of a newly assigned file, and record
+        its inline placeholder, dominant colour and perceptual hash.
+
+        Previews (e.g. the admin changelist and gallery tiles) use these
+        instead of fetching the full-size original.
+        """
+        upload = self.image.file
+        upload.seek(0)
+        previews = render_previews(upload, settings.IMAGE_THUMBNAIL_SIZE)
+        upload.seek(0)
+        self.placeholder = previews['placeholder']
+        self.dominant_color = previews['dominant_color']
+        for field, value in phash_fields(previews['phash']).items():
+            setattr(self, field, value)
+        self.thumbnail.save(
+            thumbnail_name(self.image.name),
+            ContentFile(previews['thumbnail']),
+            save=False
+        )
+
     @property
     def image_url(self):
         """
@@ -43,3 +315,29 @@ class Image(models.Model):
             return self.image.url
         return None
 
+
+class ImageTombstone(models.Model):
+    """
+    Record of a deleted image, so incremental exports can tell clients
+    mirroring a catalogue which images to remove. Written by the
+    post_delete signal; removed with the owner's account, or by
+    `prune_tombstones` after IMAGE_TOMBSTONE_RETENTION_DAYS.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='image_tombstones'
+    )
+    image_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', 'deleted_at', 'id'],
+                name='tombstone_user_deleted_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: image {self.image_id} deleted"
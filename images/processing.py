@@ -0,0 +1,298 @@
+"""
+Pillow-side image processing shared by uploads and bulk imports.
+
+Nothing here touches the ORM or settings, so the functions can run in
+worker processes. Pillow is imported inside each function to keep it out
+of worker boot.
+"""
+import base64
+import os
+import uuid
+from io import BytesIO
+
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+ALLOWED_EXTENSIONS = ('jpg', 'jpeg', 'png', 'gif', 'webp')
+
+# Longest side of the inline placeholder, in pixels.
+PLACEHOLDER_SIZE = 16
+
+# Name in IMAGE_KEEP_METADATA that keeps the embedded colour profile; all
+# other names are EXIF tag names such as 'Copyright' or 'DateTimeOriginal'.
+ICC_PROFILE = 'icc_profile'
+EXIF_IFD = 0x8769
+ORIENTATION = 0x0112
+# Offsets to sub-IFDs, which are meaningless once copied on their own.
+IFD_POINTERS = (EXIF_IFD, 0x8825, 0xA005)
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def thumbnail_name(image_name):
+    """Return a unique thumbnail file name for an original's name."""
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    return f'{uuid.uuid4()}_{stem}.jpg'
+
+
+def render_previews(fp, size):
+    """
+    Render the previews of an image file from a single decode.
+
+    Returns a dict with `thumbnail`, JPEG bytes no larger than `size`;
+    `placeholder`, a data URI of a tiny WebP that clients can stretch and
+    blur while the real image loads; `dominant_color`, a '#rrggbb'
+    string; and `phash`, the image's perceptual_hash.
+    """
+    from PIL import Image as PILImage
+    from PIL import ImageOps
+
+    with PILImage.open(fp) as source:
+        # Let the JPEG decoder downscale while decoding.
+        source.draft('RGB', size)
+        # Previews show the photo upright, as viewers display it.
+        rendition = ImageOps.exif_transpose(source).convert('RGB')
+    rendition.thumbnail(size)
+
+    buffer = BytesIO()
+    rendition.save(buffer, format='JPEG', quality=80, optimize=True)
+    return {
+        'thumbnail': buffer.getvalue(),
+        'placeholder': render_placeholder(rendition),
+        'dominant_color': dominant_color(rendition),
+        'phash': perceptual_hash(rendition),
+    }
+
+
+def render_placeholder(image):
+    tiny = image.copy()
+    tiny.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+    buffer = BytesIO()
+    tiny.save(buffer, format='WEBP', quality=40, method=6)
+    encoded = base64.b64encode(buffer.getvalue()).decode('ascii')
+    return f'data:image/webp;base64,{encoded}'
+
+
+def dominant_color(image):
+    """
+    Return the most common colour of an RGB image after reducing it to a
+    small palette, so that noise does not split one colour into many.
+    """
+    from PIL import Image as PILImage
+
+    sample = image.copy()
+    sample.thumbnail((64, 64))
+    palette_image = sample.quantize(
+        colors=8, method=PILImage.Quantize.MEDIANCUT
+    )
+    count, index = max(palette_image.getcolors())
+    palette = palette_image.getpalette()
+    red, green, blue = palette[index * 3:index * 3 + 3]
+    return f'#{red:02x}{green:02x}{blue:02x}'
+
+
+def perceptual_hash(image):
+    """
+    Return the 64-bit difference hash (dHash) of an image as an unsigned
+    int.
+
+    Each bit compares two horizontally adjacent pixels of a 9x8 greyscale
+    reduction, so resized, recompressed or slightly edited copies of a
+    photo differ from the original in only a few bits.
+    """
+    from PIL import Image as PILImage
+
+    pixels = image.convert('L').resize(
+        (9, 8), PILImage.Resampling.LANCZOS
+    ).tobytes()
+    value = 0
+    for row in range(8):
+        for column in range(8):
+            left = pixels[row * 9 + column]
+            value = value << 1 | (left > pixels[row * 9 + column + 1])
+    return value
+
+
+def kept_exif(exif, keep):
+    """
+    Return EXIF bytes holding only the allowlisted tags of `exif`, or b''.
+
+    A non-default Orientation is always kept: optimize_image never rotates
+    the pixels, so viewers still need it to show the photo upright.
+    """
+    from PIL import ExifTags
+    from PIL import Image as PILImage
+
+    kept = PILImage.Exif()
+    for tag, value in exif.items():
+        if tag in IFD_POINTERS:
+            continue
+        if tag == ORIENTATION:
+            if value != 1:
+                kept[tag] = value
+        elif ExifTags.TAGS.get(tag) in keep:
+            kept[tag] = value
+    details = {
+        tag: value for tag, value in exif.get_ifd(EXIF_IFD).items()
+        if ExifTags.TAGS.get(tag) in keep
+    }
+    if details:
+        kept[EXIF_IFD] = details
+    return kept.tobytes() if len(kept) else b''
+
+
+def jpeg_segment(marker, payload):
+    return bytes((0xFF, marker)) + (len(payload) + 2).to_bytes(2, 'big') + payload
+
+
+def strip_jpeg(data, exif, keep_icc):
+    """
+    Rewrite a JPEG's marker segments without decoding it.
+
+    Drops EXIF/XMP/IPTC (and the thumbnails inside them), comments and,
+    unless `keep_icc`, the ICC profile, and inserts `exif` as the only
+    APP1 segment. Segments that affect decoding (JFIF, Adobe) and all
+    image data are copied byte for byte, so the pixels are unchanged.
+    """
+    if data[:2] != b'\xff\xd8':
+        raise InvalidImage("Not a JPEG file.")
+    head, body = [], []
+    scanned = False
+    position = 2
+    while position + 1 < len(data):
+        if data[position] != 0xFF:
+            # Junk between segments; Pillow skips it as well.
+            position += 1
+            continue
+        marker = data[position + 1]
+        if marker == 0xFF:
+            position += 1
+            continue
+        if marker == 0xDA:
+            # Start of scan: the rest is entropy-coded data.
+            body.append(data[position:])
+            scanned = True
+            break
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            body.append(data[position:position + 2])
+            position += 2
+            continue
+        length = int.from_bytes(data[position + 2:position + 4], 'big')
+        if length < 2 or position + 2 + length > len(data):
+            raise InvalidImage("Truncated JPEG segment.")
+        segment = data[position:position + 2 + length]
+        position += 2 + length
+
+        payload = segment[4:]
+        if marker == 0xE0 and payload.startswith(b'JFIF\0'):
+            head.append(segment)
+        elif marker == 0xEE and payload.startswith(b'Adobe'):
+            body.append(segment)
+        elif marker == 0xE2 and payload.startswith(b'ICC_PROFILE\0'):
+            if keep_icc:
+                body.append(segment)
+        elif 0xE0 <= marker <= 0xEF or marker == 0xFE:
+            continue
+        else:
+            body.append(segment)
+    if not scanned:
+        raise InvalidImage("JPEG has no image data.")
+
+    if exif:
+        head.append(jpeg_segment(0xE1, exif))
+    return b''.join([b'\xff\xd8', *head, *body])
+
+
+def optimize_image(data, keep=(), max_pixels=None):
+    """
+    Strip metadata from a JPEG or PNG original and optimize it losslessly.
+
+    Only the metadata named in `keep` is retained, plus the EXIF
+    orientation, which is left for viewers to apply. JPEGs are rewritten
+    segment by segment, without decoding. PNGs are re-encoded with zlib
+    optimization. Returns (data, (width, height)), or None when the format
+    is not handled, the image exceeds `max_pixels`, or nothing would be
+    saved.
+    """
+    from PIL import Image as PILImage
+
+    keep = frozenset(keep)
+    with PILImage.open(BytesIO(data)) as source:
+        if source.format not in ('JPEG', 'PNG'):
+            return None
+        width, height = source.size
+        if max_pixels is not None and width * height > max_pixels:
+            return None
+
+        metadata = kept_exif(source.getexif(), keep)
+        icc_profile = None
+        if ICC_PROFILE in keep:
+            icc_profile = source.info.get('icc_profile')
+
+        if source.format == 'JPEG':
+            optimized = strip_jpeg(data, metadata, icc_profile is not None)
+        else:
+            options = {'optimize': True}
+            if metadata:
+                options['exif'] = metadata
+            if icc_profile:
+                options['icc_profile'] = icc_profile
+            if 'transparency' in source.info:
+                options['transparency'] = source.info['transparency']
+            buffer = BytesIO()
+            source.save(buffer, format='PNG', **options)
+            optimized = buffer.getvalue()
+
+    if len(optimized) >= len(data):
+        return None
+    return optimized, (width, height)
+
+
+def sniff_image(data, name, thumbnail_size, optimize=None):
+    """
+    Validate an image file's bytes and describe it.
+
+    Applies the same size and extension rules as the upload API, checks
+    that Pillow can decode the file, and renders its previews. With
+    `optimize`, a dict of optimize_image keyword arguments, the original
+    is optimized first. Returns a dict of data, content_type,
+    original_size, size, width, height and the render_previews values;
+    raises InvalidImage when the file would be rejected.
+    """
+    from PIL import Image as PILImage
+
+    if len(data) > MAX_IMAGE_BYTES:
+        raise InvalidImage("Image file too large.")
+    ext = name.rsplit('.', 1)[-1].lower()
+    if ext not in ALLOWED_EXTENSIONS:
+        raise InvalidImage("Unsupported file extension.")
+
+    try:
+        with PILImage.open(BytesIO(data)) as image:
+            image.verify()
+            content_type = PILImage.MIME.get(image.format, '')
+            width, height = image.size
+        original_size = optimized = None
+        if optimize:
+            try:
+                optimized = optimize_image(data, **optimize)
+            except Exception:
+                # Files Pillow accepts are stored as uploaded.
+                optimized = None
+            else:
+                original_size = len(data)
+        if optimized is not None:
+            data, (width, height) = optimized
+        previews = render_previews(BytesIO(data), thumbnail_size)
+    except Exception as exc:
+        raise InvalidImage(f"Not a valid image: {exc}") from exc
+
+    return {
+        'data': data,
+        'content_type': content_type,
+        'original_size': original_size,
+        'size': len(data),
+        'width': width,
+        'height': height,
+        **previews,
+    }
@@ -1,9 +1,15 @@
+from django.conf import settings
 from rest_framework import serializers
+from rest_framework.settings import api_settings
+from core.serializers import TimedDataMixin, TimedListSerializer
+from .duplicates import MAX_DISTANCE
 from .models import Image
+from .processing import ALLOWED_EXTENSIONS, MAX_IMAGE_BYTES
+from users.models import QuotaExceeded, UserUsage
 from users.serializers import UserSerializer
 
 
-class ImageSerializer(serializers.ModelSerializer):
+class ImageSerializer(TimedDataMixin, serializers.ModelSerializer):
     """
     Serializer for listing and retrieving images.
     """
@@ -13,14 +19,18 @@ class ImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Image
         fields = ('id', 'user', 'image', 'image_url', 'title', 'description',
-                  'uploaded_at', 'updated_at')
-        read_only_fields = ('id', 'user', 'uploaded_at', 'updated_at')
+                  'content_type', 'size', 'original_size', 'width', 'height',
+                  'placeholder', 'dominant_color', 'uploaded_at', 'updated_at')
+        read_only_fields = ('id', 'user', 'content_type', 'size',
+                            'original_size', 'width', 'height', 'placeholder',
+                            'dominant_color', 'uploaded_at', 'updated_at')
+        list_serializer_class = TimedListSerializer
 
     def get_image_url(self, obj):
         return obj.image_url
 
 
-class ImageUploadSerializer(serializers.ModelSerializer):
+class ImageUploadSerializer(TimedDataMixin, serializers.ModelSerializer):
     """
     Serializer for uploading images.
     """
@@ -31,17 +41,160 @@ class ImageUploadSerializer(serializers.ModelSerializer):
 
     def validate_image(self, value):
         # Validate image file size (max 10MB)
-        if value.size > 10 * 1024 * 1024:
+        if value.size > MAX_IMAGE_BYTES:
             raise serializers.ValidationError(
                 "Image file too large. Size should not exceed 10 MB."
             )
 
         # Validate image file type
-        allowed_extensions = ['jpg', 'jpeg', 'png', 'gif', 'webp']
         ext = value.name.split('.')[-1].lower()
-        if ext not in allowed_extensions:
+        if ext not in ALLOWED_EXTENSIONS:
             raise serializers.ValidationError(
-                f"Unsupported file extension. Allowed types: {', '.join(allowed_extensions)}"
+                f"Unsupported file extension. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
             )
 
         return value
+
+    def validate(self, attrs):
+        # Rejects uploads that are clearly over quota before any work is
+        # done. The quotas are enforced atomically when the usage counter
+        # is incremented (see UserUsageManager.reserve).
+        if (settings.IMAGE_QUOTA_MAX_COUNT is None
+                and settings.IMAGE_QUOTA_MAX_BYTES is None):
+            return attrs
+
+        user = self.context['request'].user
+        usage = UserUsage.objects.filter(user=user).first() or UserUsage(user=user)
+        try:
+            UserUsage.objects.check_quota(usage, attrs['image'].size)
+        except QuotaExceeded as exc:
+            raise serializers.ValidationError(str(exc))
+        return attrs
+
+    def create(self, validated_data):
+        try:
+            return super().create(validated_data)
+        except QuotaExceeded as exc:
+            # Another upload used up the quota after validation.
+            raise serializers.ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: [str(exc)]}
+            )
+
+
+class ImageListQuerySerializer(serializers.Serializer):
+    """
+    Serializer for validating image list filter and sort parameters.
+    """
+    # Each sort key is backed by a (user, key, ...) index on Image.
+    ORDERING_CHOICES = ('uploaded_at', '-uploaded_at', 'size', '-size',
+                        'title', '-title')
+
+    uploaded_after = serializers.DateTimeField(required=False)
+    uploaded_before = serializers.DateTimeField(required=False)
+    content_type = serializers.CharField(required=False, max_length=100)
+    min_size = serializers.IntegerField(required=False, min_value=0)
+    max_size = serializers.IntegerField(required=False, min_value=0)
+    min_width = serializers.IntegerField(required=False, min_value=0)
+    max_width = serializers.IntegerField(required=False, min_value=0)
+    min_height = serializers.IntegerField(required=False, min_value=0)
+    max_height = serializers.IntegerField(required=False, min_value=0)
+    title_prefix = serializers.CharField(required=False, max_length=255)
+    ordering = serializers.ChoiceField(
+        choices=ORDERING_CHOICES,
+        required=False,
+        default='-uploaded_at'
+    )
+
+    # Query parameter -> ORM lookup on Image.
+    LOOKUPS = {
+        'uploaded_after': 'uploaded_at__gte',
+        'uploaded_before': 'uploaded_at__lt',
+        'content_type': 'content_type',
+        'min_size': 'size__gte',
+        'max_size': 'size__lte',
+        'min_width': 'width__gte',
+        'max_width': 'width__lte',
+        'min_height': 'height__gte',
+        'max_height': 'height__lte',
+        'title_prefix': 'title__startswith',
+    }
+
+    def filter_queryset(self, queryset):
+        """
+        Apply the validated filters and ordering to an Image queryset.
+        """
+        filters = {
+            lookup: self.validated_data[param]
+            for param, lookup in self.LOOKUPS.items()
+            if param in self.validated_data
+        }
+        ordering = self.validated_data['ordering']
+        # Break ties on id in the same direction so the order is stable.
+        tiebreaker = '-id' if ordering.startswith('-') else 'id'
+        return queryset.filter(**filters).order_by(ordering, tiebreaker)
+
+
+class NearDuplicateSerializer(ImageSerializer):
+    """
+    Serializer for an image matched as a near-duplicate, with its Hamming
+    distance from the queried image.
+    """
+    distance = serializers.IntegerField(read_only=True)
+
+    class Meta(ImageSerializer.Meta):
+        fields = ImageSerializer.Meta.fields + ('distance',)
+
+
+class DuplicateQuerySerializer(serializers.Serializer):
+    """
+    Serializer for validating near-duplicate search parameters.
+    """
+    max_distance = serializers.IntegerField(
+        required=False,
+        min_value=0,
+        max_value=MAX_DISTANCE,
+        default=6,
+        help_text='Maximum Hamming distance between 64-bit perceptual hashes'
+    )
+
+
+class DuplicateGroupsSerializer(serializers.Serializer):
+    """
+    Serializer for groups of near-duplicate image ids.
+    """
+    groups = serializers.ListField(
+        child=serializers.ListField(child=serializers.IntegerField())
+    )
+    truncated = serializers.BooleanField(
+        help_text=(
+            'Whether only the most recent images of a large library were '
+            'grouped'
+        )
+    )
+
+
+class ImageExportQuerySerializer(serializers.Serializer):
+    """
+    Serializer for validating catalogue export parameters.
+    """
+    since = serializers.DateTimeField(
+        required=False,
+        help_text=(
+            'Only export images updated, and tombstones of images deleted, '
+            'at or after this time; pass the X-Export-Cursor of the '
+            'previous export. If it is older than the tombstone retention, '
+            'a full export is sent instead'
+        )
+    )
+
+
+class ImageArchiveSerializer(serializers.Serializer):
+    """
+    Serializer for validating the images selected for a ZIP download.
+    """
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        min_length=1,
+        max_length=settings.IMAGE_ARCHIVE_MAX_IMAGES,
+        help_text='IDs of the images to include'
+    )
@@ -0,0 +1,33 @@
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from users.models import UserUsage
+from .models import Image, ImageTombstone
+
+
+@receiver(post_save, sender=Image)
+def record_image_created(sender, instance, created, raw=False, **kwargs):
+    """
+    Add a new image to its owner's usage counters, enforcing the quotas
+    in the same transaction as the insert.
+    """
+    if created and not raw:
+        UserUsage.objects.reserve(instance.user_id, instance.size or 0)
+
+
+@receiver(post_delete, sender=Image)
+def record_image_deleted(sender, instance, **kwargs):
+    """
+    Remove a deleted image from its owner's usage counters and leave a
+    tombstone for incremental exports.
+    """
+    UserUsage.objects.adjust(
+        instance.user_id, -1, -(instance.size or 0), create=False
+    )
+    # When the owner is being deleted, their tombstones would go too.
+    origin = kwargs.get('origin')
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin_model is Image:
+        ImageTombstone.objects.create(
+            user_id=instance.user_id, image_id=instance.pk
+        )
@@ -0,0 +1,11 @@
+'use strict';
+{
+    const $ = django.jQuery;
+
+    // Apply an autocomplete list filter as soon as a value is picked.
+    $(function() {
+        $('.autocomplete-filter select').on('change', function() {
+            this.form.submit();
+        });
+    });
+}
@@ -0,0 +1,81 @@
+"""
+Storage helpers for bulk maintenance operations.
+
+S3 backends get server-side implementations; any other Django storage
+falls back to the generic Storage API.
+"""
+
+
+def is_s3(storage):
+    # Only look the class up when django-storages is already loaded, so
+    # local deployments never import boto3.
+    import sys
+    s3 = sys.modules.get('storages.backends.s3')
+    return s3 is not None and isinstance(storage, s3.S3Storage)
+
+
+def s3_key(storage, name):
+    from storages.utils import clean_name
+    return storage._normalize_name(clean_name(name))
+
+
+def copy_object(storage, source, target):
+    """
+    Copy `source` to `target` within one storage.
+
+    On S3 this is a server-side CopyObject, so no bytes pass through this
+    process. Raises if the generic fallback could not write `target`.
+    """
+    if is_s3(storage):
+        extra = {'ACL': storage.default_acl} if storage.default_acl else {}
+        storage.connection.meta.client.copy_object(
+            Bucket=storage.bucket_name,
+            Key=s3_key(storage, target),
+            CopySource={
+                'Bucket': storage.bucket_name,
+                'Key': s3_key(storage, source),
+            },
+            **extra
+        )
+        return
+
+    with storage.open(source) as content:
+        saved = storage.save(target, content)
+    if saved != target:
+        storage.delete(saved)
+        raise FileExistsError(f"Could not copy {source} to {target}")
+
+
+# DeleteObjects accepts at most 1000 keys per request.
+S3_DELETE_BATCH_SIZE = 1000
+
+
+def delete_objects(storage, names):
+    """
+    Delete many objects from one storage.
+
+    On S3 the keys are removed with batched DeleteObjects requests instead
+    of one request per object. Deleting a missing object is not an error.
+    """
+    names = list(names)
+    if not is_s3(storage):
+        for name in names:
+            storage.delete(name)
+        return
+
+    client = storage.connection.meta.client
+    for start in range(0, len(names), S3_DELETE_BATCH_SIZE):
+        batch = names[start:start + S3_DELETE_BATCH_SIZE]
+        response = client.delete_objects(
+            Bucket=storage.bucket_name,
+            Delete={
+                'Objects': [{'Key': s3_key(storage, name)} for name in batch],
+                'Quiet': True,
+            },
+        )
+        errors = response.get('Errors')
+        if errors:
+            raise OSError(
+                f"Could not delete {len(errors)} objects, e.g. "
+                f"{errors[0]['Key']}: {errors[0]['Message']}"
+            )
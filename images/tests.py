@@ -1,8 +1,58 @@
+import base64
+import datetime
+import decimal
+import itertools
+import json
+import os
 import pytest
-from io import BytesIO
+import random
+import shutil
+import tarfile
+import time
+import zipfile
+from io import BytesIO, StringIO
 from PIL import Image as PILImage
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
-from .models import Image
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+from core.renderers import FastJSONRenderer
+from users.models import QuotaExceeded, UserUsage
+from .admin import EstimatedCountPaginator
+from . import archive
+from .duplicates import (
+    MAX_DISTANCE, candidates, duplicate_groups, group_hashes
+)
+from .export import export_lines
+from .importer import BulkImporter
+from .models import (
+    PHASH_BAND_FIELDS, Image, ImageTombstone, phash_fields, rekey
+)
+from .processing import (
+    MAX_IMAGE_BYTES, InvalidImage, optimize_image, strip_jpeg
+)
+from .serializers import (
+    ImageListQuerySerializer, ImageSerializer, ImageUploadSerializer
+)
+
+User = get_user_model()
+
+
+def make_upload(name='test_image.jpg', size=(100, 100), fmt='JPEG',
+                color='red'):
+    """Build an in-memory image upload."""
+    image_io = BytesIO()
+    PILImage.new('RGB', size, color=color).save(image_io, format=fmt)
+    return SimpleUploadedFile(
+        name=name,
+        content=image_io.getvalue(),
+        content_type=PILImage.MIME[fmt]
+    )
 
 
 @pytest.mark.django_db
@@ -108,3 +158,1414 @@ class TestImageUpload:
         # If it's over 10MB, it should fail
         if large_file.size > 10 * 1024 * 1024:
             assert response.status_code == 400
+
+
+@pytest.mark.django_db
+class TestImageListFiltering:
+    """Tests for image list filter and sort parameters."""
+
+    @pytest.fixture
+    def images(self, create_user):
+        return [
+            Image.objects.create(user=create_user, title='alpha',
+                                 image=make_upload('a.jpg', (100, 50))),
+            Image.objects.create(user=create_user, title='beta',
+                                 image=make_upload('b.png', (300, 200), 'PNG')),
+            Image.objects.create(user=create_user, title='alphabet',
+                                 image=make_upload('c.png', (20, 20), 'PNG')),
+        ]
+
+    def test_metadata_recorded_on_create(self, images):
+        """Test that size, content type and dimensions are stored."""
+        image = images[1]
+
+        assert image.content_type == 'image/png'
+        assert image.size == image.image.size
+        assert (image.width, image.height) == (300, 200)
+
+    def test_filter_by_content_type(self, authenticated_client, images):
+        """Test filtering by content type."""
+        response = authenticated_client.get(
+            '/api/images/', {'content_type': 'image/png'}
+        )
+
+        assert response.status_code == 200
+        assert {row['title'] for row in response.data} == {'beta', 'alphabet'}
+
+    def test_filter_by_title_prefix_and_dimensions(self, authenticated_client,
+                                                   images):
+        """Test combining title prefix and dimension filters."""
+        response = authenticated_client.get(
+            '/api/images/', {'title_prefix': 'alpha', 'min_width': 50}
+        )
+
+        assert [row['title'] for row in response.data] == ['alpha']
+
+    def test_filter_by_upload_date(self, authenticated_client, images):
+        """Test filtering by upload date range."""
+        cutoff = images[1].uploaded_at
+        response = authenticated_client.get(
+            '/api/images/', {'uploaded_after': cutoff.isoformat()}
+        )
+
+        assert {row['id'] for row in response.data} == {
+            images[1].id, images[2].id
+        }
+
+    def test_sort_by_size(self, authenticated_client, images):
+        """Test sorting by a whitelisted key."""
+        response = authenticated_client.get('/api/images/', {'ordering': 'size'})
+        sizes = [row['size'] for row in response.data]
+
+        assert sizes == sorted(sizes)
+
+    def test_invalid_parameters_rejected(self, authenticated_client, images):
+        """Test that unknown sort keys and bad values return 400."""
+        response = authenticated_client.get(
+            '/api/images/', {'ordering': 'description', 'min_size': 'big'}
+        )
+
+        assert response.status_code == 400
+        assert 'ordering' in response.data
+        assert 'min_size' in response.data
+
+    def test_backfill_metadata(self, authenticated_client, create_user,
+                               images):
+        """Test that legacy rows get metadata from storage."""
+        Image.objects.update(
+            size=None, content_type='', width=None, height=None
+        )
+        UserUsage.objects.filter(user=create_user).update(total_bytes=0)
+
+        call_command(
+            'backfill_metadata', batch_size=2,
+            stdout=StringIO(), stderr=StringIO()
+        )
+
+        for image in images:
+            expected = (image.size, image.content_type,
+                        image.width, image.height)
+            image.refresh_from_db()
+            assert (image.size, image.content_type,
+                    image.width, image.height) == expected
+        usage = UserUsage.objects.get(user=create_user)
+        assert usage.total_bytes == sum(image.size for image in images)
+        response = authenticated_client.get(
+            '/api/images/', {'content_type': 'image/png', 'min_width': 100}
+        )
+        assert [row['title'] for row in response.data] == ['beta']
+
+    def test_backfill_metadata_keeps_recorded_values(self, create_user,
+                                                     images):
+        """Test that only missing fields are filled."""
+        Image.objects.filter(pk=images[0].pk).update(
+            content_type='', title='kept'
+        )
+
+        call_command('backfill_metadata', stdout=StringIO())
+
+        image = Image.objects.get(pk=images[0].pk)
+        assert image.content_type == 'image/jpeg'
+        assert image.title == 'kept'
+        usage = UserUsage.objects.get(user=create_user)
+        assert usage.total_bytes == sum(image.size for image in images)
+
+
+def seed_library(user, count=20000):
+    """
+    Insert `count` rows of random metadata for `user` and refresh the
+    planner statistics. PostgreSQL only; the rows have no stored files.
+
+    Index choices are only meaningful against realistic statistics: on a
+    near-empty table any index on user_id looks as good as another.
+    """
+    rng = random.Random(0.5)
+    content_types = ['image/jpeg', 'image/png', 'image/gif', 'image/webp']
+    images = Image.objects.bulk_create(
+        [
+            Image(
+                user=user,
+                image=f'images/{n}.jpg',
+                title=f'{chr(97 + rng.randrange(26))}{n}',
+                content_type=rng.choice(content_types),
+                size=rng.randrange(10000000),
+                width=1 + rng.randrange(5000),
+                height=1 + rng.randrange(5000),
+            )
+            for n in range(1, count + 1)
+        ],
+        batch_size=2000
+    )
+    with connection.cursor() as cursor:
+        # bulk_create stamps every row with the current time; spread the
+        # uploads one hour apart instead.
+        cursor.execute(
+            """
+            UPDATE images_image
+            SET uploaded_at = now() - (id - %s) * interval '1 hour'
+            WHERE user_id = %s
+            """,
+            [images[0].pk - 1, user.pk]
+        )
+        cursor.execute('ANALYZE images_image')
+
+
+def days_ago(days):
+    return (timezone.now() - datetime.timedelta(days=days)).isoformat()
+
+
+@pytest.mark.django_db
+class TestImageListIndexes:
+    """EXPLAIN-based tests that list filters are served by their index."""
+
+    @pytest.fixture(scope='class')
+    def owner(self, django_db_setup, django_db_blocker):
+        """
+        Seed two libraries once for the whole class, since seeding is slow,
+        and return the owner of the one that is queried.
+        """
+        if connection.vendor != 'postgresql':
+            pytest.skip('EXPLAIN plans are PostgreSQL specific')
+        with django_db_blocker.unblock():
+            # A second library, so that scoping to one user is selective.
+            users = [
+                User.objects.create_user(
+                    email=f'{name}@example.com', username=name, password='pw'
+                )
+                for name in ('other', 'owner')
+            ]
+            for user in users:
+                seed_library(user)
+            yield users[-1]
+            with connection.cursor() as cursor:
+                # The rows have no files, so skip the per-row delete signals.
+                cursor.execute(
+                    'DELETE FROM images_image WHERE user_id = ANY(%s)',
+                    [[user.pk for user in users]]
+                )
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
+
+    @pytest.fixture(autouse=True)
+    def no_seqscan(self, owner):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    # (params, expected index, whether the index must also give the order)
+    @pytest.mark.parametrize('params, index, presorted', [
+        ({}, 'image_user_uploaded_idx', True),
+        ({'ordering': 'uploaded_at'}, 'image_user_uploaded_idx', True),
+        ({'uploaded_after': days_ago(7)}, 'image_user_uploaded_idx', False),
+        ({'uploaded_after': days_ago(30), 'uploaded_before': days_ago(26)},
+         'image_user_uploaded_idx', False),
+        ({'content_type': 'image/webp'}, 'image_user_type_uploaded_idx', True),
+        ({'content_type': 'image/webp', 'uploaded_after': days_ago(7)},
+         'image_user_type_uploaded_idx', False),
+        ({'min_size': 9900000}, 'image_user_size_idx', False),
+        ({'min_size': 1024, 'max_size': 40960, 'ordering': '-size'},
+         'image_user_size_idx', False),
+        ({'ordering': 'size'}, 'image_user_size_idx', True),
+        ({'min_width': 4900, 'max_width': 5000},
+         'image_user_dimensions_idx', False),
+        ({'min_width': 4950, 'min_height': 4000},
+         'image_user_dimensions_idx', False),
+        ({'min_height': 4900}, 'image_user_height_idx', False),
+        ({'title_prefix': 'holiday'}, 'image_user_title_prefix_idx', False),
+        ({'ordering': 'title'}, 'image_user_title_idx', True),
+        ({'ordering': '-title'}, 'image_user_title_idx', True),
+    ])
+    def test_filter_uses_index(self, owner, params, index, presorted):
+        """Test that each supported filter and sort uses its own index."""
+        if presorted:
+            # Sorting a whole unfiltered library is often cheaper than an
+            # ordered index scan; check that the index can give the order.
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_sort = off')
+        query = ImageListQuerySerializer(data=params)
+        query.is_valid(raise_exception=True)
+        queryset = query.filter_queryset(Image.objects.filter(user=owner))
+        plan = queryset.explain()
+
+        assert index in plan
+        if presorted:
+            # An incremental sort that only breaks ties on id is fine.
+            assert not plan.startswith('Sort ')
+
+
+@pytest.mark.django_db
+class TestImageAdmin:
+    """Tests for the image admin changelist."""
+
+    @pytest.fixture
+    def admin_client(self, client, db):
+        admin_user = User.objects.create_superuser(
+            email='admin@example.com',
+            username='admin',
+            password='AdminPassword123'
+        )
+        client.force_login(admin_user)
+        return client
+
+    @pytest.fixture
+    def images(self, db):
+        users = [
+            User.objects.create_user(
+                email=f'owner{i}@example.com',
+                username=f'owner{i}',
+                password='TestPassword123'
+            )
+            for i in range(5)
+        ]
+        return [
+            Image.objects.create(user=user, title=f'Image {i}',
+                                 image=make_upload(f'{i}.jpg'))
+            for i, user in enumerate(users)
+        ]
+
+    def test_thumbnail_created_on_upload(self, create_image):
+        """Test that a small rendition is stored with each image."""
+        create_image.thumbnail.open()
+        with PILImage.open(create_image.thumbnail) as thumbnail:
+            assert max(thumbnail.size) <= 200
+            assert thumbnail.format == 'JPEG'
+
+    def test_changelist_query_count_is_constant(self, admin_client, images,
+                                                django_assert_max_num_queries):
+        """Test that users are not queried once per row."""
+        with django_assert_max_num_queries(8):
+            response = admin_client.get('/admin/images/image/')
+
+        assert response.status_code == 200
+        assert b'loading="lazy"' in response.content
+        for image in images:
+            assert image.thumbnail.url.encode() in response.content
+            assert image.image.url.encode() not in response.content
+
+    def test_changelist_user_filter(self, admin_client, images):
+        """Test filtering by user through the autocomplete filter."""
+        owner = images[0].user
+        response = admin_client.get(
+            '/admin/images/image/', {'user__id__exact': owner.id}
+        )
+
+        assert response.status_code == 200
+        assert list(response.context['cl'].result_list) == [images[0]]
+        # Only the selected user is rendered into the filter widget.
+        assert owner.email.encode() in response.content
+        assert images[1].user.email.encode() not in response.content
+
+    def test_paginator_uses_estimate_for_unfiltered_table(self, images,
+                                                          settings):
+        """Test that reltuples replaces COUNT(*) above the threshold."""
+        if connection.vendor != 'postgresql':
+            pytest.skip('reltuples estimates are PostgreSQL specific')
+        settings.IMAGE_ADMIN_ESTIMATED_COUNT_THRESHOLD = 0
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE images_image')
+
+        unfiltered = EstimatedCountPaginator(Image.objects.all(), 100)
+        filtered = EstimatedCountPaginator(
+            Image.objects.filter(user=images[0].user), 100
+        )
+
+        assert unfiltered.count == len(images)
+        assert filtered.count == 1
+
+
+@pytest.mark.django_db
+class TestImageQuota:
+    """Tests for per-user usage counters and upload quotas."""
+
+    def test_counters_follow_create_and_delete(self, authenticated_client,
+                                               create_image):
+        """Test that usage is updated on create and delete."""
+        usage = UserUsage.objects.get(user=create_image.user)
+        assert (usage.image_count, usage.total_bytes) == (1, create_image.size)
+
+        authenticated_client.delete(f'/api/images/{create_image.id}/delete/')
+
+        usage.refresh_from_db()
+        assert (usage.image_count, usage.total_bytes) == (0, 0)
+
+    def test_upload_does_not_aggregate(self, authenticated_client, sample_image,
+                                       settings):
+        """Test that quota enforcement never runs COUNT/SUM queries."""
+        settings.IMAGE_QUOTA_MAX_COUNT = 10
+        settings.IMAGE_QUOTA_MAX_BYTES = 10 * 1024 * 1024
+        with CaptureQueriesContext(connection) as queries:
+            response = authenticated_client.post(
+                '/api/images/upload/', {'image': sample_image},
+                format='multipart'
+            )
+
+        assert response.status_code == 201
+        sql = ' '.join(query['sql'].upper() for query in queries)
+        assert 'COUNT(' not in sql
+        assert 'SUM(' not in sql
+
+    def test_count_quota_enforced(self, authenticated_client, create_image,
+                                  sample_image, settings):
+        """Test that uploads beyond the image count quota are rejected."""
+        settings.IMAGE_QUOTA_MAX_COUNT = 1
+        response = authenticated_client.post(
+            '/api/images/upload/', {'image': sample_image}, format='multipart'
+        )
+
+        assert response.status_code == 400
+        assert Image.objects.filter(user=create_image.user).count() == 1
+
+    def test_bytes_quota_enforced(self, authenticated_client, sample_image,
+                                  settings):
+        """Test that uploads beyond the storage quota are rejected."""
+        settings.IMAGE_QUOTA_MAX_BYTES = sample_image.size - 1
+        response = authenticated_client.post(
+            '/api/images/upload/', {'image': sample_image}, format='multipart'
+        )
+
+        assert response.status_code == 400
+
+    def test_quota_boundary(self, authenticated_client, create_image,
+                            settings):
+        """Test that the last upload within quota succeeds and the next fails."""
+        upload = make_upload()
+        settings.IMAGE_QUOTA_MAX_COUNT = 2
+        settings.IMAGE_QUOTA_MAX_BYTES = create_image.size + upload.size
+
+        response = authenticated_client.post(
+            '/api/images/upload/', {'image': upload}, format='multipart'
+        )
+        assert response.status_code == 201
+        response = authenticated_client.post(
+            '/api/images/upload/', {'image': make_upload()},
+            format='multipart'
+        )
+        assert response.status_code == 400
+
+        usage = UserUsage.objects.get(user=create_image.user)
+        assert usage.image_count == 2
+        assert usage.total_bytes == settings.IMAGE_QUOTA_MAX_BYTES
+
+    def test_quota_enforced_at_insert(self, authenticated_client, create_image,
+                                      settings, monkeypatch):
+        """
+        Test that an upload passing validation before a concurrent one
+        used up the quota is rejected when its row is inserted.
+        """
+        settings.IMAGE_QUOTA_MAX_COUNT = 1
+        monkeypatch.setattr(
+            ImageUploadSerializer, 'validate', lambda self, attrs: attrs
+        )
+        response = authenticated_client.post(
+            '/api/images/upload/', {'image': make_upload()},
+            format='multipart'
+        )
+
+        assert response.status_code == 400
+        assert 'Image quota exceeded' in response.json()['non_field_errors'][0]
+        assert Image.objects.filter(user=create_image.user).count() == 1
+        usage = UserUsage.objects.get(user=create_image.user)
+        assert (usage.image_count, usage.total_bytes) == (1, create_image.size)
+
+    def test_rejected_insert_removes_objects(self, create_image, settings):
+        """Test that files uploaded for a row over quota are deleted."""
+        settings.IMAGE_QUOTA_MAX_BYTES = create_image.size
+        storage = Image._meta.get_field('image').storage
+        user_id = create_image.user_id
+
+        def stored():
+            return [
+                storage.listdir(f'{root}/{user_id}')[1]
+                for root in ('images', 'thumbnails')
+            ]
+
+        before = stored()
+        with pytest.raises(QuotaExceeded):
+            Image.objects.create(user=create_image.user, image=make_upload())
+
+        assert stored() == before
+        assert Image.objects.filter(user=create_image.user).count() == 1
+
+
+@pytest.mark.django_db
+class TestImageKeyLayout:
+    """Tests for the hashed key layout and the key migration command."""
+
+    def test_hashed_layout(self, create_user, settings):
+        """Test that new uploads get a hashed prefix ahead of the user id."""
+        settings.IMAGE_KEY_STRATEGY = 'hashed'
+        image = Image.objects.create(user=create_user, image=make_upload())
+
+        for name in (image.image.name, image.thumbnail.name):
+            root, prefix, user_id, filename = name.split('/')
+            assert len(prefix) == settings.IMAGE_KEY_HASH_PREFIX_LENGTH
+            assert user_id == str(create_user.id)
+            assert rekey(name, create_user.id) == name
+
+    def test_migrate_keys(self, create_user, settings, tmp_path):
+        """Test that objects are copied and rows swapped to the new keys."""
+        images = [
+            Image.objects.create(user=create_user, image=make_upload())
+            for _ in range(3)
+        ]
+        old_names = [image.image.name for image in images]
+        settings.IMAGE_KEY_STRATEGY = 'hashed'
+
+        call_command(
+            'migrate_image_keys', batch_size=2, workers=2, delete_old=True,
+            checkpoint=str(tmp_path / 'checkpoint.json'), stdout=StringIO()
+        )
+
+        storage = Image._meta.get_field('image').storage
+        for image, old_name in zip(images, old_names):
+            image.refresh_from_db()
+            assert image.image.name == rekey(old_name, create_user.id)
+            assert storage.exists(image.image.name)
+            assert storage.exists(image.thumbnail.name)
+            assert not storage.exists(old_name)
+
+    def test_migrate_keys_replaces_partial_copy(self, create_user, settings,
+                                                tmp_path):
+        """Test that an object left half copied at the new key is recopied."""
+        image = Image.objects.create(user=create_user, image=make_upload())
+        settings.IMAGE_KEY_STRATEGY = 'hashed'
+        storage = Image._meta.get_field('image').storage
+        new_name = rekey(image.image.name, create_user.id)
+        with storage.open(image.image.name) as handle:
+            original = handle.read()
+        storage.save(new_name, ContentFile(original[:100]))
+
+        call_command(
+            'migrate_image_keys', checkpoint=str(tmp_path / 'checkpoint.json'),
+            stdout=StringIO()
+        )
+
+        image.refresh_from_db()
+        assert image.image.name == new_name
+        with storage.open(new_name) as handle:
+            assert handle.read() == original
+
+    def test_migrate_keys_resumes(self, create_user, settings, tmp_path):
+        """Test that a rerun resumes after the checkpoint."""
+        first, second = [
+            Image.objects.create(user=create_user, image=make_upload())
+            for _ in range(2)
+        ]
+        settings.IMAGE_KEY_STRATEGY = 'hashed'
+        checkpoint = tmp_path / 'checkpoint.json'
+        checkpoint.write_text(json.dumps(
+            {'strategy': 'hashed', 'last_id': first.id,
+             'copied': 2, 'swapped': 2}
+        ))
+
+        call_command(
+            'migrate_image_keys', checkpoint=str(checkpoint),
+            stdout=StringIO()
+        )
+
+        first_name = first.image.name
+        first.refresh_from_db()
+        second.refresh_from_db()
+        assert first.image.name == first_name
+        assert second.image.name == rekey(second.image.name, create_user.id)
+        assert second.image.name.count('/') == 3
+        assert json.loads(checkpoint.read_text())['swapped'] == 4
+
+
+@pytest.mark.django_db
+class TestImportImages:
+    """Tests for the bulk import command."""
+
+    @pytest.fixture
+    def library(self, tmp_path):
+        """A directory of two images and one file that is not an image."""
+        root = tmp_path / 'library'
+        (root / 'nested').mkdir(parents=True)
+        (root / 'a.jpg').write_bytes(make_upload('a.jpg').read())
+        (root / 'nested' / 'b.png').write_bytes(
+            make_upload('b.png', fmt='PNG').read()
+        )
+        (root / 'notes.jpg').write_bytes(b'not an image')
+        return root
+
+    def run_import(self, source, user, **options):
+        out = StringIO()
+        call_command(
+            'import_images', str(source), user=user.email,
+            decode_workers=1, batch_size=1, stdout=out, **options
+        )
+        return out.getvalue()
+
+    def test_import_directory(self, create_user, library):
+        """Test that valid images are imported with metadata and usage."""
+        output = self.run_import(library, create_user)
+
+        images = Image.objects.filter(user=create_user).order_by('content_type')
+        assert [(i.content_type, i.width) for i in images] == [
+            ('image/jpeg', 100), ('image/png', 100)
+        ]
+        assert all(image.thumbnail for image in images)
+        assert 'notes.jpg: Not a valid image' in output
+        usage = UserUsage.objects.get(user=create_user)
+        assert usage.image_count == 2
+        assert usage.total_bytes == sum(image.size for image in images)
+
+    @pytest.mark.parametrize('fmt', ['zip', 'gztar'])
+    def test_import_archive(self, create_user, library, tmp_path, fmt):
+        """Test that zip and compressed tar archives are imported."""
+        archive = shutil.make_archive(str(tmp_path / 'library'), fmt, library)
+
+        self.run_import(archive, create_user)
+
+        assert Image.objects.filter(user=create_user).count() == 2
+
+    def test_import_manifest(self, create_user, library):
+        """Test that manifest titles and descriptions are used."""
+        manifest = library / 'manifest.csv'
+        manifest.write_text(
+            'path,title,description\n'
+            'a.jpg,Sunset,From the manifest\n'
+        )
+
+        self.run_import(manifest, create_user)
+
+        image = Image.objects.get(user=create_user)
+        assert (image.title, image.description) == (
+            'Sunset', 'From the manifest'
+        )
+
+    def test_import_resumes(self, create_user, library, tmp_path):
+        """Test that entries in the checkpoint are not imported again."""
+        checkpoint = tmp_path / 'import.checkpoint'
+        checkpoint.write_text('a.jpg\n')
+
+        self.run_import(library, create_user, checkpoint=str(checkpoint))
+
+        image = Image.objects.get(user=create_user)
+        assert image.content_type == 'image/png'
+        assert checkpoint.read_text().split() == [
+            'a.jpg', os.path.join('nested', 'b.png')
+        ]
+
+    @pytest.mark.parametrize('fmt', [None, 'zip', 'gztar'])
+    def test_oversized_entries_not_read(self, create_user, library, tmp_path,
+                                        monkeypatch, fmt):
+        """Test that entries over the size limit are reported unread."""
+        with open(library / 'big.jpg', 'wb') as handle:
+            handle.truncate(MAX_IMAGE_BYTES + 1)
+        source = library
+        if fmt:
+            source = shutil.make_archive(str(tmp_path / 'library'), fmt, library)
+        read = []
+        zip_read = zipfile.ZipFile.read
+        extract = tarfile.TarFile.extractfile
+
+        def spy_read(archive, member):
+            read.append(member.filename)
+            return zip_read(archive, member)
+
+        def spy_extract(archive, member):
+            read.append(member.name)
+            return extract(archive, member)
+
+        monkeypatch.setattr(zipfile.ZipFile, 'read', spy_read)
+        monkeypatch.setattr(tarfile.TarFile, 'extractfile', spy_extract)
+
+        output = self.run_import(source, create_user)
+
+        assert 'big.jpg: Image file too large.' in output
+        assert not [name for name in read if name.endswith('big.jpg')]
+        assert Image.objects.filter(user=create_user).count() == 2
+
+    def test_failed_insert_removes_uploads(self, create_user, library,
+                                           monkeypatch):
+        """Test that objects uploaded for a failed batch are deleted."""
+        uploaded = []
+        upload = BulkImporter.upload
+
+        def recording_upload(importer, entry, info):
+            image = upload(importer, entry, info)
+            uploaded.extend([image.image.name, image.thumbnail.name])
+            return image
+
+        def fail(images):
+            raise DatabaseError("insert failed")
+
+        monkeypatch.setattr(BulkImporter, 'upload', recording_upload)
+        monkeypatch.setattr(Image.objects, 'bulk_create', fail)
+
+        with pytest.raises(DatabaseError):
+            BulkImporter(create_user, decode_workers=1).run(str(library))
+
+        storage = Image._meta.get_field('image').storage
+        assert uploaded
+        assert not [name for name in uploaded if storage.exists(name)]
+        assert not UserUsage.objects.filter(
+            user=create_user, image_count__gt=0
+        ).exists()
+
+
+def make_photo(orientation=1, size=(120, 80)):
+    """Build a JPEG with camera metadata, a comment and an orientation."""
+    exif = PILImage.Exif()
+    exif[0x0112] = orientation
+    exif[0x010F] = 'Camera Maker'
+    exif[0x8298] = 'Copyright Holder'
+    buffer = BytesIO()
+    PILImage.radial_gradient('L').resize(size).convert('RGB').save(
+        buffer, format='JPEG', exif=exif.tobytes(), comment=b'x' * 4096
+    )
+    return buffer.getvalue()
+
+
+@pytest.mark.django_db
+class TestImageOptimization:
+    """Tests for metadata stripping and lossless optimization."""
+
+    @pytest.fixture
+    def optimize(self, settings):
+        settings.IMAGE_OPTIMIZE_ORIGINALS = True
+        settings.IMAGE_KEEP_METADATA = ['Copyright']
+
+    def test_jpeg_metadata_stripped_losslessly(self):
+        """Test that JPEG metadata is dropped without touching pixels."""
+        original = make_photo()
+        data, size = optimize_image(original, keep=['Copyright'])
+
+        assert len(data) < len(original)
+        assert size == (120, 80)
+        with PILImage.open(BytesIO(data)) as stripped, \
+                PILImage.open(BytesIO(original)) as source:
+            assert dict(stripped.getexif()) == {0x8298: 'Copyright Holder'}
+            assert 'comment' not in stripped.info
+            assert stripped.tobytes() == source.tobytes()
+
+    def test_orientation_kept(self):
+        """Test that oriented JPEGs keep their pixels and orientation."""
+        original = make_photo(orientation=6)
+        data, size = optimize_image(original)
+
+        assert size == (120, 80)
+        with PILImage.open(BytesIO(data)) as stripped, \
+                PILImage.open(BytesIO(original)) as source:
+            assert dict(stripped.getexif()) == {0x0112: 6}
+            assert stripped.tobytes() == source.tobytes()
+
+    def test_png_recompressed(self):
+        """Test that PNGs are recompressed without changing pixels."""
+        buffer = BytesIO()
+        source = PILImage.new('RGB', (200, 200), 'blue')
+        source.save(buffer, format='PNG', compress_level=0)
+
+        data, size = optimize_image(buffer.getvalue())
+
+        assert len(data) < len(buffer.getvalue())
+        with PILImage.open(BytesIO(data)) as optimized:
+            assert optimized.tobytes() == source.tobytes()
+
+    def test_larger_result_dropped(self):
+        """Test that nothing is returned unless the file gets smaller."""
+        optimized, size = optimize_image(make_photo(orientation=8))
+
+        assert optimize_image(optimized) is None
+
+    def test_upload_records_sizes(self, authenticated_client, optimize):
+        """Test that uploads store the optimized original."""
+        upload = SimpleUploadedFile(
+            'photo.jpg', make_photo(orientation=6), content_type='image/jpeg'
+        )
+        response = authenticated_client.post(
+            '/api/images/upload/', {'image': upload}, format='multipart'
+        )
+
+        image = Image.objects.get(pk=response.data['id'])
+        assert image.original_size == upload.size
+        assert image.size == image.image.size < upload.size
+        assert (image.width, image.height) == (120, 80)
+        assert UserUsage.objects.get(user=image.user).total_bytes == image.size
+
+    def test_upload_with_junk_between_segments(self, authenticated_client,
+                                               optimize):
+        """Test that stray bytes between JPEG segments are skipped."""
+        photo = make_photo()
+        app0_end = 4 + int.from_bytes(photo[4:6], 'big')
+        data = photo[:app0_end] + b'\x00\x00junk' + photo[app0_end:]
+
+        response = authenticated_client.post(
+            '/api/images/upload/',
+            {'image': SimpleUploadedFile('junk.jpg', data)},
+            format='multipart'
+        )
+
+        assert response.status_code == 201
+        image = Image.objects.get(pk=response.data['id'])
+        assert image.size < len(data)
+
+    def test_truncated_jpeg_rejected(self):
+        """Test that truncated segments raise InvalidImage."""
+        photo = make_photo()
+
+        for length in (20, 200):
+            with pytest.raises(InvalidImage):
+                strip_jpeg(photo[:length], b'', False)
+
+    def test_upload_stored_when_optimization_fails(
+            self, authenticated_client, optimize, monkeypatch):
+        """Test that an optimizer error stores the upload unchanged."""
+        def fail(data, **options):
+            raise InvalidImage("broken")
+
+        monkeypatch.setattr('images.models.optimize_image', fail)
+        upload = SimpleUploadedFile('photo.jpg', make_photo())
+
+        response = authenticated_client.post(
+            '/api/images/upload/', {'image': upload}, format='multipart'
+        )
+
+        assert response.status_code == 201
+        image = Image.objects.get(pk=response.data['id'])
+        assert image.original_size is None
+        assert image.size == upload.size
+
+    def test_optimize_existing_images(self, create_user, settings, optimize):
+        """Test that the command optimizes stored originals in place."""
+        settings.IMAGE_OPTIMIZE_ORIGINALS = False
+        images = [
+            Image.objects.create(user=create_user, image=SimpleUploadedFile(
+                f'photo{orientation}.jpg', make_photo(orientation)
+            ))
+            for orientation in (1, 6)
+        ]
+        old_names = [image.image.name for image in images]
+        settings.IMAGE_OPTIMIZE_ORIGINALS = True
+
+        call_command(
+            'optimize_images', workers=1, batch_size=1, delete_old=True,
+            stdout=StringIO(), stderr=StringIO()
+        )
+
+        storage = images[0].image.storage
+        for image, old_name in zip(images, old_names):
+            original_size = image.size
+            image.refresh_from_db()
+            assert image.original_size == original_size
+            assert image.size == image.image.size < original_size
+            assert not storage.exists(old_name)
+        usage = UserUsage.objects.get(user=create_user)
+        assert usage.total_bytes == sum(image.size for image in images)
+
+    def test_optimize_existing_keeps_previews(self, create_user, settings,
+                                             optimize):
+        """Test that oriented photos keep their previews."""
+        settings.IMAGE_OPTIMIZE_ORIGINALS = False
+        image = Image.objects.create(user=create_user, image=SimpleUploadedFile(
+            'photo.jpg', make_photo(orientation=3)
+        ))
+        old_thumbnail = image.thumbnail.name
+        settings.IMAGE_OPTIMIZE_ORIGINALS = True
+
+        call_command(
+            'optimize_images', workers=1, stdout=StringIO(), stderr=StringIO()
+        )
+
+        image.refresh_from_db()
+        assert (image.width, image.height) == (120, 80)
+        assert image.original_size is not None
+        assert image.thumbnail.name == old_thumbnail
+
+    def test_optimize_existing_keeps_old_objects(self, create_user, settings,
+                                                 optimize):
+        """Test that old objects are only deleted with --delete-old."""
+        settings.IMAGE_OPTIMIZE_ORIGINALS = False
+        image = Image.objects.create(user=create_user, image=SimpleUploadedFile(
+            'photo.jpg', make_photo()
+        ))
+        old_name = image.image.name
+        settings.IMAGE_OPTIMIZE_ORIGINALS = True
+
+        call_command(
+            'optimize_images', workers=1, stdout=StringIO(), stderr=StringIO()
+        )
+
+        image.refresh_from_db()
+        assert image.image.name != old_name
+        assert image.image.storage.exists(old_name)
+
+    def test_optimize_existing_retries_failures(self, create_user, settings,
+                                                optimize):
+        """Test that rows whose optimization failed are not marked done."""
+        settings.IMAGE_OPTIMIZE_ORIGINALS = False
+        image = Image.objects.create(user=create_user, image=SimpleUploadedFile(
+            'photo.jpg', make_photo()
+        ))
+        settings.IMAGE_OPTIMIZE_ORIGINALS = True
+        # Valid for Pillow's header parsing, but its segments are cut short.
+        with image.image.storage.open(image.image.name, 'wb') as handle:
+            handle.write(make_photo()[:200])
+
+        stderr = StringIO()
+        call_command(
+            'optimize_images', workers=1, stdout=StringIO(), stderr=stderr
+        )
+
+        image.refresh_from_db()
+        assert image.original_size is None
+        assert image.image.name in stderr.getvalue()
+
+
+@pytest.mark.django_db
+class TestImagePreviews:
+    """Tests for placeholders and dominant colours."""
+
+    def test_previews_follow_orientation(self, authenticated_client):
+        """Test that thumbnails of oriented photos are upright."""
+        upload = SimpleUploadedFile(
+            'photo.jpg', make_photo(orientation=6, size=(400, 200))
+        )
+
+        response = authenticated_client.post(
+            '/api/images/upload/', {'image': upload}, format='multipart'
+        )
+
+        image = Image.objects.get(pk=response.data['id'])
+        with image.thumbnail.open('rb') as handle, \
+                PILImage.open(handle) as thumbnail:
+            assert thumbnail.size == (100, 200)
+        placeholder = base64.b64decode(image.placeholder.split(',', 1)[1])
+        with PILImage.open(BytesIO(placeholder)) as tiny:
+            assert tiny.width < tiny.height
+
+    def test_upload_computes_previews(self, authenticated_client):
+        """Test that list responses carry a placeholder and colour."""
+        authenticated_client.post(
+            '/api/images/upload/', {'image': make_upload('tile.png', fmt='PNG', color='#3366cc')},
+            format='multipart'
+        )
+
+        response = authenticated_client.get('/api/images/')
+
+        result = response.data[0]
+        assert result['dominant_color'] == '#3366cc'
+        prefix = 'data:image/webp;base64,'
+        assert result['placeholder'].startswith(prefix)
+        placeholder = base64.b64decode(result['placeholder'][len(prefix):])
+        with PILImage.open(BytesIO(placeholder)) as tiny:
+            assert max(tiny.size) == 16
+
+    def test_backfill_previews(self, create_image):
+        """Test that older rows get previews from the command."""
+        Image.objects.filter(pk=create_image.pk).update(
+            placeholder='', dominant_color=''
+        )
+
+        call_command('backfill_previews', workers=1, stdout=StringIO())
+
+        create_image.refresh_from_db()
+        assert create_image.placeholder.startswith('data:image/webp;base64,')
+        assert create_image.dominant_color == '#fe0000'
+
+    def test_backfill_thumbnails(self, create_image):
+        """Test that rows from before thumbnails get one stored."""
+        Image.objects.filter(pk=create_image.pk).update(thumbnail='')
+
+        call_command('backfill_previews', workers=1, stdout=StringIO())
+
+        create_image.refresh_from_db()
+        assert create_image.thumbnail.name.startswith(
+            f'thumbnails/{create_image.user_id}/'
+        )
+        with create_image.thumbnail.open('rb') as handle, \
+                PILImage.open(handle) as thumbnail:
+            assert thumbnail.format == 'JPEG'
+            assert max(thumbnail.size) <= 200
+
+
+def make_scene(seed, size, quality=90):
+    """Build a JPEG upload of a random, smoothly scaled 12x12 scene."""
+    rng = random.Random(seed)
+    scene = PILImage.new('L', (12, 12))
+    scene.putdata([rng.randrange(256) for _ in range(144)])
+    buffer = BytesIO()
+    scene.resize(size, PILImage.Resampling.BICUBIC).convert('RGB').save(
+        buffer, format='JPEG', quality=quality
+    )
+    return SimpleUploadedFile(
+        'scene.jpg', buffer.getvalue(), content_type='image/jpeg'
+    )
+
+
+def hash_rows(ids, hashes):
+    """Build the `(pk, phash, *bands)` rows duplicate_groups reads."""
+    rows = []
+    for pk, value in zip(ids, hashes):
+        fields = phash_fields(value)
+        rows.append((
+            pk, fields['phash'], *(fields[field] for field in PHASH_BAND_FIELDS)
+        ))
+    return rows
+
+
+def pairwise_groups(ids, hashes, max_distance):
+    """Group ids by comparing every pair of hashes, as a reference."""
+    parent = list(range(len(hashes)))
+
+    def root(index):
+        while parent[index] != index:
+            index = parent[index]
+        return index
+
+    for i, j in itertools.combinations(range(len(hashes)), 2):
+        if (hashes[i] ^ hashes[j]).bit_count() <= max_distance:
+            parent[root(j)] = root(i)
+    groups = {}
+    for index in range(len(hashes)):
+        groups.setdefault(root(index), []).append(ids[index])
+    return sorted(
+        (group for group in groups.values() if len(group) > 1),
+        key=lambda group: (-len(group), group[0])
+    )
+
+
+@pytest.mark.django_db
+class TestNearDuplicates:
+    """Tests for perceptual hashes and near-duplicate lookups."""
+
+    @pytest.fixture
+    def library(self, create_user):
+        """An original, a smaller recompressed copy and a different image."""
+        return [
+            Image.objects.create(user=create_user, image=upload)
+            for upload in (
+                make_scene(1, (640, 480)),
+                make_scene(1, (320, 240), quality=40),
+                make_scene(2, (640, 480)),
+            )
+        ]
+
+    def test_image_duplicates(self, authenticated_client, library):
+        """Test that a resized copy is found and a different image is not."""
+        original, copy, other = library
+
+        response = authenticated_client.get(
+            f'/api/images/{original.id}/duplicates/', {'max_distance': 4}
+        )
+
+        assert response.status_code == 200
+        assert [match['id'] for match in response.data] == [copy.id]
+        assert response.data[0]['distance'] <= 4
+
+    def test_image_duplicates_other_user(self, authenticated_client):
+        """Test that other users' images cannot be queried."""
+        other = User.objects.create_user(
+            email='other@example.com', username='other',
+            password='TestPassword123'
+        )
+        image = Image.objects.create(user=other, image=make_upload())
+
+        response = authenticated_client.get(
+            f'/api/images/{image.id}/duplicates/'
+        )
+
+        assert response.status_code == 404
+
+    def test_duplicate_groups(self, authenticated_client, library):
+        """Test that the library endpoint groups the original and copy."""
+        original, copy, other = library
+
+        response = authenticated_client.get('/api/images/duplicates/')
+
+        assert response.status_code == 200
+        assert response.data == {
+            'groups': [[original.id, copy.id]], 'truncated': False
+        }
+
+    def test_duplicate_groups_bounded(self, authenticated_client, library,
+                                      settings):
+        """Test that only the most recent images of a library are grouped."""
+        settings.IMAGE_DUPLICATE_GROUPS_MAX_IMAGES = 2
+
+        response = authenticated_client.get('/api/images/duplicates/')
+
+        assert response.data == {'groups': [], 'truncated': True}
+
+    @pytest.mark.parametrize('max_distance', [0, 3, 6, 10])
+    def test_groups_match_pairwise_comparison(self, create_user,
+                                              max_distance):
+        """Test that band lookups find every pair a full scan would."""
+        rng = random.Random(max_distance)
+        base = [rng.getrandbits(64) for _ in range(20)]
+        hashes = [
+            value ^ sum(1 << bit for bit in rng.sample(range(64), flips))
+            for value in base for flips in (0, 2, 5, 9, 12)
+        ]
+        Image.objects.bulk_create([
+            Image(user=create_user, image=f'images/{index}.jpg',
+                  **phash_fields(value))
+            for index, value in enumerate(hashes)
+        ])
+        ids = list(
+            Image.objects.filter(user=create_user)
+            .order_by('pk').values_list('pk', flat=True)
+        )
+
+        assert duplicate_groups(create_user, max_distance) == (
+            pairwise_groups(ids, hashes, max_distance), False
+        )
+
+    @pytest.mark.parametrize('max_distance', [3, 6, 10])
+    def test_clustered_groups_match_pairwise_comparison(self, max_distance):
+        """
+        Test that the traversal of large buckets, which clusters of
+        similar hashes fill, finds every pair a full scan would.
+        """
+        rng = random.Random(max_distance)
+        hashes = [
+            value ^ sum(
+                1 << bit for bit in rng.sample(range(64), rng.randrange(6))
+            )
+            for value in [rng.getrandbits(64) for _ in range(3)]
+            for _ in range(150)
+        ] + [rng.getrandbits(64) for _ in range(100)]
+        ids = list(range(1, len(hashes) + 1))
+
+        assert group_hashes(hash_rows(ids, hashes), max_distance) == (
+            pairwise_groups(ids, hashes, max_distance)
+        )
+
+    @pytest.mark.parametrize('count, max_distance', [
+        (100000, 6), (20000, MAX_DISTANCE)
+    ])
+    def test_grouping_time_budget(self, count, max_distance):
+        """
+        Test that grouping stays within a time budget for a large library
+        at the default distance, and at the request bound at the largest.
+        """
+        rng = random.Random(count)
+        rows = hash_rows(
+            range(1, count + 1), [rng.getrandbits(64) for _ in range(count)]
+        )
+
+        started = time.perf_counter()
+        group_hashes(rows, max_distance)
+
+        assert time.perf_counter() - started < 10
+
+    def test_candidates_use_band_indexes(self, create_image):
+        """Test that the candidate lookup is served by the band indexes."""
+        if connection.vendor != 'postgresql':
+            pytest.skip('EXPLAIN plans are PostgreSQL specific')
+        seed_library(create_image.user)
+
+        plan = candidates(create_image, MAX_DISTANCE).explain()
+
+        assert all(
+            f'image_user_phash_band_{band}_idx' in plan for band in range(4)
+        )
+        assert 'Seq Scan' not in plan
+
+
+@pytest.mark.django_db
+class TestImageListFastPath:
+    """Tests for the values_list read path and the list renderers."""
+
+    @pytest.fixture
+    def images(self, create_user):
+        Image.objects.create(
+            user=create_user, image=make_upload(),
+            title='Café   "quoted" \U0001F600',
+            description='Line\nbreak\tand \\ backslash'
+        )
+        Image.objects.create(user=create_user, image=make_upload('b.png',
+                                                                 fmt='PNG'))
+        Image.objects.bulk_create([Image(user=create_user, image='')])
+        return Image.objects.filter(user=create_user)
+
+    def test_matches_serializer_bytes(self, authenticated_client, images):
+        """Test that the response is byte-identical to ImageSerializer's."""
+        response = authenticated_client.get(
+            '/api/images/', {'ordering': 'title'}
+        )
+
+        serializer = ImageSerializer(
+            images.order_by('title', 'id'), many=True,
+            context={'request': response.wsgi_request}
+        )
+        assert response.content == JSONRenderer().render(serializer.data)
+
+    def test_query_count_is_constant(self, authenticated_client, create_user):
+        """Test that owners are joined rather than loaded per row."""
+        Image.objects.create(user=create_user, image=make_upload())
+        with CaptureQueriesContext(connection) as one:
+            authenticated_client.get('/api/images/')
+        Image.objects.create(user=create_user, image=make_upload())
+        Image.objects.create(user=create_user, image=make_upload())
+        with CaptureQueriesContext(connection) as three:
+            authenticated_client.get('/api/images/')
+
+        assert len(three) == len(one)
+
+    def test_msgpack(self, authenticated_client, images):
+        """Test that MessagePack carries the same values as JSON."""
+        msgpack = pytest.importorskip('msgpack')
+
+        packed = authenticated_client.get(
+            '/api/images/', HTTP_ACCEPT='application/msgpack'
+        )
+        plain = authenticated_client.get('/api/images/')
+
+        assert packed['Content-Type'] == 'application/msgpack'
+        assert msgpack.unpackb(packed.content) == json.loads(plain.content)
+
+    def test_fast_renderer_matches_json_renderer(self):
+        """Test that orjson output is byte-identical to JSONRenderer's."""
+        data = {
+            'when': datetime.datetime(
+                2026, 1, 2, 3, 4, 5, 678901, tzinfo=datetime.timezone.utc
+            ),
+            'day': datetime.date(2026, 1, 2),
+            'amount': decimal.Decimal('1.50'),
+            'lazy': gettext_lazy('Image'),
+            'text': 'Line separator é \x01',
+            'numbers': (1, 2.5, None, True),
+            'ids': {1, 2},
+            7: 'int key',
+        }
+
+        assert (FastJSONRenderer().render(data)
+                == JSONRenderer().render(data))
+
+
+def read_ndjson(response):
+    content = b''.join(response.streaming_content)
+    return [json.loads(line) for line in content.splitlines()]
+
+
+@pytest.mark.django_db
+class TestImageExport:
+    """Tests for the streaming NDJSON catalogue export."""
+
+    @pytest.fixture
+    def images(self, create_user):
+        images = [
+            Image.objects.create(
+                user=create_user, image=make_upload(), title=f'Image {i}'
+            )
+            for i in range(3)
+        ]
+        Image.objects.create(
+            user=User.objects.create_user(
+                email='other@example.com', username='other', password='pw'
+            ),
+            image=make_upload()
+        )
+        return images
+
+    def test_full_export(self, authenticated_client, images):
+        """Test that every image is streamed in the list format."""
+        response = authenticated_client.get('/api/images/export/')
+
+        assert response.status_code == 200
+        assert response.streaming
+        assert response['Content-Type'] == 'application/x-ndjson'
+        assert 'X-Export-Cursor' in response
+        assert response['X-Export-Full'] == 'true'
+        listed = authenticated_client.get('/api/images/').json()
+        assert sorted(read_ndjson(response), key=lambda item: item['id']) == (
+            sorted(listed, key=lambda item: item['id'])
+        )
+
+    def test_incremental_export(self, authenticated_client, images):
+        """Test that `since` sends changed images, then tombstones."""
+        Image.objects.update(
+            updated_at=timezone.now() - datetime.timedelta(days=1)
+        )
+        cursor = authenticated_client.get(
+            '/api/images/export/'
+        )['X-Export-Cursor']
+        changed, unchanged, deleted = images
+        changed.title = 'Renamed'
+        changed.save()
+        deleted_id = deleted.pk
+        deleted.delete()
+
+        response = authenticated_client.get(
+            '/api/images/export/', {'since': cursor}
+        )
+        lines = read_ndjson(response)
+
+        assert response['X-Export-Full'] == 'false'
+        assert [line['id'] for line in lines] == [changed.pk, deleted_id]
+        assert lines[0]['title'] == 'Renamed'
+        assert lines[1]['deleted'] is True
+        assert 'deleted_at' in lines[1]
+
+    def test_expired_since_sends_full_export(self, authenticated_client,
+                                             images, settings):
+        """
+        Test that a `since` older than the tombstone retention gets a
+        full export instead of an incomplete delta.
+        """
+        settings.IMAGE_TOMBSTONE_RETENTION_DAYS = 7
+        since = timezone.now() - datetime.timedelta(days=8)
+        images[0].delete()
+
+        response = authenticated_client.get(
+            '/api/images/export/', {'since': since.isoformat()}
+        )
+        lines = read_ndjson(response)
+
+        assert response['X-Export-Full'] == 'true'
+        assert sorted(line['id'] for line in lines) == [
+            image.pk for image in images[1:]
+        ]
+
+    def test_prune_tombstones(self, images, settings):
+        """Test that tombstones past the retention are deleted."""
+        settings.IMAGE_TOMBSTONE_RETENTION_DAYS = 7
+        ids = [image.pk for image in images]
+        for image in images:
+            image.delete()
+        ImageTombstone.objects.filter(image_id__in=ids[:2]).update(
+            deleted_at=timezone.now() - datetime.timedelta(days=8)
+        )
+
+        out = StringIO()
+        call_command('prune_tombstones', batch_size=1, stdout=out)
+
+        assert 'Deleted 2 tombstones' in out.getvalue()
+        assert list(
+            ImageTombstone.objects.values_list('image_id', flat=True)
+        ) == ids[2:]
+
+    def test_batches_lines(self, create_user, images):
+        """Test that lines are written in batches of the chunk size."""
+        batches = list(export_lines(create_user, None, chunk_size=2))
+
+        assert [batch.count(b'\n') for batch in batches] == [2, 1]
+
+    def test_invalid_since(self, authenticated_client):
+        """Test that a malformed `since` is rejected."""
+        response = authenticated_client.get(
+            '/api/images/export/', {'since': 'yesterday'},
+            HTTP_ACCEPT='application/x-ndjson'
+        )
+
+        assert response.status_code == 400
+        assert response.content.endswith(b'\n')
+        assert 'since' in json.loads(response.content)
+
+    def test_no_tombstones_for_deleted_owner(self, create_user, images):
+        """Test that deleting an account leaves no tombstones behind."""
+        create_user.delete()
+
+        assert not ImageTombstone.objects.exists()
+
+
+@pytest.mark.django_db
+class TestImageArchive:
+    """Tests for streaming ZIP downloads."""
+
+    @pytest.fixture
+    def images(self, create_user):
+        return [
+            Image.objects.create(
+                user=create_user,
+                image=make_upload(f'photo{i}.png', fmt='PNG', color=color)
+            )
+            for i, color in enumerate(('red', 'green', 'blue', 'white'))
+        ]
+
+    def read_zip(self, content):
+        return zipfile.ZipFile(BytesIO(content))
+
+    def test_download(self, authenticated_client, images):
+        """Test that the archive holds every selected original, stored."""
+        response = authenticated_client.post(
+            '/api/images/archive/', {'ids': [image.pk for image in images]},
+            format='json'
+        )
+
+        assert response.status_code == 200
+        assert response.streaming
+        assert response['Content-Type'] == 'application/zip'
+        assert 'attachment' in response['Content-Disposition']
+        with self.read_zip(b''.join(response.streaming_content)) as zipped:
+            assert zipped.testzip() is None
+            assert zipped.namelist() == [
+                f'{image.pk}_photo{i}.png' for i, image in enumerate(images)
+            ]
+            for image, info in zip(images, zipped.infolist()):
+                assert info.compress_type == zipfile.ZIP_STORED
+                with image.image.open('rb') as handle:
+                    assert zipped.read(info) == handle.read()
+
+    def test_unknown_image(self, authenticated_client, images):
+        """Test that other users' or missing ids are rejected."""
+        other = Image.objects.create(
+            user=User.objects.create_user(
+                email='other@example.com', username='other', password='pw'
+            ),
+            image=make_upload()
+        )
+
+        response = authenticated_client.post(
+            '/api/images/archive/', {'ids': [images[0].pk, other.pk]},
+            format='json'
+        )
+
+        assert response.status_code == 404
+
+    def test_empty_selection(self, authenticated_client):
+        """Test that at least one id is required."""
+        response = authenticated_client.post(
+            '/api/images/archive/', {'ids': []}, format='json'
+        )
+
+        assert response.status_code == 400
+
+    def test_prefetch_is_bounded(self, create_user, images, monkeypatch):
+        """Test that reads stay within the window until the client reads."""
+        reads = []
+
+        def read_object(storage, name):
+            reads.append(name)
+            with storage.open(name, 'rb') as handle:
+                return handle.read()
+
+        monkeypatch.setattr(archive, 'read_object', read_object)
+        stream = archive.zip_images(
+            create_user, [image.pk for image in images], prefetch=2
+        )
+        next(stream)
+
+        assert len(reads) == 2
+        stream.close()
+
+    def test_missing_object(self, create_user, images):
+        """Test that unreadable objects are listed instead of aborting."""
+        lost = images[1]
+        lost.image.storage.delete(lost.image.name)
+
+        content = b''.join(archive.zip_images(
+            create_user, [image.pk for image in images]
+        ))
+
+        with self.read_zip(content) as zipped:
+            assert len(zipped.namelist()) == len(images)
+            assert zipped.namelist()[-1] == 'missing.txt'
+            assert str(lost.pk) in zipped.read('missing.txt').decode()
+
+    def test_zip64(self, create_user, images, monkeypatch):
+        """Test that ZIP64 records are written past the classic limits."""
+        # Lower the limits rather than streaming 4GB through the test.
+        monkeypatch.setattr(zipfile, 'ZIP64_LIMIT', 100)
+        monkeypatch.setattr(zipfile, 'ZIP_FILECOUNT_LIMIT', 2)
+
+        content = b''.join(archive.zip_images(
+            create_user, [image.pk for image in images]
+        ))
+
+        # ZIP64 end of central directory record and locator.
+        assert b'PK\x06\x06' in content
+        assert b'PK\x06\x07' in content
+        with self.read_zip(content) as zipped:
+            assert zipped.testzip() is None
+            assert len(zipped.namelist()) == len(images)
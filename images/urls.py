@@ -4,11 +4,27 @@ from .views import (
     ImageUploadView,
     ImageDetailView,
     ImageDeleteView,
+    ImageExportView,
+    ImageArchiveView,
+    ImageDuplicatesView,
+    ImageDuplicateGroupsView,
 )
 
 urlpatterns = [
     path('', ImageListView.as_view(), name='image-list'),
     path('upload/', ImageUploadView.as_view(), name='image-upload'),
+    path('export/', ImageExportView.as_view(), name='image-export'),
+    path('archive/', ImageArchiveView.as_view(), name='image-archive'),
+    path(
+        'duplicates/',
+        ImageDuplicateGroupsView.as_view(),
+        name='image-duplicate-groups'
+    ),
     path('<int:pk>/', ImageDetailView.as_view(), name='image-detail'),
     path('<int:pk>/delete/', ImageDeleteView.as_view(), name='image-delete'),
+    path(
+        '<int:pk>/duplicates/',
+        ImageDuplicatesView.as_view(),
+        name='image-duplicates'
+    ),
 ]
@@ -1,10 +1,36 @@
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from rest_framework import generics
+from rest_framework.exceptions import NotFound
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser, FormParser
-from drf_spectacular.utils import extend_schema, OpenApiParameter
+from drf_spectacular.utils import (
+    extend_schema,
+    OpenApiParameter,
+    OpenApiResponse,
+)
 from drf_spectacular.types import OpenApiTypes
+from core.metrics import observe_upload
+from core.renderers import MessagePackRenderer, NDJSONRenderer
+from .archive import zip_images
+from .duplicates import duplicate_groups, near_duplicates
+from .export import delta_since, export_cursor, export_lines
+from .listing import list_images
 from .models import Image
-from .serializers import ImageSerializer, ImageUploadSerializer
+from .serializers import (
+    DuplicateGroupsSerializer,
+    DuplicateQuerySerializer,
+    ImageArchiveSerializer,
+    ImageExportQuerySerializer,
+    ImageSerializer,
+    ImageUploadSerializer,
+    ImageListQuerySerializer,
+    NearDuplicateSerializer,
+)
 
 
 @extend_schema(tags=['Images'])
@@ -13,20 +39,36 @@ class ImageListView(generics.ListAPIView):
     List all images uploaded by the authenticated user.
 
     Returns a list of all images belonging to the current user,
-    including image URLs and metadata.
+    including image URLs and metadata. Supports filtering by upload date,
+    content type, size, dimensions and title prefix, and sorting by a
+    whitelisted set of keys. Responds with MessagePack when requested with
+    `Accept: application/msgpack`.
     """
     serializer_class = ImageSerializer
     permission_classes = [IsAuthenticated]
+    renderer_classes = [
+        *api_settings.DEFAULT_RENDERER_CLASSES, MessagePackRenderer
+    ]
 
     @extend_schema(
         summary="List user's images",
-        description="Retrieve all images uploaded by the authenticated user"
+        description="Retrieve all images uploaded by the authenticated user",
+        parameters=[ImageListQuerySerializer]
     )
     def get(self, request, *args, **kwargs):
         return super().get(request, *args, **kwargs)
 
     def get_queryset(self):
-        return Image.objects.filter(user=self.request.user)
+        query = ImageListQuerySerializer(data=self.request.query_params)
+        query.is_valid(raise_exception=True)
+        return query.filter_queryset(
+            Image.objects.filter(user=self.request.user)
+        )
+
+    def list(self, request, *args, **kwargs):
+        # Same output as ImageSerializer(many=True), without per-row
+        # serializer overhead; see images/listing.py.
+        return Response(list_images(self.get_queryset(), request))
 
 
 @extend_schema(tags=['Images'])
@@ -59,7 +101,9 @@ class ImageUploadView(generics.CreateAPIView):
         return super().post(request, *args, **kwargs)
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        image = serializer.save(user=self.request.user)
+        # The incoming file's size, before any optimization shrank it.
+        observe_upload(image.original_size or image.size)
 
 
 @extend_schema(tags=['Images'])
@@ -118,3 +162,159 @@ class ImageDeleteView(generics.DestroyAPIView):
     def get_queryset(self):
         return Image.objects.filter(user=self.request.user)
 
+
+@extend_schema(tags=['Images'])
+class ImageExportView(APIView):
+    """
+    Export the user's whole catalogue as newline-delimited JSON.
+
+    The response is streamed from a server-side cursor, one image per
+    line in the list format. With `since`, only images updated since
+    then are sent, followed by `{"id", "deleted": true, "deleted_at"}`
+    tombstones for images deleted since then. The `X-Export-Cursor`
+    header is the `since` value for the next incremental export.
+    `X-Export-Full: true` marks a complete export, sent without `since`
+    or when `since` is older than the tombstone retention.
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, NDJSONRenderer]
+
+    @extend_schema(
+        summary="Export user's images",
+        description="Stream all images, or changes since a point in time, as NDJSON",
+        parameters=[ImageExportQuerySerializer],
+        responses={
+            (200, 'application/x-ndjson'): OpenApiResponse(
+                response=ImageSerializer,
+                description=(
+                    'One image per line, followed by deletion tombstones '
+                    'when `since` is given. `X-Export-Full: true` marks a '
+                    'complete export, which replaces the client\'s copy'
+                )
+            )
+        }
+    )
+    def get(self, request, *args, **kwargs):
+        query = ImageExportQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        cursor = export_cursor()
+        since = delta_since(query.validated_data.get('since'))
+        response = StreamingHttpResponse(
+            export_lines(request.user, request, since),
+            content_type='application/x-ndjson'
+        )
+        response['X-Export-Cursor'] = query.fields['since'].to_representation(
+            cursor
+        )
+        # Deletions before the tombstone retention are unknown, so an
+        # expired `since` gets everything and the client starts over.
+        response['X-Export-Full'] = 'false' if since else 'true'
+        return response
+
+
+@extend_schema(tags=['Images'])
+class ImageArchiveView(APIView):
+    """
+    Download several images as one ZIP archive.
+
+    The archive is streamed while it is written, with the images stored
+    uncompressed under `{id}_{filename}`; large selections use ZIP64.
+    """
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        summary="Download images as a ZIP archive",
+        description="Stream a ZIP archive of the selected images (owner only)",
+        request=ImageArchiveSerializer,
+        responses={
+            (200, 'application/zip'): OpenApiResponse(
+                response=OpenApiTypes.BINARY,
+                description='ZIP archive of the selected images'
+            )
+        }
+    )
+    def post(self, request, *args, **kwargs):
+        serializer = ImageArchiveSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = set(serializer.validated_data['ids'])
+        owned = Image.objects.filter(user=request.user, pk__in=ids).count()
+        if owned != len(ids):
+            raise NotFound("One or more images were not found.")
+
+        response = StreamingHttpResponse(
+            zip_images(request.user, ids), content_type='application/zip'
+        )
+        response['Content-Disposition'] = 'attachment; filename="images.zip"'
+        return response
+
+
+@extend_schema(tags=['Images'])
+class ImageDuplicatesView(generics.ListAPIView):
+    """
+    List near-duplicates of an image.
+
+    Returns the owner's other images whose perceptual hash is within
+    `max_distance` bits of this image's, closest first. Resized or
+    recompressed copies of the same photo typically differ by a few bits.
+    """
+    serializer_class = NearDuplicateSerializer
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        summary="List near-duplicates of an image",
+        description="Retrieve the user's images that look like the given image",
+        parameters=[
+            OpenApiParameter(
+                name='id',
+                type=OpenApiTypes.INT,
+                location=OpenApiParameter.PATH,
+                description='Image ID'
+            ),
+            DuplicateQuerySerializer,
+        ]
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        query = DuplicateQuerySerializer(data=self.request.query_params)
+        query.is_valid(raise_exception=True)
+        image = get_object_or_404(
+            Image, pk=self.kwargs['pk'], user=self.request.user
+        )
+        matches = []
+        for distance, match in near_duplicates(
+                image, query.validated_data['max_distance']):
+            match.distance = distance
+            matches.append(match)
+        return matches
+
+
+@extend_schema(tags=['Images'])
+class ImageDuplicateGroupsView(APIView):
+    """
+    Find groups of near-duplicates in the user's whole library.
+
+    Images are grouped when their perceptual hashes are within
+    `max_distance` bits, directly or through other images of the group.
+    Only the IMAGE_DUPLICATE_GROUPS_MAX_IMAGES most recent images are
+    grouped; `truncated` tells when older ones were left out.
+    """
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        summary="Group near-duplicate images",
+        description="Retrieve groups of image IDs that look alike, largest first",
+        parameters=[DuplicateQuerySerializer],
+        responses=DuplicateGroupsSerializer
+    )
+    def get(self, request, *args, **kwargs):
+        query = DuplicateQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        groups, truncated = duplicate_groups(
+            request.user, query.validated_data['max_distance'],
+            limit=settings.IMAGE_DUPLICATE_GROUPS_MAX_IMAGES
+        )
+        return Response(DuplicateGroupsSerializer({
+            'groups': groups, 'truncated': truncated
+        }).data)
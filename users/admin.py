@@ -1,6 +1,8 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth import get_user_model
+from .models import AccountPurge
+from .purge import request_purge
 
 User = get_user_model()
 
@@ -11,3 +13,27 @@ class UserAdmin(BaseUserAdmin):
     list_filter = ('is_staff', 'is_active', 'date_joined')
     search_fields = ('email', 'username')
     ordering = ('-date_joined',)
+    actions = ('purge_accounts',)
+
+    @admin.action(description='Deactivate and purge selected accounts')
+    def purge_accounts(self, request, queryset):
+        # Unlike the bulk delete action, this never cascades over the
+        # users' images in one transaction; see users/purge.py.
+        for user in queryset:
+            request_purge(user)
+        self.message_user(
+            request,
+            f"Queued {len(queryset)} accounts for purging by purge_accounts."
+        )
+
+
+@admin.register(AccountPurge)
+class AccountPurgeAdmin(admin.ModelAdmin):
+    list_display = ('email', 'status', 'images_deleted', 'objects_deleted',
+                    'requested_at', 'finished_at')
+    list_filter = ('status',)
+    search_fields = ('email',)
+    readonly_fields = [field.name for field in AccountPurge._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from users.models import AccountPurge
+from users.purge import run_purge
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the images, stored files and user rows of accounts queued "
+        "for deletion. Interrupted or failed purges are resumed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Images deleted per transaction (default: 1000)'
+        )
+
+    def handle(self, *args, chunk_size, **options):
+        purges = AccountPurge.objects.exclude(
+            status=AccountPurge.DONE
+        ).order_by('requested_at')
+
+        failed = 0
+        for purge in purges:
+            try:
+                done = run_purge(purge, chunk_size, report=self.stdout.write)
+            except Exception as exc:
+                failed += 1
+                self.stderr.write(f"{purge.email}: {exc}")
+            else:
+                if done is None:
+                    self.stdout.write(
+                        f"{purge.email}: running elsewhere, skipped."
+                    )
+                    continue
+                self.stdout.write(self.style.SUCCESS(
+                    f"{purge.email}: purged {purge.images_deleted} images."
+                ))
+
+        if failed:
+            raise CommandError(f"{failed} purges failed; rerun to resume.")
@@ -0,0 +1,162 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+from images.management.commands.backfill_metadata import (
+    Command as BackfillMetadata,
+)
+from images.models import Image
+from users.models import UserUsage
+
+User = get_user_model()
+
+# Images whose sizes are read and saved per transaction.
+RECORD_CHUNK_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = "Recompute per-user image usage counters and repair any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of users reconciled per transaction (default: 1000)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report drift without writing any changes'
+        )
+        parser.add_argument(
+            '--io-workers',
+            type=int,
+            default=16,
+            help='Threads reading sizes missing from the database (default: 16)'
+        )
+
+    def handle(self, *args, batch_size, dry_run, io_workers, **options):
+        self.storage = Image._meta.get_field('image').storage
+        checked = repaired = 0
+        last_id = 0
+        with ThreadPoolExecutor(io_workers) as io:
+            while True:
+                user_ids = list(
+                    User.objects.filter(pk__gt=last_id)
+                    .order_by('pk')
+                    .values_list('pk', flat=True)[:batch_size]
+                )
+                if not user_ids:
+                    break
+                last_id = user_ids[-1]
+                checked += len(user_ids)
+                unrecorded = self.record_sizes(user_ids, io, dry_run)
+                repaired += self.reconcile_batch(user_ids, dry_run, unrecorded)
+
+        action = 'Found' if dry_run else 'Repaired'
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {checked} users. {action} {repaired} drifted records."
+        ))
+
+    def record_sizes(self, user_ids, io, dry_run):
+        """
+        Read the sizes of images uploaded before sizes were recorded.
+
+        Without them those images would count as 0 bytes. The images are
+        paged by id in chunks of RECORD_CHUNK_SIZE, and each chunk is saved
+        in its own short transaction by `backfill_metadata`'s apply.
+        Returns the bytes per user read but not saved, which is all of
+        them on a dry run.
+        """
+        unrecorded = defaultdict(int)
+        last_id = 0
+        while True:
+            images = list(
+                Image.objects.filter(
+                    user_id__in=user_ids, size__isnull=True, pk__gt=last_id
+                )
+                .exclude(image='')
+                .order_by('pk')
+                .only('pk', 'user_id', 'image')[:RECORD_CHUNK_SIZE]
+            )
+            if not images:
+                return unrecorded
+            last_id = images[-1].pk
+
+            sizes = {
+                image.pk: {'name': image.image.name, 'size': size}
+                for image, size in zip(images, io.map(self.read_size, images))
+                if size is not None
+            }
+            if dry_run:
+                for image in images:
+                    if image.pk in sizes:
+                        unrecorded[image.user_id] += sizes[image.pk]['size']
+            elif sizes:
+                BackfillMetadata.apply(sizes)
+
+    def read_size(self, image):
+        name = image.image.name
+        try:
+            return self.storage.size(name)
+        except Exception as exc:
+            self.stderr.write(f"{name}: {exc}")
+            return None
+
+    def reconcile_batch(self, user_ids, dry_run, unrecorded):
+        """
+        Reconcile one batch of users in a short transaction.
+
+        Usage rows are locked before the images are aggregated, so a
+        concurrent upload's counter update waits for this batch instead of
+        being overwritten by it. `unrecorded` holds bytes per user that are
+        not in the images' size column.
+        """
+        with transaction.atomic():
+            if not dry_run:
+                UserUsage.objects.bulk_create(
+                    [UserUsage(user_id=user_id) for user_id in user_ids],
+                    ignore_conflicts=True
+                )
+            usages = {
+                usage.user_id: usage
+                for usage in UserUsage.objects.select_for_update()
+                .filter(user_id__in=user_ids)
+                .order_by('user_id')
+            }
+            totals = {
+                row['user_id']: row
+                for row in Image.objects.filter(user_id__in=user_ids)
+                .values('user_id')
+                .annotate(
+                    image_count=Count('id'),
+                    total_bytes=Coalesce(Sum('size'), 0)
+                )
+                .order_by()
+            }
+
+            drifted = []
+            for user_id in user_ids:
+                usage = usages.get(user_id) or UserUsage(user_id=user_id)
+                row = totals.get(user_id, {'image_count': 0, 'total_bytes': 0})
+                row['total_bytes'] += unrecorded.get(user_id, 0)
+                if (usage.image_count, usage.total_bytes) != (
+                        row['image_count'], row['total_bytes']):
+                    self.stdout.write(
+                        f"User {user_id}: {usage.image_count} images/"
+                        f"{usage.total_bytes} bytes -> {row['image_count']} "
+                        f"images/{row['total_bytes']} bytes"
+                    )
+                    usage.image_count = row['image_count']
+                    usage.total_bytes = row['total_bytes']
+                    drifted.append(usage)
+
+            if drifted and not dry_run:
+                UserUsage.objects.bulk_update(
+                    drifted, ['image_count', 'total_bytes']
+                )
+        return len(drifted)
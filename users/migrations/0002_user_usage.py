@@ -0,0 +1,43 @@
+# Generated by Django 5.2.8 on 2026-10-19 12:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_usage(apps, schema_editor):
+    Image = apps.get_model('images', 'Image')
+    UserUsage = apps.get_model('users', 'UserUsage')
+    # Images with no recorded size count as 0 bytes here; backfill_metadata
+    # and reconcile_usage add their sizes from storage.
+    totals = (
+        Image.objects.values('user_id')
+        .annotate(image_count=Count('id'), total_bytes=Coalesce(Sum('size'), 0))
+        .order_by()
+    )
+    UserUsage.objects.bulk_create(
+        (UserUsage(**row) for row in totals.iterator()),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('images', '0004_image_thumbnail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserUsage',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='usage', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('image_count', models.PositiveIntegerField(default=0)),
+                ('total_bytes', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_usage, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-19 12:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_usage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountPurge',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(db_index=True, max_length=254)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('failed', 'Failed'), ('done', 'Done')], db_index=True, default='pending', max_length=10)),
+                ('images_deleted', models.PositiveBigIntegerField(default=0)),
+                ('objects_deleted', models.PositiveBigIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('requested_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='purge', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -1,5 +1,12 @@
 from django.contrib.auth.models import AbstractUser
+from django.conf import settings
 from django.db import models
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+
+
+class QuotaExceeded(Exception):
+    """Raised when adding an image would take a user over a quota."""
 
 
 class User(AbstractUser):
@@ -15,3 +22,145 @@ class User(AbstractUser):
     def __str__(self):
         return self.email
 
+
+class UserUsageManager(models.Manager):
+    def adjust(self, user_id, images, size, create=True):
+        """
+        Atomically add `images` and `size` bytes to a user's usage record.
+
+        The record is created on first use when `create` is set. Deletes
+        pass create=False so a usage row is never recreated for a user
+        that is being removed. Totals are clamped at zero so drift can
+        never make a delete fail; `reconcile_usage` repairs it.
+        """
+        updated = self.filter(user_id=user_id).update(
+            image_count=Greatest(F('image_count') + images, 0),
+            total_bytes=Greatest(F('total_bytes') + size, 0)
+        )
+        if not updated and create:
+            usage, created = self.get_or_create(
+                user_id=user_id,
+                defaults={'image_count': images, 'total_bytes': size}
+            )
+            if not created:
+                self.adjust(user_id, images, size, create=False)
+
+    def check_quota(self, usage, size):
+        """
+        Raise QuotaExceeded if one more image of `size` bytes would take
+        `usage` over IMAGE_QUOTA_MAX_COUNT or IMAGE_QUOTA_MAX_BYTES.
+        """
+        max_count = settings.IMAGE_QUOTA_MAX_COUNT
+        max_bytes = settings.IMAGE_QUOTA_MAX_BYTES
+        if max_count is not None and usage.image_count + 1 > max_count:
+            raise QuotaExceeded(
+                f"Image quota exceeded. You can store at most {max_count} images."
+            )
+        if max_bytes is not None and usage.total_bytes + size > max_bytes:
+            raise QuotaExceeded(
+                f"Storage quota exceeded. You can store at most {max_bytes} bytes."
+            )
+
+    def reserve(self, user_id, size):
+        """
+        Atomically add one image of `size` bytes to a user's usage record,
+        raising QuotaExceeded if that would exceed a quota.
+
+        The limits are part of the UPDATE's WHERE clause, so concurrent
+        uploads cannot both pass a check made against the same totals.
+        Call it in the transaction that inserts the image, so a rejected
+        reservation rolls the insert back.
+        """
+        max_count = settings.IMAGE_QUOTA_MAX_COUNT
+        max_bytes = settings.IMAGE_QUOTA_MAX_BYTES
+        within = Q()
+        if max_count is not None:
+            within &= Q(image_count__lt=max_count)
+        if max_bytes is not None:
+            within &= Q(total_bytes__lte=max_bytes - size)
+
+        updated = self.filter(within, user_id=user_id).update(
+            image_count=F('image_count') + 1,
+            total_bytes=F('total_bytes') + size
+        )
+        if updated:
+            return
+        usage = self.filter(user_id=user_id).first()
+        if usage is None:
+            self.check_quota(self.model(user_id=user_id), size)
+            usage, created = self.get_or_create(
+                user_id=user_id,
+                defaults={'image_count': 1, 'total_bytes': size}
+            )
+            if created:
+                return
+        self.check_quota(usage, size)
+        # Another request changed the totals in between; try again.
+        self.reserve(user_id, size)
+
+
+class UserUsage(models.Model):
+    """
+    Denormalized per-user image count and storage total.
+
+    Maintained incrementally on image create/delete so that quota checks
+    never need to aggregate over the user's images.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='usage'
+    )
+    image_count = models.PositiveIntegerField(default=0)
+    total_bytes = models.PositiveBigIntegerField(default=0)
+
+    objects = UserUsageManager()
+
+    def __str__(self):
+        return f"{self.user_id}: {self.image_count} images, {self.total_bytes} bytes"
+
+
+class AccountPurge(models.Model):
+    """
+    Progress of an account deletion.
+
+    The user is deactivated as soon as the purge is requested; their
+    images and stored files are then removed in chunks by the
+    `purge_accounts` command, and the user row is deleted last. The
+    record is kept afterwards, keyed by email, for auditing.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    DONE = 'done'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (FAILED, 'Failed'),
+        (DONE, 'Done'),
+    ]
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='purge'
+    )
+    email = models.EmailField(db_index=True)
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+        db_index=True
+    )
+    images_deleted = models.PositiveBigIntegerField(default=0)
+    objects_deleted = models.PositiveBigIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    requested_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.email}: {self.status}"
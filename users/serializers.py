@@ -1,5 +1,7 @@
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from .models import AccountPurge, UserUsage
 
 User = get_user_model()
 
@@ -52,3 +54,47 @@ class UserSerializer(serializers.ModelSerializer):
         model = User
         fields = ('id', 'email', 'username', 'date_joined')
         read_only_fields = ('id', 'date_joined')
+
+
+class UserUsageSerializer(serializers.ModelSerializer):
+    """
+    Serializer for a user's image usage and quota limits.
+    """
+    max_images = serializers.SerializerMethodField()
+    max_bytes = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UserUsage
+        fields = ('image_count', 'total_bytes', 'max_images', 'max_bytes')
+        read_only_fields = fields
+
+    def get_max_images(self, obj) -> int | None:
+        return settings.IMAGE_QUOTA_MAX_COUNT
+
+    def get_max_bytes(self, obj) -> int | None:
+        return settings.IMAGE_QUOTA_MAX_BYTES
+
+
+class UserProfileSerializer(UserSerializer):
+    """
+    Serializer for the authenticated user's profile, including usage.
+    """
+    usage = serializers.SerializerMethodField()
+
+    class Meta(UserSerializer.Meta):
+        fields = UserSerializer.Meta.fields + ('usage',)
+
+    def get_usage(self, obj) -> dict:
+        usage = UserUsage.objects.filter(user=obj).first() or UserUsage(user=obj)
+        return UserUsageSerializer(usage).data
+
+
+class AccountPurgeSerializer(serializers.ModelSerializer):
+    """
+    Serializer for the progress of an account deletion.
+    """
+    class Meta:
+        model = AccountPurge
+        fields = ('status', 'images_deleted', 'objects_deleted',
+                  'requested_at', 'finished_at')
+        read_only_fields = fields
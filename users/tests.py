@@ -1,5 +1,16 @@
+import datetime
 import pytest
+from io import StringIO
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete
+from django.utils import timezone
+from images.models import Image
+from . import purge
+from .management.commands import reconcile_usage
+from .models import AccountPurge, UserUsage
 
 User = get_user_model()
 
@@ -68,3 +79,263 @@ class TestUserAuthentication:
         })
 
         assert response.status_code == 400
+
+
+@pytest.mark.django_db
+class TestUserProfile:
+    """Tests for the profile endpoint."""
+
+    def test_profile_includes_usage(self, authenticated_client, create_image,
+                                    settings):
+        """Test that the profile exposes image usage and quotas."""
+        settings.IMAGE_QUOTA_MAX_COUNT = 100
+        response = authenticated_client.get('/api/auth/profile/')
+
+        assert response.status_code == 200
+        assert response.data['email'] == create_image.user.email
+        assert response.data['usage'] == {
+            'image_count': 1,
+            'total_bytes': create_image.size,
+            'max_images': 100,
+            'max_bytes': None,
+        }
+
+    def test_profile_unauthenticated(self, api_client):
+        """Test the profile endpoint without authentication."""
+        response = api_client.get('/api/auth/profile/')
+
+        assert response.status_code == 401
+
+
+@pytest.mark.django_db
+class TestReconcileUsage:
+    """Tests for the reconcile_usage management command."""
+
+    def test_repairs_drift(self, create_image):
+        """Test that drifted counters are recomputed from images."""
+        user = create_image.user
+        UserUsage.objects.filter(user=user).update(image_count=7, total_bytes=1)
+        other = User.objects.create_user(
+            email='other@example.com', username='other',
+            password='TestPassword123'
+        )
+
+        out = StringIO()
+        call_command('reconcile_usage', batch_size=1, stdout=out)
+
+        assert 'Repaired 1 drifted records' in out.getvalue()
+        usage = UserUsage.objects.get(user=user)
+        assert (usage.image_count, usage.total_bytes) == (1, create_image.size)
+        assert UserUsage.objects.get(user=other).image_count == 0
+
+    def test_dry_run_does_not_write(self, create_image):
+        """Test that --dry-run only reports drift."""
+        UserUsage.objects.filter(user=create_image.user).update(image_count=7)
+
+        call_command('reconcile_usage', dry_run=True, stdout=StringIO())
+
+        assert UserUsage.objects.get(user=create_image.user).image_count == 7
+
+    def test_counts_unrecorded_sizes(self, create_image):
+        """Test that sizes missing from the database are read from storage."""
+        Image.objects.filter(pk=create_image.pk).update(size=None)
+        UserUsage.objects.filter(user=create_image.user).update(total_bytes=0)
+
+        out = StringIO()
+        call_command('reconcile_usage', dry_run=True, stdout=out)
+        assert f"-> 1 images/{create_image.size} bytes" in out.getvalue()
+        assert Image.objects.get(pk=create_image.pk).size is None
+
+        call_command('reconcile_usage', stdout=StringIO())
+        assert Image.objects.get(pk=create_image.pk).size == create_image.size
+        usage = UserUsage.objects.get(user=create_image.user)
+        assert usage.total_bytes == create_image.size
+
+    def test_records_sizes_in_chunks(self, create_image, sample_image,
+                                     monkeypatch):
+        """Test that missing sizes are saved one chunk per transaction."""
+        sample_image.seek(0)
+        Image.objects.create(user=create_image.user, image=sample_image)
+        Image.objects.filter(user=create_image.user).update(size=None)
+        UserUsage.objects.filter(user=create_image.user).update(total_bytes=0)
+        chunks = []
+        apply = reconcile_usage.BackfillMetadata.apply
+
+        def recording_apply(metadata):
+            chunks.append(sorted(metadata))
+            return apply(metadata)
+
+        monkeypatch.setattr(reconcile_usage, 'RECORD_CHUNK_SIZE', 1)
+        monkeypatch.setattr(
+            reconcile_usage.BackfillMetadata, 'apply', recording_apply
+        )
+
+        call_command('reconcile_usage', stdout=StringIO())
+
+        images = Image.objects.filter(user=create_image.user).order_by('pk')
+        assert chunks == [[image.pk] for image in images]
+        usage = UserUsage.objects.get(user=create_image.user)
+        assert usage.total_bytes == sum(image.size for image in images) > 0
+
+
+@pytest.mark.django_db
+class TestAccountPurge:
+    """Tests for account deletion and the purge_accounts command."""
+
+    @pytest.fixture
+    def images(self, create_image, sample_image):
+        sample_image.seek(0)
+        extra = Image.objects.create(user=create_image.user, image=sample_image)
+        return [create_image, extra]
+
+    def test_delete_profile_blocks_account(self, authenticated_client,
+                                           api_client, user_data, images):
+        """Test that deleting the account deactivates it at once."""
+        response = authenticated_client.delete('/api/auth/profile/')
+
+        assert response.status_code == 202
+        assert response.data['status'] == AccountPurge.PENDING
+        assert Image.objects.count() == 2
+        assert authenticated_client.get('/api/auth/profile/').status_code == 401
+
+        api_client.credentials()
+        login = api_client.post('/api/auth/login/', {
+            'email': user_data['email'], 'password': user_data['password']
+        })
+        signup = api_client.post('/api/auth/signup/', user_data)
+        assert login.status_code == 401
+        assert signup.status_code == 400
+
+    def test_purge_deletes_in_chunks(self, api_client, user_data, images):
+        """Test that images, files and the user are removed."""
+        user = images[0].user
+        storage = images[0].image.storage
+        names = [n for i in images for n in (i.image.name, i.thumbnail.name)]
+        purge.request_purge(user)
+
+        out = StringIO()
+        call_command('purge_accounts', chunk_size=1, stdout=out)
+
+        record = AccountPurge.objects.get(email=user.email)
+        assert record.status == AccountPurge.DONE
+        assert (record.images_deleted, record.objects_deleted) == (2, 4)
+        assert record.user is None
+        assert not User.objects.filter(pk=user.pk).exists()
+        assert not Image.objects.exists()
+        assert not any(storage.exists(name) for name in names)
+        assert '1 images, 2 objects deleted' in out.getvalue()
+
+        signup = api_client.post('/api/auth/signup/', user_data)
+        assert signup.status_code == 201
+
+    def test_purge_resumes_after_failure(self, images, monkeypatch):
+        """Test that a failed purge is recorded and resumed on rerun."""
+        user = images[0].user
+        purge.request_purge(user)
+        delete_objects = purge.delete_objects
+        calls = []
+
+        def flaky_delete_objects(storage, names):
+            calls.append(names)
+            if len(calls) == 2:
+                raise OSError('storage unavailable')
+            delete_objects(storage, names)
+
+        monkeypatch.setattr(purge, 'delete_objects', flaky_delete_objects)
+        with pytest.raises(CommandError):
+            call_command(
+                'purge_accounts', chunk_size=1,
+                stdout=StringIO(), stderr=StringIO()
+            )
+
+        record = AccountPurge.objects.get(email=user.email)
+        assert record.status == AccountPurge.FAILED
+        assert record.images_deleted == 1
+        assert 'storage unavailable' in record.last_error
+        assert UserUsage.objects.get(user=user).image_count == 1
+
+        call_command('purge_accounts', stdout=StringIO())
+
+        record.refresh_from_db()
+        assert record.status == AccountPurge.DONE
+        assert record.images_deleted == 2
+        assert not User.objects.filter(pk=user.pk).exists()
+
+    def test_running_purge_not_claimed_twice(self, images, settings):
+        """Test that a purge another runner is working on is skipped."""
+        user = images[0].user
+        record = purge.request_purge(user)
+        AccountPurge.objects.filter(pk=record.pk).update(
+            status=AccountPurge.RUNNING, updated_at=timezone.now()
+        )
+
+        out = StringIO()
+        call_command('purge_accounts', stdout=out)
+
+        assert 'running elsewhere, skipped' in out.getvalue()
+        assert Image.objects.count() == 2
+
+        # A runner that stopped recording progress is taken over.
+        AccountPurge.objects.filter(pk=record.pk).update(
+            updated_at=timezone.now() - datetime.timedelta(
+                seconds=settings.ACCOUNT_PURGE_STALE_SECONDS + 1
+            )
+        )
+        call_command('purge_accounts', stdout=StringIO())
+
+        record.refresh_from_db()
+        assert record.status == AccountPurge.DONE
+        assert record.images_deleted == 2
+
+    def test_counts_only_deleted_rows(self, images, monkeypatch):
+        """Test that rows deleted by someone else are not counted again."""
+        user = images[0].user
+        purge.request_purge(user)
+        delete_objects = purge.delete_objects
+
+        def racing_delete_objects(storage, names):
+            # Another runner deletes the first chunk's row meanwhile.
+            if names[0] == images[0].image.name:
+                Image.objects.filter(pk=images[0].pk).delete()
+            delete_objects(storage, names)
+
+        adjustments = []
+        adjust = UserUsage.objects.adjust
+
+        def recording_adjust(user_id, images, size, **kwargs):
+            adjustments.append(images)
+            adjust(user_id, images, size, **kwargs)
+
+        monkeypatch.setattr(purge, 'delete_objects', racing_delete_objects)
+        monkeypatch.setattr(UserUsage.objects, 'adjust', recording_adjust)
+
+        call_command('purge_accounts', chunk_size=1, stdout=StringIO())
+
+        record = AccountPurge.objects.get(email=user.email)
+        assert record.images_deleted == 1
+        # The other delete's signal, then one adjustment per chunk for
+        # the rows the purge itself deleted.
+        assert adjustments == [-1, 0, -1]
+
+    def test_raw_delete_assumptions(self, images):
+        """
+        Test what run_purge's raw delete relies on: the private QuerySet
+        method exists, no model references Image, and no per-row signals
+        are sent.
+        """
+        assert callable(getattr(QuerySet, '_raw_delete', None))
+        assert not Image._meta.related_objects
+
+        deleted = []
+
+        def on_delete(sender, instance, **kwargs):
+            deleted.append(instance.pk)
+
+        post_delete.connect(on_delete, sender=Image)
+        try:
+            purge.run_purge(purge.request_purge(images[0].user), chunk_size=1)
+        finally:
+            post_delete.disconnect(on_delete, sender=Image)
+
+        assert deleted == []
+        assert not Image.objects.exists()
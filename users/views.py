@@ -1,10 +1,16 @@
 from rest_framework import generics, status
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import get_user_model
 from drf_spectacular.utils import extend_schema, OpenApiExample
-from .serializers import UserRegistrationSerializer, UserSerializer
+from .purge import request_purge
+from .serializers import (
+    AccountPurgeSerializer,
+    UserRegistrationSerializer,
+    UserSerializer,
+    UserProfileSerializer,
+)
 
 User = get_user_model()
 
@@ -57,3 +63,38 @@ class SignUpView(generics.CreateAPIView):
             }
         }, status=status.HTTP_201_CREATED)
 
+
+class ProfileView(generics.RetrieveDestroyAPIView):
+    """
+    Retrieve or delete the authenticated user's profile.
+
+    Includes the user's current image count, stored bytes and quota limits.
+    Deleting deactivates the account immediately; its images are removed
+    in the background by `purge_accounts`.
+    """
+    serializer_class = UserProfileSerializer
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        summary="User Profile",
+        description="Retrieve the authenticated user's profile and storage usage",
+        tags=['Authentication']
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    @extend_schema(
+        summary="Delete Account",
+        description="Deactivate the account and queue its images for deletion",
+        responses={202: AccountPurgeSerializer},
+        tags=['Authentication']
+    )
+    def delete(self, request, *args, **kwargs):
+        purge = request_purge(request.user)
+        return Response(
+            AccountPurgeSerializer(purge).data,
+            status=status.HTTP_202_ACCEPTED
+        )
+
+    def get_object(self):
+        return self.request.user